@@ -9,16 +9,47 @@ from tkinter import filedialog, messagebox, ttk
 from pathlib import Path
 import pandas as pd
 import threading
+import multiprocessing
 import sys
 import re
 import os
 import json
-from datetime import datetime
-from openpyxl import Workbook
+import sqlite3
+import argparse
+import mmap
+import zipfile
+import posixpath
+import itertools
+import hashlib
+import io
+import queue
+import tempfile
+import contextlib
+import cProfile
+import pstats
+import pickle
+import random
+import uuid
+import shutil
+from decimal import Decimal
+from collections import deque, OrderedDict
+from xml.sax.saxutils import escape as xml_escape
+import xml.etree.ElementTree as ET
+from datetime import datetime, date, timedelta, time as dt_time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils import get_column_letter, range_boundaries
+from openpyxl.utils.datetime import to_excel
 from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles.differential import DifferentialStyle
 import time
 import urllib.request
 import urllib.error
+import hmac
+import ipaddress
+import socket
 
 try:
     from tkinterdnd2 import DND_FILES, TkinterDnD
@@ -26,64 +57,4458 @@ try:
 except ImportError:
     HAS_DND = False
 
+try:
+    from python_calamine import CalamineWorkbook, CalamineError
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
 ctk.set_appearance_mode("light")
 ctk.set_default_color_theme("blue")
 
-CURRENCY_SYMBOLS = {
-    'EUR': '€', 'USD': '$', 'TRY': '₺',
-}
+CURRENCY_SYMBOLS = {
+    'EUR': '€', 'USD': '$', 'TRY': '₺',
+}
+
+
+def _get_script_dir():
+    if getattr(sys, 'frozen', False):
+        return Path(sys.executable).parent
+    return Path(__file__).parent
+
+
+SETTINGS_FILE = _get_script_dir() / '.order_merger_settings.json'
+HISTORY_DB_FILE = _get_script_dir() / '.order_merger_history.db'
+LAYOUTS_FILE = _get_script_dir() / '.order_merger_layouts.json'
+
+
+COST_CURRENCY_MAP = {
+    'TL': 'TRY', 'TRY': 'TRY', '₺': 'TRY',
+    'USD': 'USD', '$': 'USD',
+    'EUR': 'EUR', '€': 'EUR',
+}
+
+
+def _parse_cost(value):
+    """COST string'ini (tutar, para_birimi) olarak çevir: '21500.00 TL' -> (21500.0, 'TRY')"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return 0.0, ''
+    s = str(value).strip()
+    if not s:
+        return 0.0, ''
+
+    # Para birimini tespit et
+    currency = ''
+    text_part = re.sub(r'[\d.,\-\s]', '', s).strip()
+    if text_part:
+        currency = COST_CURRENCY_MAP.get(text_part.upper(), text_part.upper())
+
+    # Sayısal karakterleri, nokta ve virgülü al
+    num_str = re.sub(r'[^\d.,\-]', '', s)
+    if not num_str:
+        return 0.0, currency
+    # Türk formatı: 21.500,00 -> 21500.00
+    if ',' in num_str and '.' in num_str:
+        if num_str.rindex(',') > num_str.rindex('.'):
+            num_str = num_str.replace('.', '').replace(',', '.')
+        else:
+            num_str = num_str.replace(',', '')
+    elif ',' in num_str:
+        parts = num_str.split(',')
+        if len(parts[-1]) == 3 and len(parts) > 1:
+            num_str = num_str.replace(',', '')
+        else:
+            num_str = num_str.replace(',', '.')
+    try:
+        return float(num_str), currency
+    except ValueError:
+        return 0.0, currency
+
+
+def _to_float(value):
+    """Hücre değerini float'a çevir, boş/geçersiz ise 0.0"""
+    if value is None or (isinstance(value, float) and pd.isna(value)):
+        return 0.0
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return _parse_cost(value)[0]
+
+
+def _convert_cost(amount, cost_currency, sale_currency, fx_rates):
+    """Cost'u satış para birimine çevir. Tüm kurlar TL cinsindendir."""
+    if not cost_currency or cost_currency == sale_currency:
+        return amount
+    cost_in_tl = amount * fx_rates.get(cost_currency, 1.0)
+    sale_rate = fx_rates.get(sale_currency, 1.0)
+    if sale_rate == 0:
+        return amount
+    return cost_in_tl / sale_rate
+
+
+def _fx_factor(cost_currency, sale_currency, fx_rates):
+    """1 birim cost para biriminin satış para birimindeki karşılığı"""
+    return _convert_cost(1.0, cost_currency, sale_currency, fx_rates)
+
+
+def _missing_rates(currencies, fx_rates):
+    """Kuru girilmemiş (çeviride sessizce 1.0 sayılacak) para birimleri."""
+    return sorted({c for c in currencies if c and c not in fx_rates})
+
+
+def _order_rate_currencies(order_data):
+    """Siparişin maliyet çevirisinde kuru gereken para birimleri."""
+    sale_currency = order_data['header_info'].get('currency', '').upper()
+    needed = set()
+    for data_row in order_data['data_rows']:
+        cost_currency = _parse_cost(data_row[9] if len(data_row) > 9 else None)[1]
+        if cost_currency and cost_currency != sale_currency:
+            needed.update((cost_currency, sale_currency))
+    return needed
+
+
+# ── İptal ────────────────────────────────────────────────────
+
+CANCEL_CHECK_ROWS = 2000
+
+
+class MergeCancelled(Exception):
+    """Kullanıcı birleştirmeyi / taramayı iptal etti."""
+
+
+class CancelToken:
+    """Thread'ler arası iptal bayrağı; uzun döngüler check() ile kontrol noktası koyar."""
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        self._event.set()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def check(self):
+        if self._event.is_set():
+            raise MergeCancelled("İşlem iptal edildi")
+
+
+# ── Akışlı XLSX Okuyucu ─────────────────────────────────────
+
+READ_MAX_COLS = 12
+_XLSX_NS = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_REL_NS = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_PKG_REL_NS = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+_BUILTIN_DATE_FMTS = set(range(14, 23)) | {45, 46, 47}
+_BUILTIN_ELAPSED_FMTS = {46}   # [h]:mm:ss
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+
+def _col_index(ref):
+    """'AB12' -> 27 (0-indexed sütun)"""
+    idx = 0
+    for ch in ref:
+        if 'A' <= ch <= 'Z':
+            idx = idx * 26 + (ord(ch) - 64)
+        else:
+            break
+    return idx - 1
+
+
+def _is_date_format(fmt):
+    fmt = re.sub(r'"[^"]*"|\\.|\[[^\]]*\]', '', fmt).lower()
+    return any(ch in fmt for ch in 'dmyhs') and 'general' not in fmt
+
+
+def _is_elapsed_format(fmt):
+    """Geçen süre biçimi mi? ([h]:mm, [mm]:ss ...) — değer timedelta olarak okunur."""
+    return re.search(r'\[(h+|m+|s+)\]', re.sub(r'"[^"]*"', '', fmt).lower()) is not None
+
+
+def _excel_date_value(num, elapsed=False):
+    """Tarih biçimli Excel seri numarasını openpyxl/pandas/calamine ile aynı tipe çevir.
+
+    Geçen süre biçiminde timedelta, 1'den küçük değerde (yalnızca saat) time, diğerlerinde
+    datetime döner.
+    """
+    if elapsed:
+        return timedelta(days=num)
+    day, fraction = divmod(num, 1)
+    diff = timedelta(milliseconds=round(fraction * 86400000))
+    if 0 <= num < 1 and diff.days == 0:
+        return (datetime.min + diff).time()
+    return _EXCEL_EPOCH + timedelta(days=day) + diff
+
+
+class _MmapFile:
+    """zipfile'ın beklediği dosya arayüzünü mmap üzerinde sağlar (kopyasız okuma)."""
+
+    def __init__(self, mm):
+        self._mm = mm
+
+    def read(self, n=-1):
+        if n is None or n < 0:
+            return self._mm.read()
+        return self._mm.read(n)
+
+    def seek(self, pos, whence=0):
+        self._mm.seek(pos, whence)
+        return self._mm.tell()
+
+    def tell(self):
+        return self._mm.tell()
+
+    def seekable(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class XlsxStreamReader:
+    """xlsx dosyasını mmap ile açıp çalışma sayfası XML'ini akış halinde okur.
+
+    Sayfa XML'i hiçbir zaman bütünüyle belleğe alınmaz; satırlar iterparse ile
+    tek tek üretilir ve yalnızca ilk ``max_cols`` sütun tutulur.
+    """
+
+    def __init__(self, file_path, max_cols=READ_MAX_COLS):
+        # Yol veya (zip üyesi için) bellekteki bayt akışı
+        self.file_path = file_path if hasattr(file_path, 'read') else Path(file_path)
+        self.max_cols = max_cols
+        self._fh = None
+        self._mm = None
+        self._zip = None
+        self._shared = None
+        self._date_styles = None
+
+    def __enter__(self):
+        if hasattr(self.file_path, 'read'):
+            self._zip = zipfile.ZipFile(self.file_path)
+            return self
+        self._fh = open(self.file_path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+            self._zip = zipfile.ZipFile(_MmapFile(self._mm))
+        except Exception:
+            self.close()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _resolve(self, base_dir, target):
+        if target.startswith('/'):
+            return target.lstrip('/')
+        return posixpath.normpath(posixpath.join(base_dir, target))
+
+    def sheet_paths(self):
+        """Çalışma kitabındaki sayfaların (isim, zip yolu) listesi, sırasıyla."""
+        names = set(self._zip.namelist())
+        rels = {}
+        if 'xl/_rels/workbook.xml.rels' in names:
+            root = ET.fromstring(self._zip.read('xl/_rels/workbook.xml.rels'))
+            for rel in root.iter(f'{_PKG_REL_NS}Relationship'):
+                rels[rel.get('Id')] = self._resolve('xl', rel.get('Target', ''))
+        sheets = []
+        root = ET.fromstring(self._zip.read('xl/workbook.xml'))
+        for sheet in root.iter(f'{_XLSX_NS}sheet'):
+            path = rels.get(sheet.get(f'{_REL_NS}id'))
+            if path in names:
+                sheets.append((sheet.get('name', ''), path))
+        return sheets
+
+    def _load_shared_strings(self):
+        self._shared = []
+        if 'xl/sharedStrings.xml' not in self._zip.namelist():
+            return
+        with self._zip.open('xl/sharedStrings.xml') as stream:
+            for event, elem in ET.iterparse(stream, events=('end',)):
+                if elem.tag == f'{_XLSX_NS}si':
+                    # Düz metin (<t>) veya zengin metin parçaları (<r><t>); fonetik (<rPh>) atlanır
+                    parts = []
+                    for child in elem:
+                        if child.tag == f'{_XLSX_NS}t':
+                            parts.append(child.text or '')
+                        elif child.tag == f'{_XLSX_NS}r':
+                            t = child.find(f'{_XLSX_NS}t')
+                            if t is not None:
+                                parts.append(t.text or '')
+                    self._shared.append(''.join(parts))
+                    elem.clear()
+
+    def _load_date_styles(self):
+        self._date_styles = {}   # stil indeksi -> geçen süre biçimi mi
+        if 'xl/styles.xml' not in self._zip.namelist():
+            return
+        root = ET.fromstring(self._zip.read('xl/styles.xml'))
+        custom = {}
+        num_fmts = root.find(f'{_XLSX_NS}numFmts')
+        if num_fmts is not None:
+            for nf in num_fmts:
+                custom[int(nf.get('numFmtId', 0))] = nf.get('formatCode', '')
+        xfs = root.find(f'{_XLSX_NS}cellXfs')
+        if xfs is None:
+            return
+        for i, xf in enumerate(xfs):
+            fmt_id = int(xf.get('numFmtId', 0))
+            if fmt_id in _BUILTIN_DATE_FMTS or (fmt_id in custom and _is_date_format(custom[fmt_id])):
+                self._date_styles[i] = fmt_id in _BUILTIN_ELAPSED_FMTS or _is_elapsed_format(custom.get(fmt_id, ''))
+
+    def _cell_value(self, c):
+        t = c.get('t', 'n')
+        if t == 'inlineStr':
+            return ''.join(x.text or '' for x in c.iter(f'{_XLSX_NS}t'))
+        v = c.find(f'{_XLSX_NS}v')
+        if v is None or v.text is None:
+            return None
+        text = v.text
+        if t == 's':
+            return self._shared[int(text)]
+        if t == 'str':
+            return text
+        if t == 'b':
+            return text == '1'
+        if t == 'e':
+            return None
+        num = float(text)
+        elapsed = self._date_styles.get(int(c.get('s', 0)))
+        if elapsed is not None:
+            return _excel_date_value(num, elapsed)
+        return int(num) if num.is_integer() else num
+
+    def iter_rows(self, sheet_path=None):
+        """Satırları (0-indexli, boş satırlar dahil) liste olarak üret."""
+        if self._shared is None:
+            self._load_shared_strings()
+        if self._date_styles is None:
+            self._load_date_styles()
+        if sheet_path is None:
+            sheet_path = self.sheet_paths()[0][1]
+
+        row_tag = f'{_XLSX_NS}row'
+        cell_tag = f'{_XLSX_NS}c'
+        next_idx = 0
+        with self._zip.open(sheet_path) as stream:
+            for event, elem in ET.iterparse(stream, events=('end',)):
+                if elem.tag != row_tag:
+                    continue
+                r_attr = elem.get('r')
+                row_idx = int(r_attr) - 1 if r_attr else next_idx
+                while next_idx < row_idx:
+                    yield []
+                    next_idx += 1
+                values = []
+                col = 0
+                for c in elem.iter(cell_tag):
+                    ref = c.get('r')
+                    col = _col_index(ref) if ref else col
+                    if col >= self.max_cols:
+                        break
+                    val = self._cell_value(c)
+                    if val is not None:
+                        if len(values) <= col:
+                            values.extend([None] * (col + 1 - len(values)))
+                        values[col] = val
+                    col += 1
+                elem.clear()
+                yield values
+                next_idx = row_idx + 1
+
+
+# ── Zip Arşivleri ────────────────────────────────────────────
+#
+# Zip içindeki girdiler 'paket.zip/klasör/dosya.xlsx' biçiminde sanal yollarla taşınır
+# (zipimport'un kuralı). Üye diske açılmaz: okuyan süreç onu arşivden belleğe açar;
+# böylece paralel okuma aşaması açma işini de paralel yapar.
+
+ARCHIVE_SUFFIXES = ('.zip',)
+_ARCHIVE_SKIP_PREFIXES = ('__MACOSX/',)
+
+
+def _archive_member(path):
+    """Sanal zip yolunu (arşiv, üye adı) olarak ayır; normal dosyaysa None."""
+    path = Path(path)
+    if not any(part.lower().endswith(ARCHIVE_SUFFIXES) for part in path.parts[:-1]):
+        return None
+    for parent in path.parents:
+        if parent.suffix.lower() in ARCHIVE_SUFFIXES and parent.is_file():
+            return parent, path.relative_to(parent).as_posix()
+    return None
+
+
+def _input_source(path):
+    """Okuyucuya verilecek kaynak: normal dosyada yol, zip üyesinde bellekteki bayt akışı.
+
+    Girdi yerel hazırlık klasörüne kopyalandıysa (bkz. InputStager) kopya okunur.
+    """
+    located = _archive_member(path)
+    if located is None:
+        return _open_source(Path(path))
+    archive, member = located
+    with zipfile.ZipFile(_open_source(archive)) as zf:
+        return io.BytesIO(zf.read(member))
+
+
+def _input_stamp(path):
+    """Değişiklik damgası [mtime_ns, boyut] (zip üyesinde arşivinki); erişilemezse None."""
+    located = _archive_member(path)
+    try:
+        st = Path(located[0] if located else path).stat()
+        return [st.st_mtime_ns, st.st_size]
+    except OSError:
+        return None
+
+
+def _input_size(path):
+    located = _archive_member(path)
+    try:
+        if located is None:
+            return Path(path).stat().st_size
+        with zipfile.ZipFile(located[0]) as zf:
+            return zf.getinfo(located[1]).file_size
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return 0
+
+
+def _input_exists(path):
+    located = _archive_member(path)
+    if located is None:
+        return Path(path).is_file()
+    try:
+        with zipfile.ZipFile(located[0]) as zf:
+            zf.getinfo(located[1])
+        return True
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return False
+
+
+def _input_dir(path):
+    """Girdinin bulunduğu gerçek klasör (zip üyesinde arşivin klasörü)."""
+    located = _archive_member(path)
+    return (located[0] if located else Path(path)).parent
+
+
+def _input_label(path):
+    located = _archive_member(path)
+    return f'{located[0].name}/{located[1]}' if located else Path(path).name
+
+
+def _expand_inputs(paths):
+    """Zip arşivlerini desteklenen üyelerine (arşivdeki sırayla) aç; diğer yollar aynen kalır."""
+    expanded = []
+    for path in map(Path, paths):
+        if path.suffix.lower() not in ARCHIVE_SUFFIXES or not path.is_file():
+            expanded.append(path)
+            continue
+        try:
+            with zipfile.ZipFile(path) as zf:
+                names = [info.filename for info in zf.infolist() if not info.is_dir()]
+        except (OSError, zipfile.BadZipFile):
+            expanded.append(path)
+            continue
+        for name in names:
+            if (_is_supported_file(name) and not name.startswith(_ARCHIVE_SKIP_PREFIXES)
+                    and not posixpath.basename(name).startswith('~$')):
+                expanded.append(path / name)
+    return expanded
+
+
+# ── Girdi Hazırlama (yavaş ağ paylaşımları) ─────────────────
+#
+# Ağ paylaşımındaki girdiler eklenir eklenmez arka planda, paralel ve büyük ardışık
+# okumalarla yerel hazırlık klasörüne kopyalanır; okuyucular zip içinde çok sayıda küçük
+# rastgele okumayı bu yerel kopyaya yapar. Kopya adı kaynak yolu + damgadan türetilir,
+# böylece süreç havuzundaki işçiler de kopyayı kendi başına bulur; kaynak değişirse eski
+# kopya kullanılmaz. Klasör bayt bütçesini aşarsa en eski kopyalar atılır, bütçeye
+# sığmayan dosya doğrudan kaynaktan okunur. Okunmakta olan kopya sabitlenir (acquire /
+# release); sabitli kopya bütçe temizliğinde silinmez.
+
+STAGE_DIR = Path(tempfile.gettempdir()) / 'order_merger_stage'
+STAGE_MODE = 'auto'          # 'auto': yalnızca ağ yolları, 'always': tüm girdiler, 'off'
+STAGE_MODES = ('auto', 'always', 'off')
+STAGE_BUDGET_MB = 1024
+STAGE_WORKERS = 4
+STAGE_CHUNK = 4 * 1024 * 1024
+STAGE_POLL_SEC = 0.1         # kopya beklenirken iptal kontrol aralığı
+_NETWORK_FS_TYPES = ('cifs', 'smb3', 'smbfs', 'nfs', 'nfs4', 'fuse.sshfs', '9p', 'afpfs', 'webdav')
+_network_mounts = None
+# Kıyaslamada yavaş dosya sistemi taklidi takılır (bkz. bench-staging); normalde None
+_source_opener = None
+
+
+def _is_network_path(path):
+    """UNC yolu, Windows ağ sürücüsü veya (Linux) ağ dosya sistemi bağlama noktası mı?"""
+    text = str(path)
+    if text.startswith('\\\\') or text.startswith('//'):
+        return True
+    if os.name == 'nt':
+        drive = os.path.splitdrive(os.path.abspath(text))[0]
+        try:
+            import ctypes
+            return bool(drive) and ctypes.windll.kernel32.GetDriveTypeW(drive + '\\') == 4  # DRIVE_REMOTE
+        except Exception:
+            return False
+    global _network_mounts
+    if _network_mounts is None:
+        _network_mounts = []
+        try:
+            with open('/proc/mounts', 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) > 2 and parts[2] in _NETWORK_FS_TYPES:
+                        _network_mounts.append(parts[1])
+        except OSError:
+            pass
+    text = os.path.abspath(text)
+    return any(text == m or text.startswith(m.rstrip('/') + '/') for m in _network_mounts)
+
+
+def _stage_source(path):
+    """Hazırlanacak gerçek dosya: zip üyesinde arşivin kendisi."""
+    located = _archive_member(path)
+    return located[0] if located else Path(path)
+
+
+def _staged_path(stage_dir, source, st):
+    digest = hashlib.sha1(f'{source}|{st.st_mtime_ns}|{st.st_size}'.encode('utf-8')).hexdigest()
+    return Path(stage_dir) / f'{digest}{source.suffix.lower()}'
+
+
+def _staged_copy(source):
+    """Kaynağın güncel hazırlanmış kopyası; yoksa None (hazırlayıcısı olmayan süreçler için)."""
+    if not STAGE_DIR.is_dir():
+        return None
+    try:
+        target = _staged_path(STAGE_DIR, source, source.stat())
+    except OSError:
+        return None
+    return target if target.is_file() else None
+
+
+@contextlib.contextmanager
+def _pinned_input(path, cancel=None):
+    """Okuma süresince girdinin hazırlanmış kopyasını sabitle (bkz. InputStager.acquire)."""
+    stager = _STAGER
+    staged = stager.acquire(_stage_source(path), cancel) if stager is not None else None
+    try:
+        yield staged
+    finally:
+        if stager is not None:
+            stager.release(staged)
+
+
+def _open_source(source):
+    """Okuyucunun açacağı kaynak: hazırlanmış kopya, yoksa kaynağın kendisi."""
+    staged = _STAGER.result(source) if _STAGER is not None else None
+    if staged is None:
+        staged = _staged_copy(source)
+    if staged is not None:
+        return staged
+    return _source_opener(source) if _source_opener is not None else source
+
+
+class InputStager:
+    """Girdileri arka planda paralel ve büyük bloklarla yerel hazırlık klasörüne kopyalar."""
+
+    def __init__(self, budget_mb=STAGE_BUDGET_MB, workers=STAGE_WORKERS, stage_dir=STAGE_DIR, opener=None,
+                 mode=STAGE_MODE):
+        self.budget = int(budget_mb * 1024 * 1024)
+        self.mode = mode
+        self.stage_dir = Path(stage_dir)
+        self._opener = opener or (lambda p: open(p, 'rb'))
+        self._pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix='stage')
+        self._lock = threading.Lock()
+        self._jobs = {}
+        self._pins = {}
+        self._reserved = 0
+        self.staged_bytes = 0
+
+    def stage(self, paths, mode=None):
+        """Kopyalamayı başlat ve hemen dön; aynı kaynak bir kez kopyalanır."""
+        mode = mode or self.mode
+        if mode == 'off':
+            return
+        with self._lock:
+            for path in paths:
+                source = _stage_source(path)
+                key = str(source)
+                job = self._jobs.get(key)
+                if job is not None and not job.done():
+                    continue
+                if mode == 'always' or _is_network_path(source):
+                    self._jobs[key] = self._pool.submit(self._copy, source)
+
+    def acquire(self, source, cancel=None):
+        """Kaynağın kopyasını bekle ve sabitle; release() edilene dek bütçe temizliği silmez.
+
+        Bekleme cancel ile kesilir (MergeCancelled). Hazırlanmadıysa veya eskidiyse None.
+        """
+        with self._lock:
+            job = self._jobs.get(str(source))
+        if job is None:
+            return None
+        while True:
+            if cancel is not None:
+                cancel.check()
+            try:
+                target, stamp = job.result(timeout=STAGE_POLL_SEC)
+                break
+            except FuturesTimeout:
+                continue
+            except Exception:
+                return None
+        try:
+            st = source.stat()
+        except OSError:
+            return None
+        if target is None or (st.st_mtime_ns, st.st_size) != stamp:
+            return None
+        with self._lock:
+            if not target.is_file():
+                return None
+            self._pins[target] = self._pins.get(target, 0) + 1
+        return target
+
+    def release(self, target):
+        """acquire() ile alınan sabitlemeyi bırak (None yok sayılır)."""
+        if target is None:
+            return
+        with self._lock:
+            count = self._pins.get(target, 0) - 1
+            if count > 0:
+                self._pins[target] = count
+            else:
+                self._pins.pop(target, None)
+
+    def result(self, source, cancel=None):
+        """Kaynağın kopyası, sabitlemeden (sürüyorsa bitmesini bekler); yoksa None."""
+        target = self.acquire(source, cancel)
+        self.release(target)
+        return target
+
+    def wait(self, timeout=None):
+        """Süren tüm kopyaların bitmesini bekle."""
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            try:
+                job.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def _copy(self, source):
+        st = source.stat()
+        stamp = (st.st_mtime_ns, st.st_size)
+        target = _staged_path(self.stage_dir, source, st)
+        if target.is_file():
+            try:
+                os.utime(target)  # LRU için son kullanım
+            except OSError:
+                pass
+            return target, stamp
+        if not self._reserve(st.st_size):
+            return None, stamp
+        tmp = target.with_name(f'{target.name}.{uuid.uuid4().hex[:8]}.part')
+        copied = False
+        try:
+            with self._opener(source) as src, open(tmp, 'wb') as dst:
+                while True:
+                    chunk = src.read(STAGE_CHUNK)
+                    if not chunk:
+                        break
+                    dst.write(chunk)
+            os.replace(tmp, target)
+            copied = True
+        except BaseException:
+            with contextlib.suppress(OSError):
+                tmp.unlink()
+            raise
+        finally:
+            with self._lock:
+                self._reserved -= st.st_size
+                if copied:
+                    self.staged_bytes += st.st_size
+        return target, stamp
+
+    def _reserve(self, size):
+        """Bütçede yer aç (sabitli olmayan en eski kopyalar silinir); sığmıyorsa False."""
+        if size > self.budget:
+            return False
+        with self._lock:
+            self.stage_dir.mkdir(parents=True, exist_ok=True)
+            entries = []
+            for p in self.stage_dir.iterdir():
+                if p.suffix == '.part':
+                    continue
+                try:
+                    st = p.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, p))
+            entries.sort()
+            used = self._reserved + sum(e[1] for e in entries)
+            for _, entry_size, p in entries:
+                if used + size <= self.budget:
+                    break
+                if p in self._pins:
+                    continue   # okunuyor
+                try:
+                    p.unlink()
+                    used -= entry_size
+                except OSError:
+                    pass   # başka süreçte açık olabilir
+            if used + size > self.budget:
+                return False
+            self._reserved += size
+            return True
+
+
+_STAGER = None
+_stager_lock = threading.Lock()
+
+
+def _input_stager():
+    """Süreç genelinde tek hazırlayıcı; ayarlardaki 'stage_inputs' / 'stage_budget_mb' okunur."""
+    global _STAGER
+    with _stager_lock:
+        if _STAGER is None:
+            settings = {}
+            try:
+                if SETTINGS_FILE.exists():
+                    with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                        settings = json.load(f)
+            except Exception:
+                pass
+            mode = settings.get('stage_inputs', STAGE_MODE)
+            try:
+                budget = float(settings.get('stage_budget_mb', STAGE_BUDGET_MB))
+            except (TypeError, ValueError):
+                budget = STAGE_BUDGET_MB
+            _STAGER = InputStager(budget, mode=mode if mode in STAGE_MODES else STAGE_MODE)
+        return _STAGER
+
+
+class _ThrottledFile(io.RawIOBase):
+    """Yavaş ağ paylaşımı taklidi: her okuma gecikme + bant genişliği kadar bekler."""
+
+    def __init__(self, path, latency, bytes_per_sec):
+        super().__init__()
+        self._f = open(path, 'rb')
+        self.latency = latency
+        self.bytes_per_sec = bytes_per_sec
+        self.reads = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._f.seek(offset, whence)
+
+    def tell(self):
+        return self._f.tell()
+
+    def readinto(self, buffer):
+        n = self._f.readinto(buffer)
+        self.reads += 1
+        time.sleep(self.latency + (n or 0) / self.bytes_per_sec)
+        return n
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+# ── Okuyucu Arka Uçları ──────────────────────────────────────
+#
+# Her arka uç çalışma kitabını bir kez açar ve sayfaları sırayla (isim, satırlar) olarak
+# verir; satırlar 0-indexli, boş satırlar dahil, en fazla max_cols sütunluk listelerdir.
+# Dosya başına uzantıya uyan arka uçlar sırayla denenir; biri dosyayı okuyamazsa
+# sıradaki devralır. Sıra ayarlardaki 'reader_backend' ile (auto / stream / calamine /
+# pandas) öne alınabilir.
+
+SUPPORTED_SUFFIXES = ('.xlsx', '.xlsm', '.xls', '.xlsb', '.ods')
+READER_BACKEND = 'auto'
+_PANDAS_ENGINES = {'.xls': 'xlrd', '.xlsb': 'pyxlsb', '.ods': 'odf'}
+_READ_ERRORS = (zipfile.BadZipFile, KeyError, IndexError, ET.ParseError, OSError, ValueError, ImportError)
+if HAS_CALAMINE:
+    _READ_ERRORS += (CalamineError,)
+
+
+def _is_supported_file(path):
+    return Path(path).suffix.lower() in SUPPORTED_SUFFIXES
+
+
+def _normalize_cell(value):
+    """Hücre değerini akışlı okuyucunun ürettiği tiplere çevir (tüm arka uçlar aynı sonucu versin).
+
+    Tarih datetime, yalnızca saat time, geçen süre timedelta olarak kalır (bkz.
+    _excel_date_value); pandas ve numpy tipleri standart tiplere çevrilir.
+    """
+    if isinstance(value, str):
+        return value or None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, pd.Timedelta):
+        return value.to_pytimedelta()
+    if hasattr(value, 'item'):
+        value = value.item()   # numpy skalerleri
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, date):
+        return datetime(value.year, value.month, value.day)
+    if isinstance(value, dt_time):
+        return value.replace(tzinfo=None)
+    return value
+
+
+def _trim_row(values, max_cols):
+    """İlk max_cols hücre; sondaki boş hücreler atılır (akışlı okuyucuyla aynı biçim)."""
+    values = values[:max_cols]
+    while values and values[-1] is None:
+        values.pop()
+    return values
+
+
+class StreamReaderBackend:
+    """Yerleşik akışlı xlsx okuyucu: footer'dan sonra dosyanın geri kalanını hiç açmaz."""
+
+    name = 'stream'
+    suffixes = ('.xlsx', '.xlsm')
+
+    def available(self):
+        return True
+
+    def iter_sheets(self, file_path, max_cols):
+        # Paylaşılan metinler ve stiller okuyucuda bir kez yüklenir, tüm sayfalarda kullanılır
+        with XlsxStreamReader(_input_source(file_path), max_cols) as reader:
+            for name, sheet_path in reader.sheet_paths():
+                yield name, reader.iter_rows(sheet_path)
+
+
+class CalamineReaderBackend:
+    """Rust tabanlı calamine (python-calamine kuruluysa): xlsx/xls/xlsb/ods."""
+
+    name = 'calamine'
+    suffixes = SUPPORTED_SUFFIXES
+
+    def available(self):
+        return HAS_CALAMINE
+
+    def _rows(self, sheet, max_cols):
+        # Satırlar tembel üretilir (to_python tüm sayfayı Python listelerine çevirirdi).
+        # iter_rows üstteki boş satırları verir ama sütunlara ilk dolu sütundan başlar:
+        # indeksler A1'e göre kalsın diye soldaki boş sütunlar eklenir.
+        pad = [None] * sheet.start[1] if sheet.start else []
+        for row in sheet.iter_rows():
+            yield _trim_row(pad + [_normalize_cell(v) for v in row[:max(max_cols - len(pad), 0)]], max_cols)
+
+    def iter_sheets(self, file_path, max_cols):
+        source = _input_source(file_path)
+        if hasattr(source, 'read'):
+            workbook = CalamineWorkbook.from_filelike(source)
+        else:
+            workbook = CalamineWorkbook.from_path(str(source))
+        try:
+            for name in workbook.sheet_names:
+                yield name, self._rows(workbook.get_sheet_by_name(name), max_cols)
+        finally:
+            workbook.close()
+
+
+class PandasReaderBackend:
+    """Son çare: pd.read_excel (xlsx için openpyxl, diğerleri için xlrd/pyxlsb/odf)."""
+
+    name = 'pandas'
+    suffixes = SUPPORTED_SUFFIXES
+
+    def available(self):
+        return True
+
+    @staticmethod
+    def _rows(df, max_cols):
+        for row in df.itertuples(index=False):
+            yield _trim_row([None if pd.isna(v) else _normalize_cell(v) for v in row[:max_cols]], max_cols)
+
+    def iter_sheets(self, file_path, max_cols):
+        engine = _PANDAS_ENGINES.get(Path(file_path).suffix.lower())
+        sheets = pd.read_excel(_input_source(file_path), header=None, sheet_name=None, engine=engine)
+        for name, df in sheets.items():
+            yield name, self._rows(df, max_cols)
+
+
+READER_BACKENDS = {b.name: b for b in (StreamReaderBackend(), CalamineReaderBackend(), PandasReaderBackend())}
+# Varsayılan sıra: xlsx/xlsm footer'da duran akışlı okuyucuyla okunur (bellek sınırlı);
+# calamine daha hızlıdır (bench-readers) ama sayfanın tamamını belleğe alır, bu yüzden
+# akışlı okuyucunun açamadığı biçimlere (xls, xlsb, ods) ve yedek olarak kullanılır.
+# 'reader_backend' ayarıyla öne alınabilir. Son çare pandas.
+_DEFAULT_READER_ORDER = ('stream', 'calamine', 'pandas')
+_reader_preference = None
+
+
+def _get_reader_preference():
+    """Ayarlardaki 'reader_backend' değerini süreç başına bir kez oku."""
+    global _reader_preference
+    if _reader_preference is None:
+        _reader_preference = READER_BACKEND
+        try:
+            if SETTINGS_FILE.exists():
+                with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                    _reader_preference = json.load(f).get('reader_backend', READER_BACKEND)
+        except Exception:
+            pass
+    return _reader_preference
+
+
+def _reader_backends_for(file_path, preference=None):
+    """Dosyanın uzantısını okuyabilen, kurulu arka uçlar; tercih edilen en önde."""
+    suffix = Path(file_path).suffix.lower()
+    preference = preference or _get_reader_preference()
+    order = list(_DEFAULT_READER_ORDER)
+    if preference in order:
+        order.remove(preference)
+        order.insert(0, preference)
+    backends = [READER_BACKENDS[name] for name in order]
+    return [b for b in backends if b.available() and (suffix in b.suffixes or not _is_supported_file(file_path))]
+
+
+def _cell_text(row, col):
+    if col < len(row) and row[col] is not None and not (isinstance(row[col], float) and pd.isna(row[col])):
+        return str(row[col]).strip()
+    return ''
+
+
+FOOTER_LOOKAHEAD = 5
+
+# Çıktıdaki veri sütunlarının sırası (data_rows bu sıraya göre üretilir)
+DATA_FIELDS = ['no', 'description', 'code', 'qtty', 'unit', 'u_price', 't_price', 'remarks', 'stock_loc', 'cost']
+DATA_ROW_WIDTH = len(DATA_FIELDS)
+
+# ── Sayfa Düzeni Profilleri ─────────────────────────────────
+#
+# Her profil; gemi hücresi, başlık bölgesi, 'NO' başlık sütunu, TOTAL footer kuralı,
+# kaynak sütun haritası ve otomatik tespit için çapa (anchor) hücrelerini tanımlar.
+# Tüm indeksler 0-indexlidir. Ek profiller LAYOUTS_FILE'dan (JSON listesi) okunur.
+
+DEFAULT_LAYOUT = {
+    'name': 'standard',
+    'vessel_cell': [14, 1],
+    'header_zone': [25, 10],
+    'no_col': 0,
+    'no_label': 'NO',
+    'total_col': 5,
+    'total_label': 'TOTAL',
+    'columns': {field: idx for idx, field in enumerate(DATA_FIELDS)},
+    'anchors': [[20, 0, 'NO'], [20, 1, 'DESCRIPTION']],
+}
+
+
+def _check_layout_profile(profile):
+    """Profil alanlarını doğrula; hatalı alanda nedenini söyleyen ValueError fırlat."""
+    if not isinstance(profile, dict):
+        raise ValueError("profil bir JSON nesnesi olmalı")
+    unknown = set(profile) - set(DEFAULT_LAYOUT)
+    if unknown:
+        raise ValueError(f"bilinmeyen alan: {', '.join(sorted(unknown))}")
+
+    def index(value, field):
+        if type(value) is not int or value < 0:
+            raise ValueError(f"'{field}' 0 veya pozitif tam sayı olmalı: {value!r}")
+
+    if 'name' in profile and (not isinstance(profile['name'], str) or not profile['name'].strip()):
+        raise ValueError("'name' boş olmayan bir metin olmalı")
+    for field in ('vessel_cell', 'header_zone'):
+        if field in profile:
+            value = profile[field]
+            if not isinstance(value, list) or len(value) != 2:
+                raise ValueError(f"'{field}' [satır, sütun] olmalı: {value!r}")
+            for v in value:
+                index(v, field)
+    for field in ('no_col', 'total_col'):
+        if field in profile:
+            index(profile[field], field)
+    for field in ('no_label', 'total_label'):
+        if field in profile and not isinstance(profile[field], str):
+            raise ValueError(f"'{field}' metin olmalı: {profile[field]!r}")
+    if 'columns' in profile:
+        columns = profile['columns']
+        if not isinstance(columns, dict):
+            raise ValueError("'columns' alan → sütun eşlemesi olmalı")
+        for field, col in columns.items():
+            if field not in DATA_FIELDS:
+                raise ValueError(f"'columns' içinde bilinmeyen alan: {field!r}")
+            if col is not None:
+                index(col, f"columns.{field}")
+    if 'anchors' in profile:
+        anchors = profile['anchors']
+        if not isinstance(anchors, list):
+            raise ValueError("'anchors' [satır, sütun, metin] listesi olmalı")
+        for anchor in anchors:
+            if not isinstance(anchor, list) or len(anchor) != 3 or not isinstance(anchor[2], str):
+                raise ValueError(f"'anchors' öğesi [satır, sütun, metin] olmalı: {anchor!r}")
+            index(anchor[0], 'anchors')
+            index(anchor[1], 'anchors')
+
+
+class LayoutPlan:
+    """Bir düzen profilinin derlenmiş hali: doğrudan indeks planı."""
+
+    def __init__(self, profile):
+        _check_layout_profile(profile)
+        merged = dict(DEFAULT_LAYOUT)
+        merged.update(profile)
+        self.name = merged['name']
+        self.vessel_row, self.vessel_col = merged['vessel_cell']
+        self.header_rows, self.header_cols = merged['header_zone']
+        self.no_col = merged['no_col']
+        self.no_label = merged['no_label'].upper()
+        self.total_col = merged['total_col']
+        self.total_label = merged['total_label'].upper()
+        columns = merged['columns']
+        self.sources = tuple(columns.get(field) for field in DATA_FIELDS)
+        self.identity = self.sources == tuple(range(DATA_ROW_WIDTH))
+        self.anchors = tuple((int(r), int(c), str(text).upper()) for r, c, text in merged.get('anchors', []))
+        self.sample_rows = max((r for r, _, _ in self.anchors), default=-1) + 1
+        used = [c for c in self.sources if c is not None] + [
+            self.vessel_col, self.header_cols, self.no_col, self.total_col,
+            *(c for _, c, _ in self.anchors),
+        ]
+        self.read_cols = max(used) + 2
+
+    def matches(self, sample):
+        """Çapa hücrelerinin kaçının tuttuğunu döndür (hepsi tutmazsa 0)."""
+        if not self.anchors:
+            return 0
+        for r, c, text in self.anchors:
+            if r >= len(sample) or not _cell_text(sample[r], c).upper().startswith(text):
+                return 0
+        return len(self.anchors)
+
+    def qualifies(self, sample):
+        """Ek sayfalar için: çapalar tutuyor ve gemi hücresi dolu mu?"""
+        vessel_row = sample[self.vessel_row] if self.vessel_row < len(sample) else []
+        return bool(self.matches(sample)) and bool(_cell_text(vessel_row, self.vessel_col))
+
+    def map_row(self, row):
+        if self.identity:
+            return list(row[:DATA_ROW_WIDTH]) + [None] * (DATA_ROW_WIDTH - len(row))
+        return [row[c] if c is not None and c < len(row) else None for c in self.sources]
+
+
+_layout_plans = None
+_layout_warnings = []
+
+
+def _load_layout_profiles():
+    """LAYOUTS_FILE'daki profilleri tek tek derle; hatalı profil diğerlerini düşürmez.
+
+    Dönüş: (planlar, uyarılar) — her uyarı atlanan profili ve nedenini söyler.
+    """
+    if not LAYOUTS_FILE.exists():
+        return [], []
+    try:
+        with open(LAYOUTS_FILE, 'r', encoding='utf-8') as f:
+            profiles = json.load(f)
+    except (OSError, ValueError) as e:
+        return [], [f"{LAYOUTS_FILE.name} okunamadı, kullanıcı profilleri yok sayıldı: {e}"]
+    if not isinstance(profiles, list):
+        return [], [f"{LAYOUTS_FILE.name} bir JSON listesi olmalı, kullanıcı profilleri yok sayıldı"]
+    plans, warnings = [], []
+    for i, profile in enumerate(profiles, 1):
+        name = profile.get('name') if isinstance(profile, dict) else None
+        label = f"#{i} '{name}'" if isinstance(name, str) and name else f"#{i}"
+        try:
+            plans.append(LayoutPlan(profile))
+        except ValueError as e:
+            warnings.append(f"Düzen profili {label} atlandı: {e}")
+    return plans, warnings
+
+
+def _get_layout_plans():
+    """Yerleşik + kullanıcı profillerini bir kez derle (önce kullanıcı profilleri).
+
+    Atlanan profiller stderr'e yazılır ve _layout_warnings'te tutulur (GUI açılışta gösterir).
+    """
+    global _layout_plans, _layout_warnings
+    if _layout_plans is None:
+        plans, warnings = _load_layout_profiles()
+        for warning in warnings:
+            print(f"⚠️ {warning}", file=sys.stderr)
+        plans.append(LayoutPlan(DEFAULT_LAYOUT))
+        _layout_plans, _layout_warnings = plans, warnings
+    return _layout_plans
+
+
+def _detect_layout(rows, plans):
+    """Sadece çapa satırlarını örnekleyip en uygun planı seç.
+
+    Örneklenen satırlar geri verilen iteratörün başına eklenir; sayfa tekrar okunmaz.
+    Dönüş: (plan, örnek satırlar, tüm satırlar)
+    """
+    depth = max(max(p.sample_rows, p.vessel_row + 1) for p in plans)
+    sample = list(itertools.islice(rows, depth))
+    best, best_score = plans[-1], 0
+    for plan in plans:
+        score = plan.matches(sample)
+        if score > best_score:
+            best, best_score = plan, score
+    return best, sample, itertools.chain(sample, rows)
+
+
+_TOTAL_CURRENCY_SYMBOLS = [('€', 'EUR'), ('$', 'USD'), ('£', 'GBP'), ('₺', 'TRY')]
+
+
+def _row_currency(row):
+    """Satırda 'TOTAL ... :' etiketi varsa yanındaki iki hücreden para birimini çıkar."""
+    for col_idx in range(len(row)):
+        cell_val = _cell_text(row, col_idx)
+        if 'TOTAL' in cell_val.upper() and ':' in cell_val:
+            for c in range(col_idx + 1, min(col_idx + 3, len(row))):
+                if row[c] is not None:
+                    total_str = str(row[c])
+                    for sym, code in _TOTAL_CURRENCY_SYMBOLS:
+                        if sym in total_str:
+                            return code
+    return ''
+
+
+def _row_amount(row, label_col):
+    """TOTAL etiketinin sağındaki ilk dolu hücrenin tutarı (yoksa None)."""
+    for c in range(label_col + 1, min(label_col + 3, len(row))):
+        value = row[c]
+        if value is None or not str(value).strip():
+            continue
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return float(value)
+        return _parse_cost(value)[0]
+    return None
+
+
+def _scan_order_rows(rows, file_name, plan=None, cancel=None):
+    """Tek geçişli durum makinesi: başlık bölgesi -> 'NO' başlığı -> veri -> TOTAL footer.
+
+    Para birimi okunurken yakalanır; footer işlendikten sonra okuma durur, böylece
+    sayfa sonundaki şartlar/koşullar blokları hiç ayrıştırılmaz.
+    """
+    plan = plan or _get_layout_plans()[-1]
+    header_info = {}
+    header_cells = []
+    pending_header = None   # (label_col, value_col, kalan satır)
+    currency = ''
+    start_found = False
+    footer_row = None
+    source_total = None
+    data_rows = []
+    width = 0
+
+    for row_idx, row in enumerate(rows):
+        if cancel is not None and row_idx % CANCEL_CHECK_ROWS == 0:
+            cancel.check()
+        width = max(width, len(row))
+
+        # ── Başlık bölgesi ──
+        if pending_header:
+            # RFQ ve QTN genelde DATE'in hemen altında
+            label_col, value_col, remaining = pending_header
+            header_cells.append((_cell_text(row, label_col).rstrip(' :').strip(), _cell_text(row, value_col)))
+            pending_header = (label_col, value_col, remaining - 1) if remaining > 1 else None
+        if row_idx < plan.header_rows:
+            if row_idx == plan.vessel_row:
+                header_info['vessel'] = _cell_text(row, plan.vessel_col)
+            for col_idx in range(min(plan.header_cols, len(row))):
+                cell_val = _cell_text(row, col_idx)
+                if not cell_val:
+                    continue
+                upper = cell_val.upper()
+                value = _cell_text(row, col_idx + 1)
+                if 'RFQ REF' in upper:
+                    if value:
+                        header_info['rfq_ref'] = value
+                elif 'QTN REF' in upper:
+                    if value:
+                        header_info['qtn_ref'] = value
+                elif 'DATE' in upper and ':' in cell_val:
+                    if value:
+                        header_info['date'] = value
+                    # header_cells: ilk DATE etiketi + hemen altındaki RFQ / QTN
+                    if upper.startswith('DATE') and not header_cells:
+                        header_cells.append(('DATE', value))
+                        pending_header = (col_idx, col_idx + 1, 2)
+
+        if not currency:
+            currency = _row_currency(row)
+
+        # ── Footer sonrası: para birimi hâlâ yoksa birkaç satır daha bak ──
+        if footer_row is not None:
+            if currency or row_idx - footer_row >= FOOTER_LOOKAHEAD:
+                break
+            continue
+
+        # ── 'NO' başlık satırı ──
+        if not start_found:
+            if _cell_text(row, plan.no_col).upper() == plan.no_label:
+                start_found = True
+            continue
+
+        # ── Veri satırları ──
+        first_col = _cell_text(row, plan.no_col)
+        if not first_col:
+            # TOTAL tespiti: sadece profilin TOTAL sütununda (varsayılan F) aranır
+            # Böylece REMARKS veya başka sütunlarda "TOTAL" geçmesi sorun yaratmaz
+            if plan.total_label in _cell_text(row, plan.total_col).upper():
+                footer_row = row_idx
+                source_total = _row_amount(row, plan.total_col)
+                if currency:
+                    break
+            continue
+        if first_col[0].isdigit():
+            data_rows.append(plan.map_row(row))
+
+    if width < 2 or not start_found:
+        return None
+
+    header_info.setdefault('vessel', '')
+    header_info['currency'] = currency
+    return {
+        'file_name': file_name,
+        'layout': plan.name,
+        'header_info': header_info,
+        'header_cells': header_cells,
+        'data_rows': data_rows,
+        'source_total': source_total,
+    }
+
+
+def _scan_workbook(sheets, file_name, plans, cancel=None):
+    """Açık çalışma kitabının sayfalarından siparişleri çıkar.
+
+    İlk sayfa her zaman taranır (çapalar tutmasa da en uygun düzenle). Diğer sayfalar
+    yalnızca çapa satırları örneklenerek elenir; 'NO' çapası ve gemi hücresi tutmayan
+    sayfanın geri kalanı okunmaz. Birden fazla sayfa sipariş verirse her siparişin
+    file_name'i 'dosya.xlsx [Sayfa]' olur.
+    """
+    found = []
+    try:
+        for index, (sheet_name, source) in enumerate(sheets):
+            try:
+                plan, sample, rows = _detect_layout(source, plans)
+                if index == 0 or plan.qualifies(sample):
+                    order_data = _scan_order_rows(rows, file_name, plan, cancel)
+                    if order_data:
+                        found.append((sheet_name, order_data))
+            finally:
+                source.close()
+    finally:
+        sheets.close()
+    if len(found) > 1:
+        for sheet_name, order_data in found:
+            order_data['file_name'] = f'{file_name} [{sheet_name}]'
+    return [order_data for _, order_data in found]
+
+
+def _extract_orders(file_path, plans=None, cancel=None, backends=None):
+    """Dosyadaki siparişlerin listesi (sayfa başına en fazla bir sipariş, kitap tek açılır).
+
+    Arka uç dosyayı okuyamazsa sıradaki arka uçla baştan denenir; yarım okuma karışmaz.
+    """
+    plans = plans or _get_layout_plans()
+    max_cols = max(READ_MAX_COLS, *(p.read_cols for p in plans))
+    backends = _reader_backends_for(file_path) if backends is None else backends
+    error = None
+    for backend in backends:
+        try:
+            return _scan_workbook(backend.iter_sheets(file_path, max_cols), Path(file_path).name, plans, cancel)
+        except _READ_ERRORS as e:
+            error = e
+    if error is not None:
+        raise error
+    raise ValueError(f"Bu dosya türü için okuyucu yok: {Path(file_path).name}")
+
+
+# ── Çıktı Çalışma Kitabı ────────────────────────────────────
+#
+# Çıktı iki aşamada üretilir: önce her sipariş bloğunun satır aralığı hesaplanır,
+# sonra bloklar (gerekirse paralel) satır tamponlarına çizilir ve akışlı (write-only)
+# yazıcı bunları sırayla dosyaya ekler.
+# Satır tamponundaki her hücre None veya (değer, stil_anahtarı, sayı_formatı) üçlüsüdür.
+# Sipariş blokları işçide satır numarasından bağımsız XML şablonuna çevrilir (bkz.
+# _block_template); yazıcı yalnızca satır numaralarını ve stil kimliklerini yerleştirir.
+
+OUTPUT_HEADERS = ['NO', 'DESCRIPTION', 'CODE', 'QTTY', 'UNIT', 'U.PRICE', 'T.PRICE', 'REMARKS', 'STOCK LOC.', 'U.COST', 'T.COST']
+OUTPUT_COLS = len(OUTPUT_HEADERS)
+OUTPUT_FIRST_BLOCK_ROW = 6
+TOTAL_LABEL = 'TOTAL:'
+COST_TOTAL_LABEL = 'COST TOTAL:'
+OUTPUT_COLUMN_WIDTHS = {
+    'A': 6, 'B': 55, 'C': 15, 'D': 8, 'E': 8, 'F': 12,
+    'G': 14, 'H': 30, 'I': 18, 'J': 12, 'K': 14,
+}
+# Gizli yardımcı sütun (L): TOTAL satırlarında siparişin para birimi anahtarı. Karışık
+# para birimli Grand Summary SUMIFS'i bu sütunla yapar; görünür sütunlar ve yazdırma
+# alanı (A:K) değişmez.
+CURRENCY_KEY_COL = OUTPUT_COLS
+PARALLEL_RENDER_MIN_ORDERS = 32
+REPORTING_CURRENCY = 'TRY'
+REPORTING_CURRENCIES = ['TRY', 'EUR', 'USD']
+
+
+def _solid(color):
+    return PatternFill(start_color=color, end_color=color, fill_type='solid')
+
+
+def _output_styles():
+    """Stil anahtarı -> openpyxl stil nesneleri"""
+    thin = Side(style='thin')
+    medium = Side(style='medium')
+    thin_border = Border(left=thin, right=thin, top=thin, bottom=thin)
+    summary_border = Border(left=medium, right=medium, top=medium, bottom=medium)
+    center = Alignment(horizontal='center', vertical='center')
+    right = Alignment(horizontal='right', vertical='center')
+    grand_font = Font(bold=True, size=14, color='FFFFFF')
+    return {
+        'banner_title': dict(font=Font(bold=True, size=18, color='FFFFFF'), fill=_solid('1B2631'), alignment=center),
+        'banner_title_fill': dict(fill=_solid('1B2631')),
+        'banner_vessel': dict(font=Font(bold=True, size=13, color='F39C12'), fill=_solid('2C3E50'), alignment=center),
+        'banner_vessel_fill': dict(fill=_solid('2C3E50')),
+        'banner_info': dict(font=Font(bold=True, size=10, color='FFFFFF'), fill=_solid('2980B9'), alignment=center),
+        'banner_info_fill': dict(fill=_solid('2980B9')),
+        'banner_gold': dict(fill=_solid('F39C12')),
+        'order_info': dict(font=Font(italic=True, size=9, color='808080')),
+        'info_label': dict(font=Font(bold=True, size=9), alignment=right, border=thin_border),
+        'info_value': dict(font=Font(size=9), border=thin_border),
+        'header': dict(font=Font(bold=True, size=11, color='FFFFFF'), fill=_solid('3498DB'), alignment=center, border=thin_border),
+        'data': dict(alignment=Alignment(vertical='center', wrap_text=True), border=thin_border),
+        'total_label': dict(font=Font(bold=True, size=11), alignment=right),
+        'total_value': dict(font=Font(bold=True, size=11)),
+        'summary_separator': dict(fill=_solid('2C3E50'), border=thin_border),
+        'summary_title': dict(font=Font(bold=True, size=13, color='FFFFFF'), fill=_solid('1A5276'), alignment=center, border=thin_border),
+        'summary_title_fill': dict(fill=_solid('1A5276'), border=thin_border),
+        'summary_label': dict(font=Font(bold=True, size=12, color='2C3E50'), fill=_solid('EBF5FB'), alignment=right, border=summary_border),
+        'summary_label_fill': dict(fill=_solid('EBF5FB'), border=summary_border),
+        'summary_value': dict(font=Font(bold=True, size=12, color='1A5276'), fill=_solid('D4E6F1'), alignment=center, border=summary_border),
+        'summary_value_fill': dict(fill=_solid('D4E6F1'), border=summary_border),
+        'grand_label': dict(font=grand_font, fill=_solid('1A5276'), alignment=right, border=summary_border),
+        'grand_value': dict(font=grand_font, fill=_solid('1A5276'), alignment=center, border=summary_border),
+        'grand_fill': dict(fill=_solid('1A5276'), border=summary_border),
+        'profit_label': dict(font=grand_font, fill=_solid('27AE60'), alignment=right, border=summary_border),
+        'profit_value': dict(font=grand_font, fill=_solid('27AE60'), alignment=center, border=summary_border),
+        'profit_fill': dict(fill=_solid('27AE60'), border=summary_border),
+    }
+
+
+# ── Vurgulama (koşullu biçim) ──
+#
+# Zararına satırlar, maliyeti eksik satırlar ve yüksek marjlı satırlar hücre hücre
+# boyanmaz: tüm blok bölgesine sayfa düzeyinde birkaç koşullu biçim kuralı yazılır.
+# Çıktı boyutu ve yazma süresi sipariş sayısından bağımsız kalır, Excel'de fiyat
+# değiştikçe vurgu da güncellenir.
+
+HIGH_MARGIN_RATIO = 0.5
+
+
+def _highlight_styles():
+    """Vurgu anahtarı -> koşullu biçim (dxf) stili. dxf'te düz dolgu bgColor ister."""
+    return {
+        'loss': dict(font=Font(color='9C0006'), fill=PatternFill(bgColor='FFC7CE')),
+        'missing_cost': dict(font=Font(color='9C5700'), fill=PatternFill(bgColor='FFEB9C')),
+        'high_margin': dict(font=Font(color='006100'), fill=PatternFill(bgColor='C6EFCE')),
+    }
+
+
+def _highlight_rules(first_row=OUTPUT_FIRST_BLOCK_ROW):
+    """Blok bölgesi için [(formül, vurgu anahtarı)], öncelik sırasıyla.
+
+    Formüller first_row'a görelidir ve yalnızca A sütununda sıra numarası olan veri
+    satırlarında tutar (başlık, TOTAL ve özet satırları etkilenmez).
+    F = U.PRICE, J = U.COST (satış para biriminde).
+    """
+    r = first_row
+    item = f'ISNUMBER($A{r})'
+    return [
+        (f'AND({item},ISNUMBER($J{r}),$J{r}>$F{r})', 'loss'),
+        (f'AND({item},NOT(ISNUMBER($J{r})))', 'missing_cost'),
+        (f'AND({item},ISNUMBER($J{r}),$F{r}>0,($F{r}-$J{r})/$F{r}>={HIGH_MARGIN_RATIO})', 'high_margin'),
+    ]
+
+
+def _price_format(currency_symbol):
+    return f'"{currency_symbol}"#,##0.00' if currency_symbol else '#,##0.00'
+
+
+def _currency_symbol(currency):
+    currency = (currency or '').upper()
+    return CURRENCY_SYMBOLS.get(currency, currency) if currency else ''
+
+
+def _order_info_cells(order_data, show_header_info):
+    header_cells = order_data.get('header_cells', [])
+    if show_header_info and any(l or v for l, v in header_cells):
+        return header_cells
+    return []
+
+
+def _order_block_span(order_data, show_header_info):
+    """Bloğun (satır sayısı, TOTAL satırının blok içi ofseti)"""
+    info_rows = len(_order_info_cells(order_data, show_header_info)) or 1
+    total_offset = info_rows + 1 + len(order_data['data_rows']) + 1
+    return total_offset + 3, total_offset
+
+
+class _Formula(str):
+    """Bloğun kendi ürettiği formül; şablonda satır numaraları göreli işaretlenir."""
+    __slots__ = ()
+
+
+def _render_order_block(order_data, start_row, show_header_info, fx_rates):
+    """Bir sipariş bloğunu satır tamponuna çiz. (satırlar, item sayısı, (satış, alış) toplamı) döndürür.
+
+    Toplamlar bloğun TOTAL / COST TOTAL formüllerinin değeridir; Grand Summary'nin para
+    birimi alt toplamları hücreleri yeniden gezmeden bunlardan hesaplanır.
+    """
+    sale_currency = order_data['header_info'].get('currency', '').upper()
+    price_format = _price_format(_currency_symbol(sale_currency))
+    rows = []
+
+    # Sipariş bilgi satırı
+    info_text = ('Order: ' + order_data['file_name'], 'order_info', None)
+    header_cells = _order_info_cells(order_data, show_header_info)
+    if header_cells:
+        for i, (label, value) in enumerate(header_cells):
+            row = [None] * OUTPUT_COLS
+            if i == 0:
+                row[1] = info_text
+            if label or value:
+                clean_label = label.rstrip(' :')
+                row[7] = (f"{clean_label} : " if clean_label else '', 'info_label', None)
+                row[8] = (value, 'info_value', None)
+            rows.append(row)
+    else:
+        row = [None] * OUTPUT_COLS
+        row[1] = info_text
+        rows.append(row)
+
+    # Header satırı
+    rows.append([(h, 'header', None) for h in OUTPUT_HEADERS])
+
+    # Data satırları
+    data_start_row = start_row + len(rows)
+    r = data_start_row
+    sale_total = cost_total = 0.0
+    for item_count, data_row in enumerate(order_data['data_rows'], start=1):
+        # Veri sütunları: 0=NO, 1=DESC, 2=CODE, 3=QTTY, 4=UNIT, 5=U.PRICE, 6=T.PRICE, 7=REMARKS, 8=STOCK LOC, 9=COST
+        unit_cost_raw, cost_currency = _parse_cost(data_row[9] if len(data_row) > 9 else None)
+        unit_cost = _convert_cost(unit_cost_raw, cost_currency, sale_currency, fx_rates) if unit_cost_raw > 0 else 0.0
+        u_price = data_row[5] if len(data_row) > 5 else None
+        qty = _to_float(data_row[3] if len(data_row) > 3 else None)
+        sale_total += qty * _to_float(u_price)
+        cost_total += qty * (round(unit_cost, 2) if unit_cost > 0 else 0.0)
+        row = [(data_row[c] if c < len(data_row) else None, 'data', None) for c in range(9)]
+        row[0] = (item_count, 'data', None)
+        row[5] = (u_price, 'data', price_format if u_price is not None else None)
+        # T.PRICE = QTTY * U.PRICE
+        row[6] = (_Formula(f"=D{r}*F{r}"), 'data', price_format)
+        row.extend([
+            # U.COST (satış para birimine çevrilmiş birim maliyet)
+            (round(unit_cost, 2) if unit_cost > 0 else None, 'data', price_format),
+            # T.COST = QTTY * U.COST
+            (_Formula(f"=D{r}*J{r}"), 'data', price_format),
+        ])
+        rows.append(row)
+        r += 1
+
+    item_count = len(order_data['data_rows'])
+    rows.append([])
+
+    # TOTAL (satış) + COST TOTAL (alış - satış para biriminde)
+    row = [None] * (CURRENCY_KEY_COL + 1)
+    # Gizli L: sipariş para birimi — karışık para birimli Grand Summary bu anahtarla SUMIFS yapar
+    row[CURRENCY_KEY_COL] = (sale_currency, 'total_label', None) if sale_currency else None
+    row[5] = (TOTAL_LABEL, 'total_label', None)
+    row[6] = (_Formula(f"=SUM(G{data_start_row}:G{data_start_row + item_count - 1})"), 'total_value', price_format)
+    row[9] = (COST_TOTAL_LABEL, 'total_label', None)
+    row[10] = (_Formula(f"=SUM(K{data_start_row}:K{data_start_row + item_count - 1})"), 'total_value', price_format)
+    rows.append(row)
+    rows.extend([[], []])
+    return rows, item_count, (round(sale_total, 2), round(cost_total, 2))
+
+
+def _render_block_task(args):
+    """İşçi görevi: bloğu çiz ve XML şablonuna çevir. ((şablon, stiller, satır sayısı), item sayısı, toplamlar)"""
+    order_data, show_header_info, fx_rates = args
+    rows, item_count, totals = _render_order_block(order_data, 0, show_header_info, fx_rates)
+    return _block_template(rows), item_count, totals
+
+
+def _banner_texts(vessel_names, file_count, discount_pct):
+    """Banner'ın sipariş listesine bağlı iki satırı: (gemi satırı, bilgi satırı)"""
+    now_str = datetime.now().strftime('%d.%m.%Y %H:%M')
+    vessel_text = ' / '.join(vessel_names) if vessel_names else 'N/A'
+    disc_info = f'  |  Discount: %{discount_pct}' if discount_pct > 0 else ''
+    return f'VESSEL: {vessel_text}', f'Generated: {now_str}  |  Files: {file_count}{disc_info}'
+
+
+def _render_banner(vessel_value, info_value):
+    """Satır 1-5: başlık banner'ı. (satırlar, birleştirilmiş aralıklar, satır yükseklikleri)
+
+    Gemi ve bilgi satırı tüm siparişler okunmadan bilinmez; akışlı yazımda bunlar
+    SharedText yer tutucusu olarak verilir ve sonradan doldurulur.
+    """
+    rows = []
+    for value, style in [
+        ('MERGED ORDER SUMMARY', 'banner_title'),
+        (vessel_value, 'banner_vessel'),
+        (info_value, 'banner_info'),
+    ]:
+        rows.append([(value, style, None)] + [(None, f'{style}_fill', None)] * (OUTPUT_COLS - 1))
+    rows.append([(None, 'banner_gold', None)] * OUTPUT_COLS)
+    rows.append([])
+    merges = [f'A{r}:K{r}' for r in (1, 2, 3)]
+    heights = {1: 40, 2: 30, 3: 24, 4: 4}
+    return rows, merges, heights
+
+
+def _currency_subtotals(order_totals, fx_rates, reporting_currency):
+    """Sipariş toplamlarını para birimine göre tek geçişte topla ve rapor para birimine çevir.
+
+    order_totals: [(para birimi, satış, alış)]. Para birimi bilinmeyen siparişler rapor
+    para biriminde sayılır. Dönüş: [{'currency', 'orders', 'sale', 'cost', 'rate'}]
+    """
+    df = pd.DataFrame(order_totals, columns=['currency', 'sale', 'cost'])
+    df['currency'] = df['currency'].replace('', reporting_currency)
+    grouped = df.groupby('currency', sort=False).agg(
+        orders=('sale', 'size'), sale=('sale', 'sum'), cost=('cost', 'sum')
+    )
+    grouped['rate'] = [_fx_factor(cur, reporting_currency, fx_rates) for cur in grouped.index]
+    return [
+        {'currency': cur, 'orders': int(row.orders), 'sale': round(float(row.sale), 2),
+         'cost': round(float(row.cost), 2), 'rate': round(float(row.rate), 6)}
+        for cur, row in grouped.iterrows()
+    ]
+
+
+def _render_grand_summary(start_row, order_count, discount_pct, currency, subtotals=None,
+                          first_row=OUTPUT_FIRST_BLOCK_ROW):
+    """Grand Summary satırları. (satırlar, birleştirilmiş aralıklar)
+
+    Tek para biriminde toplamlar blok bölgesi (first_row .. start_row - 1) üzerinde
+    TOTAL / COST TOTAL etiketlerine göre SUMIF ile alınır; formül boyu sipariş
+    sayısından bağımsızdır. Karışık para birimlerinde (subtotals) önce para birimi
+    alt toplamları ve kurları yazılır: alt toplamlar TOTAL satırlarının gizli L sütunundaki
+    para birimine göre SUMIFS formülüdür (Excel'de kalem düzeltilince güncellenir),
+    toplamlar rapor para birimine (currency) çevrilmiş sütunlardan alınır.
+    """
+    summary_format = _price_format(_currency_symbol(currency))
+    rows, merges = [], []
+    row_num = start_row
+
+    # Ayırıcı çizgi
+    rows.append([(None, 'summary_separator', None)] * OUTPUT_COLS)
+    row_num += 1
+
+    # Başlık
+    disc_label = f"  |  İNDİRİM: %{discount_pct}" if discount_pct > 0 else ""
+    title = f'GRAND SUMMARY  —  {order_count} ORDERS{disc_label}'
+    rows.append([(title, 'summary_title', None)] + [(None, 'summary_title_fill', None)] * (OUTPUT_COLS - 1))
+    merges.append(f'A{row_num}:K{row_num}')
+    rows.append([])
+    row_num += 2
+
+    def _summary_row(label, formula, kind):
+        nonlocal row_num
+        if kind == 'summary':
+            label_style, label_fill, value_style, value_fill = 'summary_label', 'summary_label_fill', 'summary_value', 'summary_value_fill'
+        else:
+            label_style, value_style = f'{kind}_label', f'{kind}_value'
+            label_fill = value_fill = f'{kind}_fill'
+        row = [None] * 3 + [
+            (label, label_style, None), (None, label_fill, None), (None, label_fill, None),
+            (formula, value_style, summary_format), (None, value_fill, None),
+        ]
+        rows.append(row)
+        merges.extend([f'D{row_num}:F{row_num}', f'G{row_num}:H{row_num}'])
+        row_num += 1
+        return row_num - 1
+
+    if subtotals:
+        # Para birimi alt toplamları: D=P.B., E=sipariş, F/G=satış/alış, H=kur, I/J=rapor P.B.
+        rows.append([None] * 3 + [(h, 'header', None) for h in (
+            'P.B.', 'ORDERS', 'SATIŞ', 'ALIŞ', f'KUR ({currency})', f'SATIŞ ({currency})', f'ALIŞ ({currency})'
+        )])
+        row_num += 1
+        first_sub_row = row_num
+        last_block_row = start_row - 1
+        key_col = _COLUMN_LETTERS[CURRENCY_KEY_COL]
+        ccy_range = f'${key_col}${first_row}:${key_col}${last_block_row}'
+
+        def _sumifs(value_col, label_col, label, key):
+            return (f'SUMIFS(${value_col}${first_row}:${value_col}${last_block_row},'
+                    f'${label_col}${first_row}:${label_col}${last_block_row},"{label}",{ccy_range},"{key}")')
+
+        for sub in subtotals:
+            sub_format = _price_format(_currency_symbol(sub['currency']))
+            # Para birimi bilinmeyen siparişler (L boş) rapor para biriminde sayılır
+            keys = [sub['currency'], ''] if sub['currency'] == currency else [sub['currency']]
+            sale_sum = '=' + '+'.join(_sumifs('G', 'F', TOTAL_LABEL, k) for k in keys)
+            cost_sum = '=' + '+'.join(_sumifs('K', 'J', COST_TOTAL_LABEL, k) for k in keys)
+            rows.append([None] * 3 + [
+                (sub['currency'], 'data', None), (sub['orders'], 'data', None),
+                (sale_sum, 'data', sub_format), (cost_sum, 'data', sub_format),
+                (sub['rate'], 'data', '0.0000'),
+                (f'=F{row_num}*H{row_num}', 'data', summary_format),
+                (f'=G{row_num}*H{row_num}', 'data', summary_format),
+            ])
+            row_num += 1
+        last_sub_row = row_num - 1
+        rows.append([])
+        row_num += 1
+        sale_formula = f'=SUM(I{first_sub_row}:I{last_sub_row})'
+        cost_formula = f'=SUM(J{first_sub_row}:J{last_sub_row})'
+        total_suffix = f' ({currency})'
+    else:
+        last_block_row = start_row - 1
+        sale_formula = f'=SUMIF(F{first_row}:F{last_block_row},"{TOTAL_LABEL}",G{first_row}:G{last_block_row})'
+        cost_formula = f'=SUMIF(J{first_row}:J{last_block_row},"{COST_TOTAL_LABEL}",K{first_row}:K{last_block_row})'
+        total_suffix = ''
+
+    # TOPLAM SATIŞ / TOPLAM ALIŞ (satış ya da rapor para biriminde)
+    sale_total_row = _summary_row(f'TOPLAM SATIŞ{total_suffix} :', sale_formula, 'summary')
+    cost_total_row = _summary_row(f'TOPLAM ALIŞ{total_suffix} :', cost_formula, 'summary')
+
+    # İNDİRİM + FİNAL SATIŞ TUTARI (eğer varsa)
+    if discount_pct > 0:
+        disc_row = _summary_row(f'İNDİRİM ({discount_pct}%) :', f'=G{sale_total_row}*{discount_pct/100}', 'summary')
+        final_sale_row = _summary_row('FİNAL SATIŞ TUTARI :', f'=G{sale_total_row}-G{disc_row}', 'grand')
+    else:
+        final_sale_row = sale_total_row
+
+    # KÂR / ZARAR
+    rows.append([])
+    row_num += 1
+    _summary_row('KÂR / ZARAR :', f'=G{final_sale_row}-G{cost_total_row}', 'profit')
+    rows.append([])
+    return rows, merges
+
+
+class SharedText:
+    """Değeri yazım sonunda belli olan metin hücresi (sharedStrings üzerinden)."""
+
+    def __init__(self, key):
+        self.key = key
+
+
+_ILLEGAL_XML_CHARS = re.compile(r'[\000-\010\013\014\016-\037]')
+_COLUMN_LETTERS = [get_column_letter(i) for i in range(1, CURRENCY_KEY_COL + 2)]
+_SHEET_XML_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheetPr><outlinePr summaryBelow="1" summaryRight="1"/><pageSetUpPr/></sheetPr>'
+    '<sheetViews><sheetView showGridLines="0" workbookViewId="0">'
+    '<selection activeCell="A1" sqref="A1"/></sheetView></sheetViews>'
+    '<sheetFormatPr baseColWidth="8" defaultRowHeight="15"/>'
+)
+_DATE_FORMATS = {datetime: 'yyyy-mm-dd h:mm:ss', date: 'yyyy-mm-dd', dt_time: 'h:mm:ss', timedelta: '[hh]:mm:ss'}
+# Şablon işareti: yazdırılamaz kontrol karakterleri metinden zaten silinir, çakışmaz
+_TEMPLATE_MARK = '\x02'
+_FORMULA_ROW = re.compile(r'(?<=[A-Z])(\d+)')
+
+
+def _cell_xml(ref, value, style_key, number_format, style_id, mark_rows=False):
+    """Tek hücrenin XML'i; style_id(stil_anahtarı, sayı_formatı) stil kimliğini verir.
+
+    mark_rows açıksa _Formula içindeki satır numaraları şablon işaretiyle sarılır.
+    """
+    if isinstance(value, (datetime, date, dt_time, timedelta)):
+        number_format = number_format or _DATE_FORMATS[type(value) if type(value) in _DATE_FORMATS else datetime]
+        value = to_excel(value)
+    sid = style_id(style_key, number_format)
+    if value is None:
+        return f'<c r="{ref}" s="{sid}"/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}" s="{sid}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if isinstance(value, float) and (value != value or value in (float('inf'), float('-inf'))):
+            return f'<c r="{ref}" s="{sid}"/>'
+        return f'<c r="{ref}" s="{sid}"><v>{value!r}</v></c>'
+    if hasattr(value, 'item'):
+        return _cell_xml(ref, value.item(), style_key, number_format, style_id, mark_rows)
+    text = _ILLEGAL_XML_CHARS.sub('', str(value))
+    if text.startswith('=') and len(text) > 1:
+        formula = xml_escape(text[1:])
+        if mark_rows and isinstance(value, _Formula):
+            formula = _FORMULA_ROW.sub(f'{_TEMPLATE_MARK}\\1{_TEMPLATE_MARK}', formula)
+        return f'<c r="{ref}" s="{sid}"><f>{formula}</f><v></v></c>'
+    space = ' xml:space="preserve"' if text != text.strip() else ''
+    return f'<c r="{ref}" s="{sid}" t="inlineStr"><is><t{space}>{xml_escape(text)}</t></is></c>'
+
+
+def _block_template(rows):
+    """0. satırdan çizilmiş blok tamponunu satır numarasından bağımsız XML şablonuna çevir.
+
+    Satır numaraları \\x02ofset\\x02, stil kimlikleri \\x02sN\\x02 olarak işaretlenir;
+    yerleştirme StreamingSheetWriter.place_block ile tek geçişte yapılır. İşçi süreçte çalışır.
+    Dönüş: (şablon baytları, [(stil anahtarı, sayı formatı)], satır sayısı)
+    """
+    styles = {}
+
+    def style_id(style_key, number_format):
+        key = (style_key, number_format)
+        mark = styles.get(key)
+        if mark is None:
+            mark = styles[key] = f'{_TEMPLATE_MARK}s{len(styles)}{_TEMPLATE_MARK}'
+        return mark
+
+    parts = []
+    for offset, row in enumerate(rows):
+        label = f'{_TEMPLATE_MARK}{offset}{_TEMPLATE_MARK}'
+        cells = [
+            _cell_xml(f'{_COLUMN_LETTERS[c]}{label}', *spec, style_id, True)
+            for c, spec in enumerate(row) if spec is not None
+        ]
+        if cells:
+            parts.append(f'<row r="{label}">{"".join(cells)}</row>')
+    return ''.join(parts).encode('utf-8'), list(styles), len(rows)
+
+
+class StreamingSheetWriter:
+    """Çıktı xlsx'ini tek çalışma sayfası olarak doğrudan zip'e akıtır.
+
+    Satır tamponları ``serialize_rows`` ile XML'e çevrilir, ``write`` ile sıkıştırılarak
+    yazılır; ikisi farklı thread'lerden çağrılabilir. Stiller, çalışma kitabı XML'i ve
+    içerik tipleri sonda openpyxl ile üretilen iskelet kitaptan kopyalanır.
+    """
+
+    SHEET_PATH = 'xl/worksheets/sheet1.xml'
+    SHARED_STRINGS_PATH = 'xl/sharedStrings.xml'
+
+    def __init__(self, out_file, title="Merged Order Summary", compresslevel=None):
+        self.title = title
+        self.compresslevel = ZIP_COMPRESSLEVEL if compresslevel is None else compresslevel
+        self.row_count = 0
+        self.bytes_in = 0
+        self._merges = []
+        self._conditional = []
+        self._shared_keys = {}
+        self._styles = _output_styles()
+        self._style_ids = {}
+        # İskelet kitap: stil kaydı ve workbook.xml / rels / content types için
+        self._scaffold = Workbook(write_only=True)
+        self._scaffold_ws = self._scaffold.create_sheet(title)
+        self._zip = zipfile.ZipFile(out_file, 'w', zipfile.ZIP_DEFLATED, compresslevel=self.compresslevel)
+        self._sheet = self._zip.open(self.SHEET_PATH, 'w', force_zip64=True)
+        cols = ''.join(
+            f'<col min="{i}" max="{i}" width="{OUTPUT_COLUMN_WIDTHS[letter]}" customWidth="1"/>'
+            for i, letter in enumerate(_COLUMN_LETTERS[:OUTPUT_COLS], start=1)
+        )
+        cols += f'<col min="{CURRENCY_KEY_COL + 1}" max="{CURRENCY_KEY_COL + 1}" width="8" hidden="1" customWidth="1"/>'
+        self.write((_SHEET_XML_HEAD + f'<cols>{cols}</cols><sheetData>').encode('utf-8'))
+
+    def style_id(self, style_key, number_format=None):
+        key = (style_key, number_format)
+        sid = self._style_ids.get(key)
+        if sid is None:
+            proto = WriteOnlyCell(self._scaffold_ws)
+            for attr, value in self._styles[style_key].items():
+                setattr(proto, attr, value)
+            if number_format:
+                proto.number_format = number_format
+            sid = self._style_ids[key] = self._scaffold._cell_styles.add(proto._style)
+        return sid
+
+    def _cell_xml(self, ref, value, style_key, number_format):
+        if isinstance(value, SharedText):
+            idx = self._shared_keys.setdefault(value.key, len(self._shared_keys))
+            return f'<c r="{ref}" s="{self.style_id(style_key, number_format)}" t="s"><v>{idx}</v></c>'
+        return _cell_xml(ref, value, style_key, number_format, self.style_id)
+
+    def serialize_rows(self, rows, first_row, heights=None):
+        """Satır tamponunu first_row'dan başlayarak sheetData XML'ine çevir."""
+        parts = []
+        for row_num, row in enumerate(rows, start=first_row):
+            cells = [
+                self._cell_xml(f'{_COLUMN_LETTERS[c]}{row_num}', *spec)
+                for c, spec in enumerate(row) if spec is not None
+            ]
+            height = heights.get(row_num) if heights else None
+            if not cells and height is None:
+                continue
+            attrs = f' ht="{height}" customHeight="1"' if height is not None else ''
+            parts.append(f'<row r="{row_num}"{attrs}>{"".join(cells)}</row>')
+        self.row_count = max(self.row_count, first_row + len(rows) - 1)
+        return ''.join(parts).encode('utf-8')
+
+    def place_block(self, template, style_keys, row_count, first_row):
+        """_block_template şablonunu first_row'dan başlayarak sheetData XML'ine çevir."""
+        labels = {str(i).encode(): str(first_row + i).encode() for i in range(row_count)}
+        for i, key in enumerate(style_keys):
+            labels[f's{i}'.encode()] = str(self.style_id(*key)).encode()
+        parts = template.split(_TEMPLATE_MARK.encode())
+        parts[1::2] = [labels[p] for p in parts[1::2]]
+        self.row_count = max(self.row_count, first_row + row_count - 1)
+        return b''.join(parts)
+
+    def write(self, data):
+        self.bytes_in += len(data)
+        self._sheet.write(data)
+
+    def merge(self, ranges):
+        self._merges.extend(ranges)
+
+    def conditional_format(self, sqref, rules):
+        """Aralığa ifade tabanlı koşullu biçim ekle; rules [(formül, vurgu anahtarı)]."""
+        self._conditional.append((sqref, rules))
+
+    def finish(self, shared_values):
+        """Sayfayı kapat; sharedStrings ve iskelet kitabın diğer parçalarını ekle."""
+        tail = '</sheetData>'
+        if self._merges:
+            tail += f'<mergeCells count="{len(self._merges)}">'
+            tail += ''.join(f'<mergeCell ref="{r}"/>' for r in self._merges)
+            tail += '</mergeCells>'
+        tail += self._sheet_tail()
+        tail += '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/></worksheet>'
+        self.write(tail.encode('utf-8'))
+        self._sheet.close()
+
+        strings = [''] * len(self._shared_keys)
+        for key, idx in self._shared_keys.items():
+            strings[idx] = _ILLEGAL_XML_CHARS.sub('', str(shared_values.get(key, '')))
+        sst = ''.join(f'<si><t xml:space="preserve">{xml_escape(t)}</t></si>' for t in strings)
+        self._zip.writestr(self.SHARED_STRINGS_PATH, (
+            '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+            '<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+            f'count="{len(strings)}" uniqueCount="{len(strings)}">{sst}</sst>'
+        ))
+
+        # İskelet kitap: styles.xml, workbook.xml (yazdırma alanı), rels ve content types
+        self._scaffold_ws.print_area = f'A1:K{max(self.row_count, 1)}'
+        buf = io.BytesIO()
+        self._scaffold.save(buf)
+        with zipfile.ZipFile(buf) as scaffold:
+            for name in scaffold.namelist():
+                if name in (self.SHEET_PATH, self.SHARED_STRINGS_PATH):
+                    continue
+                data = scaffold.read(name)
+                if name == '[Content_Types].xml':
+                    data = self._with_shared_strings_type(data)
+                elif name == 'xl/_rels/workbook.xml.rels':
+                    data = self._with_shared_strings_rel(data)
+                self._zip.writestr(name, data)
+        self._zip.close()
+
+    def _with_shared_strings_type(self, data):
+        ns = 'http://schemas.openxmlformats.org/package/2006/content-types'
+        root = ET.fromstring(data)
+        part = '/' + self.SHARED_STRINGS_PATH
+        if not any(el.get('PartName') == part for el in root):
+            ET.SubElement(root, f'{{{ns}}}Override', PartName=part, ContentType=(
+                'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'))
+        ET.register_namespace('', ns)
+        return ET.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+    def _with_shared_strings_rel(self, data):
+        ns = _PKG_REL_NS.strip('{}')
+        rel_type = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+        root = ET.fromstring(data)
+        if not any(el.get('Type') == rel_type for el in root):
+            ids = {el.get('Id') for el in root}
+            n = len(ids) + 1
+            while f'rId{n}' in ids:
+                n += 1
+            ET.SubElement(root, f'{{{ns}}}Relationship', Type=rel_type, Target='sharedStrings.xml', Id=f'rId{n}')
+        ET.register_namespace('', ns)
+        return ET.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+    def _sheet_tail(self):
+        """mergeCells ile pageMargins arasına eklenecek ek sayfa XML'i (koşullu biçimler)."""
+        if not self._conditional:
+            return ''
+        styles = _highlight_styles()
+        dxfs = self._scaffold._differential_styles
+        parts = []
+        priority = 0
+        for sqref, rules in self._conditional:
+            parts.append(f'<conditionalFormatting sqref="{sqref}">')
+            for formula, key in rules:
+                priority += 1
+                dxf_id = dxfs.add(DifferentialStyle(**styles[key]))
+                parts.append(
+                    f'<cfRule type="expression" dxfId="{dxf_id}" priority="{priority}" stopIfTrue="1">'
+                    f'<formula>{xml_escape(formula)}</formula></cfRule>'
+                )
+            parts.append('</conditionalFormatting>')
+        return ''.join(parts)
+
+    def abort(self):
+        try:
+            self._sheet.close()
+        except Exception:
+            pass
+        try:
+            self._zip.close()
+        except Exception:
+            pass
+
+
+def _output_filename(vessel_names, when=None):
+    """Çıktı dosya adı: GemiIsmi_tarih.xlsx"""
+    date_str = (when or datetime.now()).strftime('%d-%m-%Y')
+    if vessel_names:
+        vessel_str = '_'.join(vessel_names)
+        vessel_str = re.sub(r'[<>:"/\\|?*]', '', vessel_str).strip()
+        return f'{vessel_str}_{date_str}.xlsx'
+    return f'MERGED_ORDER_SUMMARY_{date_str}.xlsx'
+
+
+# ── Çıktı Yazımı (geçici dosya + atomik taşıma) ──────────────
+
+OUTPUT_TEMP_PREFIX = '.~merge_'
+OUTPUT_MAX_SUFFIX = 99
+OUTPUT_STALE_TEMP_SECONDS = 24 * 3600
+
+
+def _is_file_locked(file_path):
+    """Dosya başka bir program (ör. Excel) tarafından açık mı?"""
+    file_path = Path(file_path)
+    if not file_path.exists():
+        return False
+    try:
+        with open(file_path, 'r+b'):
+            return False
+    except (IOError, PermissionError):
+        return True
+
+
+class OutputCommit:
+    """Birleştirme hedef klasörde geçici dosyaya akar; bitince hedefe atomik taşınır.
+
+    Hedef açık/kilitliyse biten iş atılmaz: 'Ad (2).xlsx' gibi ek adla kaydedilir.
+    """
+
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        # Eski yarım geçici dosyaları temizle (çökme/kapanma artığı; süren işlere dokunmaz)
+        cutoff = time.time() - OUTPUT_STALE_TEMP_SECONDS
+        for stale in self.output_dir.glob(OUTPUT_TEMP_PREFIX + '*.xlsx'):
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink()
+            except OSError:
+                pass
+        with tempfile.NamedTemporaryFile(dir=self.output_dir, prefix=OUTPUT_TEMP_PREFIX,
+                                         suffix='.xlsx', delete=False) as tmp:
+            self.temp_path = Path(tmp.name)
+        self.final_path = None
+        self.redirected_from = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
+
+    def locked_outputs(self):
+        """Klasörde şu an açık olan .xlsx dosyaları (birleştirme öncesi uyarı için)."""
+        locked = []
+        for candidate in self.output_dir.glob('*.xlsx'):
+            if candidate.name.startswith(OUTPUT_TEMP_PREFIX) or candidate.name.startswith('~$'):
+                continue
+            if _is_file_locked(candidate):
+                locked.append(candidate)
+        return locked
+
+    def _candidates(self, target):
+        yield target
+        for n in range(2, OUTPUT_MAX_SUFFIX + 1):
+            yield target.with_name(f'{target.stem} ({n}){target.suffix}')
+
+    def commit(self, file_name):
+        """Geçici dosyayı hedefe taşı; kilitliyse ilk boş ek adı kullan. Son yolu döndürür.
+
+        Hedefin kendisi (kilitli değilse) üzerine yazılır; ek adlar ise yalnızca boşsa
+        kullanılır — önceki bir ek adlı çıktı ezilmez. Ek ad önce özel oluşturmayla
+        (O_EXCL) ayrılır ki iki birleştirme aynı adı almasın.
+        """
+        target = self.output_dir / file_name
+        last_error = None
+        for candidate in self._candidates(target):
+            if candidate != target:
+                try:
+                    with open(candidate, 'xb'):
+                        pass
+                except FileExistsError:
+                    continue
+                except OSError as e:
+                    last_error = e
+                    continue
+            elif _is_file_locked(candidate):
+                continue
+            try:
+                os.replace(self.temp_path, candidate)
+            except PermissionError as e:
+                if candidate != target:
+                    with contextlib.suppress(OSError):
+                        candidate.unlink()
+                # Kontrol ile taşıma arasında açılmış olabilir (Windows'ta replace reddedilir)
+                last_error = e
+                continue
+            self.final_path = candidate
+            if candidate != target:
+                self.redirected_from = target
+            return candidate
+        raise last_error or PermissionError(f"Çıktı dosyası yazılamadı: {target}")
+
+    def discard(self):
+        if self.final_path is None:
+            try:
+                self.temp_path.unlink()
+            except OSError:
+                pass
+
+
+# ── Bellek Bütçesi (diske taşma) ─────────────────────────────
+#
+# Akışlı yazımda çıktı bellekte tutulmaz; birleştirme boyunca biriken tek şey geçmiş
+# kaydı için saklanan ayrıştırılmış siparişlerdir. Bunların yaklaşık boyutu bütçeyi
+# aşınca en eski siparişler geçici dosyaya taşınır ve sonradan aynı sırayla geri okunur.
+# Artımlı manifest siparişleri diskte tutar, bütçeyi aşmaz. Servis modundaki paylaşılan
+# okuma önbelleği (SharedParseCache) ise işler arası paylaşım için siparişleri bellekte
+# tutar; bütçe onu kapsamaz, sınırı SERVICE_CACHE_SIZE dosyadır.
+
+MEMORY_BUDGET_MB = 512
+_CELL_OVERHEAD_BYTES = 72
+_ORDER_OVERHEAD_BYTES = 2048
+
+
+def _approx_order_bytes(order_data):
+    """Ayrıştırılmış siparişin yaklaşık bellek kullanımı (hücre başı sabit + metin boyu)."""
+    size = _ORDER_OVERHEAD_BYTES
+    for row in order_data['data_rows']:
+        size += _CELL_OVERHEAD_BYTES * len(row)
+        size += sum(len(v) for v in row if isinstance(v, str))
+    return size
+
+
+class SpillingOrderList:
+    """Siparişleri sırasıyla tutan liste; bütçe aşılınca eskileri geçici dosyaya yazar.
+
+    Sadece sona ekleme, uzunluk ve baştan sona (tekrar tekrar) gezme desteklenir.
+    """
+
+    def __init__(self, budget_mb=MEMORY_BUDGET_MB, spill_dir=None):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self.spilled = 0
+        self.spilled_bytes = 0
+        self._memory = deque()
+        self._memory_bytes = 0
+        self._file = None
+
+    def append(self, order_data):
+        size = _approx_order_bytes(order_data)
+        self._memory.append((order_data, size))
+        self._memory_bytes += size
+        while self._memory_bytes > self.budget_bytes and len(self._memory) > 1:
+            oldest, oldest_size = self._memory.popleft()
+            self._memory_bytes -= oldest_size
+            self._spill(oldest)
+
+    def _spill(self, order_data):
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(dir=self.spill_dir, prefix='.~orders_')
+        self._file.seek(0, os.SEEK_END)
+        pickle.dump(order_data, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+        self.spilled += 1
+        self.spilled_bytes = self._file.tell()
+
+    def __len__(self):
+        return self.spilled + len(self._memory)
+
+    def __iter__(self):
+        if self._file is not None:
+            self._file.seek(0)
+            for _ in range(self.spilled):
+                yield pickle.load(self._file)
+        for order_data, _ in list(self._memory):
+            yield order_data
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+# ── Profil Modu ──────────────────────────────────────────────
+#
+# ORDER_MERGER_PROFILE=1 (veya bir klasör yolu) ya da --profile ile açılır. Kapalıyken
+# tek maliyet _profile_run / _profiled içindeki bir kontroldür. Açıkken çalıştırmanın
+# her thread'i kendi cProfile'ı ile ölçülüp tek pstats dosyasında birleştirilir; ayrıca
+# ilgili thread'ler örneklenip flamegraph.pl / speedscope uyumlu collapsed-stack yazılır.
+# Python 3.12+ cProfile sys.monitoring üzerinden tüm thread'leri tek profilde ölçer ve
+# aynı anda ikinci profile izin vermez; orada yalnızca ana profil açılır.
+
+PROFILE_ENV = 'ORDER_MERGER_PROFILE'
+PROFILE_DIR = _get_script_dir() / 'profiles'
+PROFILE_SAMPLE_INTERVAL = 0.005
+PROFILE_TOP_N = 5
+_PROFILE_IDLE = ('acquire', 'wait', 'sleep', 'select', 'poll')
+_PROFILE_PER_THREAD = sys.version_info < (3, 12)
+
+_profiling = threading.local()
+
+
+def _profile_dir():
+    """Profil modu açıksa çıktı klasörü, kapalıysa None."""
+    value = os.environ.get(PROFILE_ENV, '').strip()
+    if not value or value.lower() in ('0', 'false', 'no', 'off'):
+        return None
+    if value.lower() in ('1', 'true', 'yes', 'on'):
+        return PROFILE_DIR
+    return Path(value)
+
+
+def _current_profiler():
+    return getattr(_profiling, 'current', None)
+
+
+def _profiled(fn):
+    """Aktif profil varsa fn'i yeni thread'de de ölçülecek şekilde sar; yoksa aynen döndür."""
+    profiler = _current_profiler()
+    return profiler.wrap(fn) if profiler is not None else fn
+
+
+def _profile_run(name):
+    """Profil modu açıksa RunProfiler, kapalıysa boş context döndür."""
+    out_dir = _profile_dir()
+    return RunProfiler(name, out_dir) if out_dir is not None else contextlib.nullcontext()
+
+
+class RunProfiler:
+    """Bir çalıştırmayı (birleştirme / tarama) profiller; .pstats ve .collapsed.txt yazar."""
+
+    def __init__(self, name, out_dir, interval=PROFILE_SAMPLE_INTERVAL):
+        self.name = name
+        self.out_dir = Path(out_dir)
+        self.interval = interval
+        self.pstats_path = None
+        self.collapsed_path = None
+        self.top = []
+        self._profiles = []
+        self._threads = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+
+    def _register(self, profile=None):
+        with self._lock:
+            if profile is not None:
+                self._profiles.append(profile)
+            self._threads[threading.get_ident()] = threading.current_thread().name
+
+    def wrap(self, fn):
+        def run(*args, **kwargs):
+            profile = None
+            _profiling.current = self
+            try:
+                if _PROFILE_PER_THREAD:
+                    try:
+                        profile = cProfile.Profile()
+                        profile.enable()
+                    except ValueError:
+                        profile = None  # başka profil aracı açık: yalnızca örnekleyici ölçer
+                self._register(profile)
+                return fn(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                _profiling.current = None
+        return run
+
+    def __enter__(self):
+        self._previous = _current_profiler()
+        _profiling.current = self
+        self._main = cProfile.Profile()
+        self._sampler = threading.Thread(target=self._sample_loop, daemon=True)
+        self._sampler.start()
+        try:
+            self._main.enable()
+        except ValueError:
+            self._main = None  # başka profil aracı açık: yalnızca örnekleyici ölçer
+        self._register(self._main)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._main is not None:
+            self._main.disable()
+        self._stop.set()
+        self._sampler.join()
+        _profiling.current = self._previous
+        try:
+            self._write()
+        except Exception:
+            pass
+        return False
+
+    def _sample_loop(self):
+        while not self._stop.wait(self.interval):
+            with self._lock:
+                threads = dict(self._threads)
+            for ident, frame in sys._current_frames().items():
+                if ident not in threads:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(threads[ident])
+                key = ';'.join(reversed(stack))
+                self._samples[key] = self._samples.get(key, 0) + 1
+
+    def _write(self):
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        base = self.out_dir / f"{self.name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        self.collapsed_path = base.with_suffix('.collapsed.txt')
+        with open(self.collapsed_path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self._samples.items()):
+                f.write(f'{stack} {count}\n')
+        if not self._profiles:
+            return
+        stats = pstats.Stats(self._profiles[0])
+        for profile in self._profiles[1:]:
+            try:
+                stats.add(profile)
+            except TypeError:
+                pass  # hiç çalışmamış thread profili boştur
+        self.pstats_path = base.with_suffix('.pstats')
+        stats.dump_stats(str(self.pstats_path))
+
+        hot = []
+        for (file_name, line, func), (_, _, tottime, _, _) in stats.stats.items():
+            if file_name == '~' and any(word in func for word in _PROFILE_IDLE):
+                continue
+            label = func if file_name == '~' else f'{func} ({Path(file_name).name}:{line})'
+            hot.append((tottime, label))
+        hot.sort(reverse=True)
+        self.top = hot[:PROFILE_TOP_N]
+
+    def summary(self):
+        if not self.top:
+            return ''
+        hot = ', '.join(f'{label} {t:.2f}s' for t, label in self.top)
+        return f'🔥 {hot}\n🗂 {self.pstats_path}'
+
+
+# ── Birleştirme Hattı (Pipeline) ─────────────────────────────
+#
+# Okuma, çizim (+XML) ve sıkıştırarak yazma aşamaları sınırlı kuyruklarla bağlı
+# ayrı thread'lerde eşzamanlı çalışır. Çok dosyada okuma ve çizim süreç havuzuna
+# sıralı pencere ile dağıtılır. Uçtan uca süre aşamaların toplamı yerine en yavaş
+# aşamaya yaklaşır.
+
+PIPELINE_QUEUE_SIZE = 16
+PARALLEL_PARSE_MIN_FILES = 8
+ZIP_COMPRESSLEVEL = 6
+ZIP_COMPRESSION_CHOICES = {'Hızlı (1)': 1, 'Normal (6)': 6, 'Maksimum (9)': 9}
+_STAGE_DONE = object()
+
+
+class _StageError:
+    def __init__(self, exc):
+        self.exc = exc
+
+
+class PipelineStats:
+    """Aşama başına işlenen bayt ve aktif süre."""
+
+    STAGE_LABELS = {'parse': 'Okuma', 'render': 'Çizim', 'write': 'Yazma'}
+
+    def __init__(self):
+        self.stages = {name: {'bytes': 0, 'start': None, 'end': None} for name in self.STAGE_LABELS}
+        self.started = time.perf_counter()
+        self.finished = None
+
+    def add(self, stage, nbytes):
+        st = self.stages[stage]
+        now = time.perf_counter()
+        if st['start'] is None:
+            st['start'] = now
+        st['end'] = now
+        st['bytes'] += nbytes
+
+    def begin(self, stage):
+        if self.stages[stage]['start'] is None:
+            self.stages[stage]['start'] = time.perf_counter()
+
+    def mb_per_s(self, stage):
+        st = self.stages[stage]
+        if st['start'] is None or st['end'] is None or st['end'] <= st['start']:
+            return 0.0
+        return st['bytes'] / 1e6 / (st['end'] - st['start'])
+
+    def summary(self):
+        parts = [f"{label} {self.mb_per_s(name):.1f} MB/s" for name, label in self.STAGE_LABELS.items()]
+        total = (self.finished or time.perf_counter()) - self.started
+        return ' | '.join(parts) + f' | Toplam {total:.1f} sn'
+
+
+def _put(q, item, stop):
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop, producer=None):
+    """Kuyruktan al; üretici thread sonuç bırakmadan ölmüşse sonsuza dek beklemek yerine hata ver."""
+    while True:
+        try:
+            item = q.get(timeout=0.1)
+        except queue.Empty:
+            if stop.is_set():
+                return _STAGE_DONE
+            thread = producer() if callable(producer) else producer
+            if thread is not None and not thread.is_alive():
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    raise RuntimeError(f"'{thread.name}' aşaması sonuç vermeden durdu") from None
+            else:
+                continue
+        if isinstance(item, _StageError):
+            raise item.exc
+        return item
+
+
+def _ordered_window(items, submit, run, max_inflight, checkpoint=None):
+    """items'ı sırayla işle; submit verilirse en fazla max_inflight iş havuzda beklesin.
+
+    checkpoint her öğede ve havuz sonucu beklenirken kısa aralıklarla çağrılır (iptal).
+    """
+    def result(item, fut):
+        if checkpoint is not None:
+            checkpoint()
+        if fut is None:
+            return run(item)
+        while True:
+            try:
+                return fut.result(timeout=0.1)
+            except FuturesTimeout:
+                if checkpoint is not None:
+                    checkpoint()
+
+    window = deque()
+    for item in items:
+        window.append((item, submit(item) if submit else None))
+        while len(window) > (max_inflight if submit else 0):
+            item, fut = window.popleft()
+            yield item, result(item, fut)
+    while window:
+        item, fut = window.popleft()
+        yield item, result(item, fut)
+
+
+def _safe_extract_orders(file_path, cancel=None):
+    try:
+        return _extract_orders(file_path, cancel=cancel)
+    except MergeCancelled:
+        raise
+    except Exception:
+        return []
+
+
+def _merge_pipeline(files, out_file, discount_pct, fx_rates, show_header_info=True, manifest=None,
+                    compresslevel=None, workers=None, queue_size=PIPELINE_QUEUE_SIZE, parse=None,
+                    progress=None, pool=None, parse_cache=None, reporting_currency=REPORTING_CURRENCY,
+                    memory_budget_mb=MEMORY_BUDGET_MB, cancel=None, highlight=True):
+    """Dosyaları okuyup birleştirilmiş xlsx'i out_file'a akışlı yazar.
+
+    cancel (CancelToken) dosya, blok ve yazma parçası başına ve uzun taramalarda her
+    CANCEL_CHECK_ROWS satırda kontrol edilir; iptalde MergeCancelled yükselir ve
+    yarım dosya kapatılır (silmek çağıranın işidir, bkz. OutputCommit).
+
+    Okunan siparişler geçmiş kaydı için memory_budget_mb'yi aşarsa diske taşan bir
+    SpillingOrderList'te tutulur (başarıda çağıran close() etmelidir; hata ve iptalde
+    burada kapatılır).
+    highlight açıksa blok bölgesine vurgu kuralları (koşullu biçim) eklenir.
+    progress(oran) blok başına (yüzde değiştikçe) çağrılır. pool verilirse o süreç
+    havuzu kullanılır ve kapatılmaz; parse_cache contains/lookup/store ile okunan
+    siparişleri paylaşır (servis modu). manifest verilirse değişmeyen dosyaların
+    siparişleri ve blok şablonları ondan alınır, yenileri ona yazılır.
+    Dönüş: {'total_items', 'vessel_names', 'orders', 'stats', 'missing_rates'}
+    missing_rates: çeviri gerektiği halde fx_rates'te kuru olmayan para birimleri (1.0 sayıldı).
+    """
+    local_parse = parse or (lambda path: _safe_extract_orders(path, cancel))
+    parse = parse or _safe_extract_orders
+    stats = PipelineStats()
+    stop = threading.Event()
+    completed = False
+
+    def checkpoint():
+        if cancel is not None:
+            cancel.check()
+        if stop.is_set():
+            raise MergeCancelled("Birleştirme durduruldu")
+    q_orders = queue.Queue(maxsize=queue_size)
+    q_bytes = queue.Queue(maxsize=queue_size)
+    writer = StreamingSheetWriter(out_file, compresslevel=compresslevel)
+    spill_dir = Path(out_file).parent
+    result = {'total_items': 0, 'vessel_names': [], 'stats': stats, 'missing_rates': [],
+              'orders': SpillingOrderList(memory_budget_mb, spill_dir if spill_dir.is_dir() else None)}
+
+    caches = [c for c in (manifest, parse_cache) if c is not None]
+    # Önbellekteki dosyalar burada yüklenmez; siparişleri okuma aşamasında sırası gelince alınır
+    cached = {}
+    for path in files:
+        for cache in caches:
+            if cache.contains(path):
+                cached[path] = cache
+                break
+    misses = len(files) - len(cached)
+    max_workers = workers or os.cpu_count() or 1
+    if _current_profiler() is not None:
+        # Profilde okuma/çizim süreç havuzu yerine bu süreçte çalışsın ki ölçülebilsin
+        max_workers, pool = 1, None
+    own_pool = pool is None
+    if own_pool:
+        use_pool = max_workers > 1 and (misses >= PARALLEL_PARSE_MIN_FILES or len(files) >= PARALLEL_RENDER_MIN_ORDERS)
+        try:
+            pool = ProcessPoolExecutor(max_workers=max_workers) if use_pool else None
+        except (OSError, NotImplementedError):
+            pool = None
+    inflight = max_workers * 2
+    reported = [-1]
+
+    def report(done):
+        if progress is None:
+            return
+        pct = int(100 * done / max(len(files), 1))
+        if pct != reported[0]:
+            reported[0] = pct
+            progress(min(pct, 100) / 100)
+
+    def parse_stage():
+        try:
+            stats.begin('parse')
+
+            def submit(path):
+                if path in cached or pool is None:
+                    return None
+                # Kopya sürüyorsa bekle (işçi süreç kaynağı ağdan ikinci kez okumasın) ve
+                # okuma bitene dek sabitle ki bütçe temizliği kopyayı silmesin
+                with contextlib.ExitStack() as pin:
+                    pin.enter_context(_pinned_input(path, cancel))
+                    future = pool.submit(parse, path)
+                    release = pin.pop_all()
+                    future.add_done_callback(lambda _f: release.close())
+                return future
+
+            def run(path):
+                if path in cached:
+                    file_orders = cached[path].lookup(path)
+                    if file_orders is not None:
+                        return file_orders
+                    del cached[path]   # bu arada değişti: yeniden oku
+                with _pinned_input(path, cancel):
+                    return local_parse(path)
+
+            for path, file_orders in _ordered_window(files, submit if pool else None, run, inflight, checkpoint):
+                if path not in cached:
+                    for cache in caches:
+                        cache.store(path, file_orders)
+                stats.add('parse', _input_size(path) if path not in cached else 0)
+                for order_data in file_orders:
+                    if not _put(q_orders, order_data, stop):
+                        return
+            _put(q_orders, _STAGE_DONE, stop)
+        except BaseException as e:
+            _put(q_orders, _StageError(e), stop)
+
+    def render_stage():
+        try:
+            stats.begin('render')
+            rows, merges, heights = _render_banner(SharedText('vessel'), SharedText('info'))
+            writer.merge(merges)
+            _put(q_bytes, writer.serialize_rows(rows, 1, heights), stop)
+
+            def orders():
+                start_row = OUTPUT_FIRST_BLOCK_ROW
+                while True:
+                    order_data = _get(q_orders, stop, lambda: stage_threads.get('parse'))
+                    if order_data is _STAGE_DONE:
+                        return
+                    result['orders'].append(order_data)
+                    rate_currencies.update(_order_rate_currencies(order_data))
+                    v = order_data['header_info'].get('vessel', '')
+                    if v and v not in result['vessel_names']:
+                        result['vessel_names'].append(v)
+                    yield order_data, start_row
+                    start_row += _order_block_span(order_data, show_header_info)[0]
+
+            def task(item):
+                return (item[0], show_header_info, fx_rates)
+
+            def lookup(item):
+                if manifest is None:
+                    return None, None
+                key = manifest.block_key(item[0], show_header_info, fx_rates)
+                return key, manifest.get_block(key)
+
+            def submit(item):
+                key, block = lookup(item)
+                if block is not None:
+                    return _ReadyFuture((key, block, False))
+                return _KeyedFuture(key, pool.submit(_render_block_task, task(item)))
+
+            def run(item):
+                key, block = lookup(item)
+                if block is not None:
+                    return key, block, False
+                return key, _render_block_task(task(item)), True
+
+            next_row = OUTPUT_FIRST_BLOCK_ROW
+            done = 0
+            order_totals = []
+            rate_currencies = set()
+            for (order_data, start_row), (key, block, rendered) in _ordered_window(
+                    orders(), submit if pool else None, run, inflight, checkpoint):
+                if manifest is not None and rendered:
+                    manifest.put_block(key, block)
+                (template, style_keys, row_count), item_count, (sale_total, cost_total) = block
+                result['total_items'] += item_count
+                currency = order_data['header_info'].get('currency', '').upper()
+                order_totals.append((currency, sale_total, cost_total))
+                data = writer.place_block(template, style_keys, row_count, start_row)
+                stats.add('render', len(data))
+                next_row = start_row + row_count
+                done += 1
+                report(done)
+                if not _put(q_bytes, data, stop):
+                    return
+
+            if highlight and next_row > OUTPUT_FIRST_BLOCK_ROW:
+                writer.conditional_format(f'A{OUTPUT_FIRST_BLOCK_ROW}:K{next_row - 1}', _highlight_rules())
+
+            # ── GRAND SUMMARY ──
+            if result['orders']:
+                known = {cur for cur, _, _ in order_totals if cur}
+                subtotals = _currency_subtotals(order_totals, fx_rates, reporting_currency) if len(known) > 1 else None
+                if subtotals:
+                    rate_currencies.update(known | {reporting_currency})
+                result['missing_rates'] = _missing_rates(rate_currencies, fx_rates)
+                currency = reporting_currency if subtotals else (known.pop() if known else '')
+                rows, merges = _render_grand_summary(next_row, len(result['orders']), discount_pct, currency, subtotals)
+                writer.merge(merges)
+                data = writer.serialize_rows(rows, next_row)
+                stats.add('render', len(data))
+                _put(q_bytes, data, stop)
+            _put(q_bytes, _STAGE_DONE, stop)
+        except BaseException as e:
+            _put(q_bytes, _StageError(e), stop)
+
+    stage_threads = {
+        'parse': threading.Thread(target=_profiled(parse_stage), name='parse', daemon=True),
+        'render': threading.Thread(target=_profiled(render_stage), name='render', daemon=True),
+    }
+    threads = list(stage_threads.values())
+    for t in threads:
+        t.start()
+    try:
+        stats.begin('write')
+        while True:
+            data = _get(q_bytes, stop, stage_threads['render'])
+            if data is _STAGE_DONE:
+                break
+            if cancel is not None:
+                cancel.check()
+            writer.write(data)
+            stats.add('write', len(data))
+        vessel_text, info_text = _banner_texts(result['vessel_names'], len(result['orders']), discount_pct)
+        writer.finish({'vessel': vessel_text, 'info': info_text})
+        stats.add('write', 0)
+        completed = True
+    except BaseException:
+        stop.set()
+        writer.abort()
+        raise
+    finally:
+        stop.set()
+        for t in threads:
+            t.join()
+        if not completed:
+            # Çağıran sonucu hiç almayacak: diske taşan liste burada kapatılır
+            result['orders'].close()
+        if pool is not None and own_pool:
+            # İptal/hatada çalışan okumaları bekleme; sonuçları zaten kullanılmayacak
+            pool.shutdown(wait=completed, cancel_futures=True)
+        stats.finished = time.perf_counter()
+    return result
+
+
+class _ReadyFuture:
+    def __init__(self, value):
+        self._value = value
+
+    def result(self, timeout=None):
+        return self._value
+
+
+class _KeyedFuture:
+    """Havuzda çizilen blok: sonucu (anahtar, blok, yeni çizildi=True)."""
+
+    def __init__(self, key, future):
+        self._key = key
+        self._future = future
+
+    def result(self, timeout=None):
+        return self._key, self._future.result(timeout), True
+
+
+# ── Artımlı Birleştirme Manifest'i ──────────────────────────
+
+def _json_encode_value(value):
+    if isinstance(value, datetime):
+        return {'$dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'$d': value.isoformat()}
+    if isinstance(value, dt_time):
+        return {'$t': value.isoformat()}
+    if isinstance(value, timedelta):
+        return {'$td': [value.days, value.seconds, value.microseconds]}
+    if isinstance(value, Decimal):
+        return {'$dec': str(value)}
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError(f'{type(value).__name__} JSON\'a çevrilemiyor')
+
+
+_JSON_TAGS = {
+    '$dt': datetime.fromisoformat,
+    '$d': date.fromisoformat,
+    '$t': dt_time.fromisoformat,
+    '$td': lambda v: timedelta(days=v[0], seconds=v[1], microseconds=v[2]),
+    '$dec': Decimal,
+}
+
+
+def _json_decode_value(obj):
+    if len(obj) == 1:
+        tag, value = next(iter(obj.items()))
+        if tag in _JSON_TAGS:
+            return _JSON_TAGS[tag](value)
+    return obj
+
+
+class MergeManifest:
+    """Çıktı klasöründe tutulan artımlı birleştirme manifest'i (SQLite).
+
+    Her girdi dosyası için (damga, ayrıştırılmış siparişler) ve her çizilmiş blok için
+    XML şablonu diskte saklanır; bellekte yalnızca bu çalıştırmada kullanılan anahtarlar
+    durur. Blok anahtarı sipariş parmak izi ve seçeneklerden oluşur, satır numarası
+    içermez: şablon satırdan bağımsızdır (bkz. _block_template), bir dosyaya satır
+    eklenmesi sonraki blokları geçersiz kılmaz. Değişmeyen dosyalar yeniden okunmaz,
+    değişmeyen bloklar yeniden çizilmez ve XML'e çevrilmez; çıktı dosyası ise her
+    çalıştırmada baştan yazılır (sayfa tek bir sıkıştırılmış zip akışıdır).
+    """
+
+    FILE_NAME = '.order_merger_manifest.db'
+    LEGACY_FILE_NAME = '.order_merger_manifest.json'
+    VERSION = 6
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS inputs (
+            path TEXT PRIMARY KEY,
+            stamp TEXT NOT NULL,
+            orders TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS blocks (
+            key TEXT PRIMARY KEY,
+            template BLOB NOT NULL,
+            styles TEXT NOT NULL,
+            row_count INTEGER NOT NULL,
+            item_count INTEGER NOT NULL,
+            sale_total REAL NOT NULL,
+            cost_total REAL NOT NULL
+        );
+    """
+
+    def __init__(self, output_dir):
+        self.path = Path(output_dir) / self.FILE_NAME
+        self._lock = threading.Lock()
+        self._conn = None
+        self._used_inputs = set()
+        self._used_blocks = set()
+        self.reparsed = 0
+        self.reused = 0
+        self.rendered = 0
+        try:
+            conn = sqlite3.connect(str(self.path), timeout=10, check_same_thread=False)
+            try:
+                if conn.execute('PRAGMA user_version').fetchone()[0] != self.VERSION:
+                    conn.executescript('DROP TABLE IF EXISTS inputs; DROP TABLE IF EXISTS blocks;')
+                    conn.execute(f'PRAGMA user_version = {self.VERSION}')
+                conn.executescript(self.SCHEMA)
+                conn.commit()
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        except sqlite3.Error:
+            pass   # manifest açılamazsa tam birleştirme yapılır
+        with contextlib.suppress(OSError):
+            (Path(output_dir) / self.LEGACY_FILE_NAME).unlink()
+
+    def _query(self, sql, params=()):
+        if self._conn is None:
+            return None
+        with self._lock:
+            try:
+                return self._conn.execute(sql, params).fetchone()
+            except sqlite3.Error:
+                return None
+
+    def _write(self, sql, params):
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                self._conn.execute(sql, params)
+            except sqlite3.Error:
+                pass
+
+    @staticmethod
+    def fingerprint(order_data):
+        payload = json.dumps(
+            {k: v for k, v in order_data.items() if k != 'fingerprint'},
+            default=_json_encode_value, sort_keys=True
+        )
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _key(file_path):
+        return str(Path(file_path).resolve())
+
+    @staticmethod
+    def _stamp(file_path):
+        stamp = _input_stamp(file_path)
+        return json.dumps(stamp) if stamp else None
+
+    def contains(self, file_path):
+        """Dosya son kayıttan beri değişmedi mi? (siparişler yüklenmez)"""
+        stamp = self._stamp(file_path)
+        row = self._query('SELECT stamp FROM inputs WHERE path = ?', (self._key(file_path),)) if stamp else None
+        return row is not None and row[0] == stamp
+
+    def lookup(self, file_path):
+        """Dosya son kayıttan beri değişmediyse kayıtlı siparişlerini diskten yükle."""
+        key = self._key(file_path)
+        self._used_inputs.add(key)
+        stamp = self._stamp(file_path)
+        row = self._query('SELECT stamp, orders FROM inputs WHERE path = ?', (key,)) if stamp else None
+        if row is None or row[0] != stamp:
+            return None
+        try:
+            file_orders = json.loads(row[1], object_hook=_json_decode_value)
+        except ValueError:
+            return None
+        self.reused += 1
+        return file_orders
+
+    def store(self, file_path, file_orders):
+        """Yeniden ayrıştırılan dosyanın siparişlerini parmak izleriyle diske yaz."""
+        key = self._key(file_path)
+        self._used_inputs.add(key)
+        self.reparsed += 1
+        stamp = self._stamp(file_path)
+        try:
+            fingerprints = [self.fingerprint(o) for o in file_orders] if file_orders and stamp else None
+            if fingerprints:
+                for order_data, fp in zip(file_orders, fingerprints):
+                    order_data['fingerprint'] = fp
+                payload = json.dumps(file_orders, default=_json_encode_value)
+        except (TypeError, ValueError):
+            fingerprints = None  # JSON'a çevrilemeyen hücre: bu dosya önbelleğe alınmaz, birleştirme sürer
+        if fingerprints:
+            self._write('INSERT OR REPLACE INTO inputs (path, stamp, orders) VALUES (?, ?, ?)', (key, stamp, payload))
+        else:
+            self._write('DELETE FROM inputs WHERE path = ?', (key,))
+
+    def block_key(self, order_data, show_header_info, fx_rates):
+        """Blok önbellek anahtarı (içerik + seçenekler); parmak izi çıkarılamazsa None."""
+        try:
+            fp = order_data.get('fingerprint') or self.fingerprint(order_data)
+        except (TypeError, ValueError):
+            return None
+        opts = json.dumps([fp, bool(show_header_info), sorted(fx_rates.items())])
+        return hashlib.sha1(opts.encode('utf-8')).hexdigest()
+
+    def get_block(self, key):
+        """Kayıtlı blok: ((şablon, stiller, satır sayısı), item sayısı, (satış, alış)) veya None."""
+        if key is None:
+            return None
+        row = self._query('SELECT template, styles, row_count, item_count, sale_total, cost_total '
+                          'FROM blocks WHERE key = ?', (key,))
+        if row is None:
+            return None
+        self._used_blocks.add(key)
+        template, styles, row_count, item_count, sale_total, cost_total = row
+        return (template, [tuple(s) for s in json.loads(styles)], row_count), item_count, (sale_total, cost_total)
+
+    def put_block(self, key, block):
+        """Yeni çizilen bloğu kaydet (önbellekten gelen bloklar için çağrılmaz)."""
+        self.rendered += 1
+        if key is None:
+            return
+        (template, styles, row_count), item_count, (sale_total, cost_total) = block
+        self._used_blocks.add(key)
+        self._write('INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    (key, template, json.dumps(styles), row_count, item_count, sale_total, cost_total))
+
+    def save(self):
+        """Bu çalıştırmada kullanılmayan kayıtları sil ve değişiklikleri işle."""
+        if self._conn is None:
+            return
+        with self._lock:
+            try:
+                conn = self._conn
+                for table, column, used in (('inputs', 'path', self._used_inputs), ('blocks', 'key', self._used_blocks)):
+                    conn.execute('CREATE TEMP TABLE IF NOT EXISTS keep (key TEXT PRIMARY KEY)')
+                    conn.execute('DELETE FROM keep')
+                    conn.executemany('INSERT OR IGNORE INTO keep VALUES (?)', ((k,) for k in used))
+                    conn.execute(f'DELETE FROM {table} WHERE {column} NOT IN (SELECT key FROM keep)')
+                conn.commit()
+            except sqlite3.Error:
+                with contextlib.suppress(sqlite3.Error):
+                    self._conn.rollback()
+        self.close()
+
+    def close(self):
+        """Bağlantıyı kapat; save() edilmemiş değişiklikler geri alınır."""
+        with self._lock:
+            if self._conn is not None:
+                with contextlib.suppress(sqlite3.Error):
+                    self._conn.close()
+                self._conn = None
+
+
+# ── Geçmiş Veritabanı (SQLite) ───────────────────────────────
+
+class OrderHistoryStore:
+    """Birleştirilen siparişlerin ve kalemlerinin yerel SQLite arşivi."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS merges (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            merged_at TEXT NOT NULL,
+            output_file TEXT,
+            discount_pct REAL NOT NULL DEFAULT 0,
+            fx_eur REAL,
+            fx_usd REAL
+        );
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            merge_id INTEGER NOT NULL REFERENCES merges(id) ON DELETE CASCADE,
+            file_name TEXT,
+            vessel TEXT,
+            order_date TEXT,
+            rfq_ref TEXT,
+            qtn_ref TEXT,
+            currency TEXT
+        );
+        CREATE TABLE IF NOT EXISTS items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            order_id INTEGER NOT NULL REFERENCES orders(id) ON DELETE CASCADE,
+            line_no INTEGER,
+            code TEXT,
+            description TEXT,
+            qty REAL,
+            unit TEXT,
+            unit_price REAL,
+            unit_cost_raw REAL,
+            cost_currency TEXT,
+            unit_cost REAL,
+            fx_rate REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_orders_merge ON orders(merge_id);
+        CREATE INDEX IF NOT EXISTS idx_orders_vessel ON orders(vessel);
+        CREATE INDEX IF NOT EXISTS idx_orders_rfq ON orders(rfq_ref);
+        CREATE INDEX IF NOT EXISTS idx_items_order ON items(order_id);
+        CREATE INDEX IF NOT EXISTS idx_items_code ON items(code);
+        CREATE INDEX IF NOT EXISTS idx_merges_date ON merges(merged_at);
+    """
+
+    def __init__(self, db_path=None):
+        self.db_path = Path(db_path) if db_path else HISTORY_DB_FILE
+        with self._connect() as conn:
+            conn.executescript(self.SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(str(self.db_path), timeout=10)
+        conn.execute('PRAGMA foreign_keys = ON')
+        return conn
+
+    def record_merge(self, orders, fx_rates, discount_pct=0.0, output_path=None, merged_at=None):
+        """Bir birleştirmenin tüm sipariş ve kalemlerini tek transaction'da yaz. merge id döndürür."""
+        merged_at = merged_at or datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        conn = self._connect()
+        try:
+            with conn:
+                cur = conn.execute(
+                    'INSERT INTO merges (merged_at, output_file, discount_pct, fx_eur, fx_usd) VALUES (?, ?, ?, ?, ?)',
+                    (merged_at, str(output_path) if output_path else None, discount_pct,
+                     fx_rates.get('EUR'), fx_rates.get('USD'))
+                )
+                merge_id = cur.lastrowid
+                for order_data in orders:
+                    info = order_data['header_info']
+                    sale_currency = info.get('currency', '').upper()
+                    cur = conn.execute(
+                        'INSERT INTO orders (merge_id, file_name, vessel, order_date, rfq_ref, qtn_ref, currency) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (merge_id, order_data['file_name'], info.get('vessel', ''), info.get('date', ''),
+                         info.get('rfq_ref', ''), info.get('qtn_ref', ''), sale_currency)
+                    )
+                    order_id = cur.lastrowid
+                    conn.executemany(
+                        'INSERT INTO items (order_id, line_no, code, description, qty, unit, unit_price, '
+                        'unit_cost_raw, cost_currency, unit_cost, fx_rate) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        self._item_rows(order_id, order_data['data_rows'], sale_currency, fx_rates)
+                    )
+            return merge_id
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _item_rows(order_id, data_rows, sale_currency, fx_rates):
+        def _text(v):
+            return '' if v is None or (isinstance(v, float) and pd.isna(v)) else str(v).strip()
+
+        for line_no, data_row in enumerate(data_rows, start=1):
+            cells = list(data_row) + [None] * (10 - len(data_row))
+            unit_cost_raw, cost_currency = _parse_cost(cells[9])
+            fx_rate = _fx_factor(cost_currency, sale_currency, fx_rates)
+            unit_cost = unit_cost_raw * fx_rate if unit_cost_raw > 0 else 0.0
+            yield (
+                order_id, line_no, _text(cells[2]), _text(cells[1]), _to_float(cells[3]), _text(cells[4]),
+                _to_float(cells[5]), unit_cost_raw, cost_currency, round(unit_cost, 4), fx_rate
+            )
+
+    def _query(self, sql, params=()):
+        conn = self._connect()
+        try:
+            conn.row_factory = sqlite3.Row
+            return [dict(r) for r in conn.execute(sql, params).fetchall()]
+        finally:
+            conn.close()
+
+    def price_history(self, code, since=None, until=None):
+        """Bir CODE için tarihsel satış/alış fiyatları (yeniden eskiye)."""
+        sql = (
+            'SELECT m.merged_at, o.vessel, o.order_date, o.rfq_ref, o.qtn_ref, o.currency, '
+            'i.qty, i.unit_price, i.unit_cost_raw, i.cost_currency, i.unit_cost, i.fx_rate '
+            'FROM items i JOIN orders o ON o.id = i.order_id JOIN merges m ON m.id = o.merge_id '
+            'WHERE i.code = ?'
+        )
+        params = [code]
+        if since:
+            sql += ' AND m.merged_at >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND m.merged_at < ?'
+            params.append(until)
+        sql += ' ORDER BY m.merged_at DESC, o.id DESC'
+        return self._query(sql, params)
+
+    def margins(self, by='vessel', value=None, since=None, until=None):
+        """Gemi ('vessel') veya kod ('code') bazında satış, alış ve kâr toplamları (para birimi ayrı)."""
+        group_col = {'vessel': 'o.vessel', 'code': 'i.code'}[by]
+        sql = (
+            f'SELECT {group_col} AS key, o.currency, COUNT(*) AS lines, '
+            'SUM(i.qty * i.unit_price) AS sale_total, SUM(i.qty * i.unit_cost) AS cost_total, '
+            'SUM(i.qty * (i.unit_price - i.unit_cost)) AS profit '
+            'FROM items i JOIN orders o ON o.id = i.order_id JOIN merges m ON m.id = o.merge_id WHERE 1 = 1'
+        )
+        params = []
+        if value:
+            sql += f' AND {group_col} = ?'
+            params.append(value)
+        if since:
+            sql += ' AND m.merged_at >= ?'
+            params.append(since)
+        if until:
+            sql += ' AND m.merged_at < ?'
+            params.append(until)
+        sql += f' GROUP BY {group_col}, o.currency ORDER BY {group_col}, o.currency'
+        return self._query(sql, params)
+
+
+# ── Doğrulama ────────────────────────────────────────────────
+#
+# Birleştirilmiş dosyadaki her sipariş TOTAL / COST TOTAL'ı ve Grand Summary, girdi
+# dosyalarından bağımsız olarak yeniden hesaplanan değerlerle ve her girdinin kendi
+# TOTAL satırıyla karşılaştırılır. Çıktıdaki formüller çevrimdışı hesaplanır; Excel
+# gerekmez. Sentetik büyük derlem üretici hızlı yolların doğrulanması içindir.
+
+VALIDATION_TOLERANCE = 0.01
+
+
+class FormulaEvaluator:
+    """Çıktıda kullanılan formül alt kümesini (+ - * /, SUM, SUMIF) çevrimdışı hesaplar."""
+
+    _TOKEN = re.compile(
+        r'\s*(?:(?P<func>[A-Z][A-Z0-9.]*)\(|(?P<ref>\$?[A-Z]{1,3}\$?\d+(?::\$?[A-Z]{1,3}\$?\d+)?)'
+        r'|(?P<num>\d+(?:\.\d*)?(?:[eE][-+]?\d+)?)|(?P<str>"[^"]*")|(?P<op>[-+*/(),]))'
+    )
+
+    def __init__(self, cells):
+        self.cells = cells
+        self._cache = {}
+
+    def value(self, ref):
+        ref = ref.replace('$', '')
+        if ref in self._cache:
+            return self._cache[ref]
+        raw = self.cells.get(ref)
+        if isinstance(raw, str) and raw.startswith('='):
+            self._cache[ref] = None  # döngüsel referans koruması
+            raw = self.evaluate(raw[1:])
+        self._cache[ref] = raw
+        return raw
+
+    def evaluate(self, formula):
+        tokens = []
+        pos = 0
+        formula = formula.strip()
+        while pos < len(formula):
+            m = self._TOKEN.match(formula, pos)
+            if not m or m.end() == pos:
+                raise ValueError(f"Desteklenmeyen formül: ={formula}")
+            tokens.append((m.lastgroup, m.group(m.lastgroup)))
+            pos = m.end()
+        # Başka formül hücresine referans evaluate'i yeniden çağırır; dış durumu sakla
+        outer = getattr(self, '_tokens', None), getattr(self, '_pos', 0)
+        self._tokens, self._pos = tokens, 0
+        try:
+            result = self._expr()
+            if self._pos != len(tokens):
+                raise ValueError(f"Desteklenmeyen formül: ={formula}")
+            return result
+        finally:
+            self._tokens, self._pos = outer
+
+    def _peek(self):
+        return self._tokens[self._pos] if self._pos < len(self._tokens) else (None, None)
+
+    def _take(self, text=None):
+        kind, value = self._peek()
+        if text is not None and value != text:
+            raise ValueError(f"'{text}' bekleniyordu")
+        self._pos += 1
+        return kind, value
+
+    @staticmethod
+    def _num(value):
+        return 0.0 if value is None or value == '' else float(value)
+
+    def _expr(self):
+        result = self._term()
+        while self._peek()[1] in ('+', '-'):
+            op = self._take()[1]
+            rhs = self._term()
+            result = self._num(result) + self._num(rhs) if op == '+' else self._num(result) - self._num(rhs)
+        return result
+
+    def _term(self):
+        result = self._factor()
+        while self._peek()[1] in ('*', '/'):
+            op = self._take()[1]
+            rhs = self._factor()
+            result = self._num(result) * self._num(rhs) if op == '*' else self._num(result) / self._num(rhs)
+        return result
+
+    def _factor(self):
+        kind, value = self._take()
+        if value == '-':
+            return -self._num(self._factor())
+        if value == '(':
+            result = self._expr()
+            self._take(')')
+            return result
+        if kind == 'num':
+            return float(value)
+        if kind == 'str':
+            return value[1:-1]
+        if kind == 'ref':
+            return self._range(value) if ':' in value else self.value(value)
+        if kind == 'func':
+            args = []
+            while self._peek()[1] != ')':
+                args.append(self._expr())
+                if self._peek()[1] == ',':
+                    self._take(',')
+            self._take(')')
+            return self._call(value, args)
+        raise ValueError(f"Beklenmeyen ifade: {value}")
+
+    def _range(self, ref):
+        min_col, min_row, max_col, max_row = range_boundaries(ref.replace('$', ''))
+        return [
+            [self.value(f'{get_column_letter(c)}{r}') for c in range(min_col, max_col + 1)]
+            for r in range(min_row, max_row + 1)
+        ]
+
+    def _call(self, name, args):
+        def flat(values):
+            for v in values:
+                if isinstance(v, list):
+                    yield from flat(v)
+                else:
+                    yield v
+
+        if name == 'SUM':
+            return sum(float(v) for v in flat(args) if isinstance(v, (int, float)))
+        if name == 'SUMIF':
+            criteria = str(args[1]).strip().upper()
+            sum_range = args[2] if len(args) > 2 else args[0]
+            return sum(
+                float(v) for c, v in zip(flat(args[0]), flat(sum_range))
+                if str(c if c is not None else '').strip().upper() == criteria and isinstance(v, (int, float))
+            )
+        if name == 'SUMIFS':
+            def norm(c):
+                return str(c if c is not None else '').strip().upper()
+            pairs = [(list(flat(args[i])), norm(args[i + 1])) for i in range(1, len(args) - 1, 2)]
+            return sum(
+                float(v) for j, v in enumerate(flat(args[0]))
+                if isinstance(v, (int, float)) and all(norm(rng[j]) == crit for rng, crit in pairs)
+            )
+        raise ValueError(f"Desteklenmeyen fonksiyon: {name}")
+
+
+def _validation_rate(source, target, fx_rates):
+    """1 source kaç target (kurlar TL cinsinden); _fx_factor'dan bağımsız ve kur yoksa None.
+
+    Para birimi boş olan taraf TL sayılır (çıktıyla aynı kural); eksik kur 1.0 sayılmaz.
+    """
+    source, target = source or 'TRY', target or 'TRY'
+    if source == target:
+        return 1.0
+    try:
+        return float(fx_rates[source]) / float(fx_rates[target])
+    except (KeyError, ZeroDivisionError):
+        return None
+
+
+def _expected_order_totals(order_data, fx_rates, missing=None):
+    """Siparişin (satış, alış) toplamlarını çıktı yazıcısından bağımsız hesapla.
+
+    Kuru olmayan maliyet para birimleri missing kümesine eklenir (o kalemler sayılmaz).
+    """
+    sale_currency = order_data['header_info'].get('currency', '').upper()
+    sale = cost = 0.0
+    for data_row in order_data['data_rows']:
+        cells = list(data_row) + [None] * (DATA_ROW_WIDTH - len(data_row))
+        qty = _to_float(cells[3])
+        sale += qty * _to_float(cells[5])
+        unit_cost_raw, cost_currency = _parse_cost(cells[9])
+        if unit_cost_raw > 0:
+            rate = _validation_rate(cost_currency or sale_currency, sale_currency, fx_rates)
+            if rate is None:
+                if missing is not None:
+                    missing.add(cost_currency if cost_currency not in fx_rates else sale_currency)
+                continue
+            cost += qty * round(unit_cost_raw * rate, 2)
+    return sale, cost
+
+
+class ValidationReport:
+    """Kontrol listesi: (kapsam, kontrol, beklenen, bulunan, tamam mı)."""
+
+    def __init__(self, tolerance=VALIDATION_TOLERANCE):
+        self.tolerance = tolerance
+        self.checks = []
+        self.order_count = 0
+        self.item_count = 0
+
+    def compare(self, scope, what, expected, actual):
+        try:
+            ok = abs(float(expected) - float(actual)) <= self.tolerance
+        except (TypeError, ValueError):
+            ok = False
+        self.checks.append((scope, what, expected, actual, ok))
+        return ok
+
+    def fail(self, scope, what, expected=None, actual=None):
+        self.checks.append((scope, what, expected, actual, False))
+
+    @property
+    def failures(self):
+        return [c for c in self.checks if not c[4]]
+
+    @property
+    def ok(self):
+        return not self.failures
+
+    def summary(self):
+        if self.ok:
+            return f"✅ Doğrulama: {self.order_count} sipariş, {self.item_count} item, {len(self.checks)} kontrol tuttu"
+        return f"❌ Doğrulama: {len(self.failures)} / {len(self.checks)} kontrol tutmadı"
+
+
+def _read_output_cells(output_path):
+    """Çıktının tüm dolu hücreleri {'A1': değer/formül} ve satır sırası."""
+    cells, rows = {}, []
+    wb = load_workbook(output_path, read_only=True)
+    try:
+        for row in wb.worksheets[0].iter_rows():
+            filled = [c for c in row if c.value is not None]
+            if filled:
+                rows.append(filled[0].row)
+                for c in filled:
+                    cells[c.coordinate] = c.value
+    finally:
+        wb.close()
+    return cells, rows
+
+
+def validate_merge(output_path, files, fx_rates, discount_pct=0.0, reporting_currency=REPORTING_CURRENCY,
+                   tolerance=VALIDATION_TOLERANCE, orders=None):
+    """Birleştirilmiş dosyayı girdilere karşı doğrula ve ValidationReport döndür."""
+    report = ValidationReport(tolerance)
+    if orders is None:
+        orders = [o for f in files for o in _safe_extract_orders(f)]
+    cells, rows = _read_output_cells(output_path)
+    ev = FormulaEvaluator(cells)
+
+    # Çıktıdaki blokları sırayla çıkar: 'Order: <dosya>' -> TOTAL / COST TOTAL
+    blocks, current = [], None
+    labels = {}
+    for r in rows:
+        b = cells.get(f'B{r}')
+        if isinstance(b, str) and b.startswith('Order: '):
+            current = {'file_name': b[len('Order: '):], 'sale': None, 'cost': None}
+            blocks.append(current)
+        if current is not None and cells.get(f'F{r}') == TOTAL_LABEL:
+            current['sale'] = ev.value(f'G{r}')
+            current['cost'] = ev.value(f'K{r}') if cells.get(f'J{r}') == COST_TOTAL_LABEL else None
+            current = None
+        d = cells.get(f'D{r}')
+        if isinstance(d, str) and d.endswith(':'):
+            labels[d] = r
+
+    if len(blocks) != len(orders):
+        report.fail('Çıktı', 'sipariş bloğu sayısı', len(orders), len(blocks))
+
+    sale_by_currency = {}
+    cost_by_currency = {}
+    for order_data, block in zip(orders, blocks):
+        name = order_data['file_name']
+        report.order_count += 1
+        report.item_count += len(order_data['data_rows'])
+        if block['file_name'] != name:
+            report.fail(name, 'blok sırası', name, block['file_name'])
+            continue
+        missing = set()
+        sale, cost = _expected_order_totals(order_data, fx_rates, missing)
+        for cur in sorted(missing):
+            report.fail(name, f'{cur} kuru yok (çıktı 1.0 ile çevirmiş olabilir)')
+        currency = order_data['header_info'].get('currency', '').upper()
+        sale_by_currency[currency] = sale_by_currency.get(currency, 0.0) + sale
+        cost_by_currency[currency] = cost_by_currency.get(currency, 0.0) + cost
+        report.compare(name, 'TOTAL', sale, block['sale'])
+        report.compare(name, 'COST TOTAL', cost, block['cost'])
+        if order_data.get('source_total') is not None:
+            report.compare(name, 'girdi TOTAL satırı', order_data['source_total'], sale)
+
+    # Grand Summary
+    known = {c for c in sale_by_currency if c}
+    if len(known) > 1:
+        for cur in _missing_rates(known | {reporting_currency}, fx_rates):
+            report.fail('Grand Summary', f'{cur} kuru yok (çıktı 1.0 ile çevirmiş olabilir)')
+
+        def convert(amounts):
+            return sum(v * (_validation_rate(c or reporting_currency, reporting_currency, fx_rates) or 0.0)
+                       for c, v in amounts.items())
+        sale_total, cost_total = convert(sale_by_currency), convert(cost_by_currency)
+    else:
+        sale_total, cost_total = sum(sale_by_currency.values()), sum(cost_by_currency.values())
+    discount = sale_total * discount_pct / 100
+    final_sale = sale_total - discount
+    expected = [('TOPLAM SATIŞ', sale_total), ('TOPLAM ALIŞ', cost_total)]
+    if discount_pct > 0:
+        expected += [('İNDİRİM', discount), ('FİNAL SATIŞ TUTARI', final_sale)]
+    expected.append(('KÂR / ZARAR', final_sale - cost_total))
+    for prefix, value in expected:
+        row = next((r for label, r in labels.items() if label.startswith(prefix)), None)
+        if row is None:
+            report.fail('Grand Summary', prefix, value, None)
+        else:
+            report.compare('Grand Summary', prefix, value, ev.value(f'G{row}'))
+    return report
+
+
+def _write_synthetic_order(path, rng, vessel, currency, cost_currency, item_count, terms=10):
+    """Varsayılan düzende sentetik sipariş özeti yaz (doğrulama derlemi için)."""
+    symbols = {'EUR': '€', 'USD': '$', 'TRY': '₺'}
+    cost_labels = {'EUR': 'EUR', 'USD': 'USD', 'TRY': 'TL'}
+    wb = Workbook()
+    ws = wb.active
+    ws.cell(15, 2).value = vessel
+    for r, (label, value) in enumerate([
+        ('DATE :', f'{rng.randint(1, 28):02d}.{rng.randint(1, 12):02d}.2026'),
+        ('RFQ REF :', f'RFQ-{rng.randint(1000, 9999)}'),
+        ('QTN REF :', f'QTN-{rng.randint(1000, 9999)}'),
+    ], start=18):
+        ws.cell(r, 8).value = label
+        ws.cell(r, 9).value = value
+    for c, h in enumerate(['NO', 'DESCRIPTION', 'CODE', 'QTTY', 'UNIT', 'U.PRICE', 'T.PRICE', 'REMARKS', 'STOCK LOC.', 'COST'], 1):
+        ws.cell(21, c).value = h
+    total = 0.0
+    r = 23
+    for i in range(item_count):
+        qty = rng.randint(1, 20)
+        price = round(rng.uniform(1, 900), 2)
+        ws.cell(r, 1).value = i + 1
+        ws.cell(r, 2).value = f'ITEM {i + 1}'
+        ws.cell(r, 3).value = f'C{rng.randint(10000, 99999)}'
+        ws.cell(r, 4).value = qty
+        ws.cell(r, 5).value = 'PCS'
+        ws.cell(r, 6).value = price
+        ws.cell(r, 7).value = round(qty * price, 2)
+        ws.cell(r, 9).value = f'A-{rng.randint(1, 40)}'
+        # Saat / süre biçimli REMARKS: okuyucu arka uçlarının aynı tipi üretmesi kıyaslanır
+        if i % 7 == 3:
+            ws.cell(r, 8).value = dt_time(i % 24, (i * 7) % 60)
+            ws.cell(r, 8).number_format = 'h:mm'
+        elif i % 11 == 5:
+            ws.cell(r, 8).value = timedelta(hours=i % 50, minutes=15)
+            ws.cell(r, 8).number_format = '[h]:mm'
+        if rng.random() > 0.1:
+            ws.cell(r, 10).value = f'{price * rng.uniform(0.5, 0.9):.2f} {cost_labels[cost_currency]}'
+        total += round(qty * price, 2)
+        r += 1
+    ws.cell(r + 1, 6).value = 'TOTAL :'
+    ws.cell(r + 1, 7).value = f'{symbols[currency]}{total:,.2f}'
+    for t in range(terms):
+        ws.cell(r + 3 + t, 1).value = f'{t + 1}. Terms and conditions apply.'
+    wb.save(path)
+
+
+def _make_synthetic_corpus(out_dir, count, items=40, seed=0):
+    """out_dir'e count adet karışık para birimli sentetik sipariş yaz; yolları döndür."""
+    rng = random.Random(seed)
+    paths = []
+    for k in range(count):
+        path = Path(out_dir) / f'synthetic_{k:04d}.xlsx'
+        _write_synthetic_order(
+            path, rng, vessel=f'VESSEL {k % 3 + 1}',
+            currency=rng.choice(['EUR', 'USD', 'TRY']), cost_currency=rng.choice(['EUR', 'USD', 'TRY']),
+            item_count=rng.randint(max(1, items // 2), items * 2),
+        )
+        paths.append(path)
+    return paths
+
+
+# ── Revizyon Karşılaştırması ─────────────────────────────────
+#
+# Aynı RFQ için gelen revize teklif (yeni QTN) eski sürümle kalem kalem karşılaştırılır.
+# Kalemler CODE üzerinden hash indeksiyle, CODE yoksa/tutmazsa normalize edilmiş
+# DESCRIPTION ile eşlenir; her iki dosya bir kez gezilir (doğrusal süre). Açıklaması da
+# boş kalemler sıraya göre değil (miktar, birim fiyat) ile eşlenir; tutmayan kalem
+# değişmiş değil eklenmiş/çıkarılmış sayılır.
+
+DIFF_FIELDS = [('qty', 'QTTY'), ('unit_price', 'U.PRICE'), ('unit_cost', 'U.COST')]
+DIFF_COLUMNS = ['status', 'line_old', 'line_new', 'code', 'description', 'changes',
+                'qty_old', 'qty_new', 'price_old', 'price_new', 'cost_old', 'cost_new',
+                'sale_delta', 'cost_delta']
+
+
+def _normalize_description(text):
+    """Eşleme anahtarı: büyük harf, noktalama yok, tek boşluk."""
+    return ' '.join(re.sub(r'[^\w]+', ' ', str(text or '')).upper().split())
+
+
+def _diff_match_key(line):
+    """CODE tutmadığında kullanılan anahtar: açıklama; açıklama boşsa (miktar, birim fiyat)."""
+    desc = _normalize_description(line['description'])
+    return desc if desc else ('', line['qty'], line['unit_price'])
+
+
+def _diff_lines(orders, fx_rates):
+    """Siparişlerin kalemlerini karşılaştırma için düz sözlüklere çevir (maliyet satış para biriminde)."""
+    lines = []
+    for order_data in orders:
+        sale_currency = order_data['header_info'].get('currency', '').upper()
+        for line_no, data_row in enumerate(order_data['data_rows'], start=1):
+            cells = list(data_row) + [None] * (DATA_ROW_WIDTH - len(data_row))
+            unit_cost_raw, cost_currency = _parse_cost(cells[9])
+            unit_cost = round(unit_cost_raw * _fx_factor(cost_currency, sale_currency, fx_rates), 2) if unit_cost_raw > 0 else 0.0
+            lines.append({
+                'line': len(lines) + 1 if len(orders) > 1 else line_no,
+                'code': '' if cells[2] is None else str(cells[2]).strip(),
+                'description': '' if cells[1] is None else str(cells[1]).strip(),
+                'qty': _to_float(cells[3]),
+                'unit_price': _to_float(cells[5]),
+                'unit_cost': unit_cost,
+                'currency': sale_currency,
+            })
+    return lines
+
+
+class RevisionDiff:
+    """İki sipariş özeti sürümü arasındaki eklenen, çıkarılan ve değişen kalemler."""
+
+    def __init__(self, old_orders, new_orders, fx_rates, old_name='', new_name=''):
+        self.old_name, self.new_name = old_name, new_name
+        self.old_header = old_orders[0]['header_info'] if old_orders else {}
+        self.new_header = new_orders[0]['header_info'] if new_orders else {}
+        self.entries = []
+        self.unchanged = 0
+        old_lines = _diff_lines(old_orders, fx_rates)
+        new_lines = _diff_lines(new_orders, fx_rates)
+
+        # CODE ve açıklama indeksleri; aynı anahtarlı kalemler sırayla eşlenir
+        by_code, by_desc = {}, {}
+        for idx, line in enumerate(old_lines):
+            if line['code']:
+                by_code.setdefault(line['code'].upper(), deque()).append(idx)
+            by_desc.setdefault(_diff_match_key(line), deque()).append(idx)
+        matched = [False] * len(old_lines)
+
+        def take(index, key):
+            queue_ = index.get(key)
+            while queue_:
+                idx = queue_.popleft()
+                if not matched[idx]:
+                    matched[idx] = True
+                    return idx
+            return None
+
+        for line in new_lines:
+            idx = take(by_code, line['code'].upper()) if line['code'] else None
+            if idx is None:
+                idx = take(by_desc, _diff_match_key(line))
+            if idx is None:
+                self.entries.append(self._entry('added', None, line))
+                continue
+            old = old_lines[idx]
+            changes = [label for field, label in DIFF_FIELDS if abs(old[field] - line[field]) > 1e-9]
+            if old['code'].upper() != line['code'].upper():
+                changes.append('CODE')
+            if changes:
+                self.entries.append(self._entry('changed', old, line, changes))
+            else:
+                self.unchanged += 1
+        for idx, old in enumerate(old_lines):
+            if not matched[idx]:
+                self.entries.append(self._entry('removed', old, None))
+
+        self.totals = {side: self._totals(lines) for side, lines in (('old', old_lines), ('new', new_lines))}
+
+    @staticmethod
+    def _entry(status, old, new, changes=()):
+        ref = new or old
+        old_sale = old['qty'] * old['unit_price'] if old else 0.0
+        new_sale = new['qty'] * new['unit_price'] if new else 0.0
+        old_cost = old['qty'] * old['unit_cost'] if old else 0.0
+        new_cost = new['qty'] * new['unit_cost'] if new else 0.0
+        return {
+            'status': status,
+            'line_old': old['line'] if old else None,
+            'line_new': new['line'] if new else None,
+            'code': ref['code'],
+            'description': ref['description'],
+            'changes': ', '.join(changes),
+            'qty_old': old['qty'] if old else None,
+            'qty_new': new['qty'] if new else None,
+            'price_old': old['unit_price'] if old else None,
+            'price_new': new['unit_price'] if new else None,
+            'cost_old': old['unit_cost'] if old else None,
+            'cost_new': new['unit_cost'] if new else None,
+            'sale_delta': round(new_sale - old_sale, 2),
+            'cost_delta': round(new_cost - old_cost, 2),
+        }
+
+    @staticmethod
+    def _totals(lines):
+        sale = sum(line['qty'] * line['unit_price'] for line in lines)
+        cost = sum(line['qty'] * line['unit_cost'] for line in lines)
+        return {'items': len(lines), 'sale': round(sale, 2), 'cost': round(cost, 2), 'profit': round(sale - cost, 2)}
+
+    def count(self, status):
+        return sum(1 for e in self.entries if e['status'] == status)
+
+    @property
+    def delta(self):
+        old, new = self.totals['old'], self.totals['new']
+        return {k: round(new[k] - old[k], 2) for k in ('items', 'sale', 'cost', 'profit')}
+
+    def summary(self):
+        d = self.delta
+        return (f"🔁 {self.count('added')} eklendi, {self.count('removed')} çıkarıldı, "
+                f"{self.count('changed')} değişti, {self.unchanged} aynı | "
+                f"Satış {d['sale']:+,.2f}  Alış {d['cost']:+,.2f}  Kâr {d['profit']:+,.2f}")
+
+    def to_dict(self):
+        def _header(info):
+            return {k: info.get(k, '') for k in ('vessel', 'date', 'rfq_ref', 'qtn_ref', 'currency')}
+
+        return {
+            'old': {'file': self.old_name, **_header(self.old_header), **self.totals['old']},
+            'new': {'file': self.new_name, **_header(self.new_header), **self.totals['new']},
+            'delta': self.delta,
+            'counts': {'added': self.count('added'), 'removed': self.count('removed'),
+                       'changed': self.count('changed'), 'unchanged': self.unchanged},
+            'lines': self.entries,
+        }
 
+    def write_sheet(self, output_path):
+        """Farkları tek sayfalık Excel'e yaz (geçici dosya + atomik taşıma). Son yolu döndürür."""
+        output_path = Path(output_path)
+        styles = _output_styles()
+        status_fills = {'added': _solid('D5F5E3'), 'removed': _solid('FADBD8'), 'changed': _solid('FCF3CF')}
+        wb = Workbook()
+        ws = wb.active
+        ws.title = 'Revision Diff'
+        ws.append(['OLD', self.old_name, self.old_header.get('qtn_ref', ''), 'NEW', self.new_name,
+                   self.new_header.get('qtn_ref', ''), 'RFQ', self.new_header.get('rfq_ref', '')])
+        for side in ('old', 'new'):
+            t = self.totals[side]
+            ws.append([side.upper(), 'ITEMS', t['items'], 'SALE', t['sale'], 'COST', t['cost'], 'PROFIT', t['profit']])
+        d = self.delta
+        ws.append(['DELTA', 'ITEMS', d['items'], 'SALE', d['sale'], 'COST', d['cost'], 'PROFIT', d['profit']])
+        ws.append([])
+        ws.append([c.upper() for c in DIFF_COLUMNS])
+        for cell in ws[ws.max_row]:
+            for attr, value in styles['header'].items():
+                setattr(cell, attr, value)
+        for entry in self.entries:
+            ws.append([entry[c] for c in DIFF_COLUMNS])
+            for cell in ws[ws.max_row]:
+                cell.fill = status_fills[entry['status']]
+        ws.freeze_panes = ws.cell(row=7, column=1)
+        for col, width in zip('ABCDEFGHIJKLMN', (10, 9, 9, 14, 40, 22, 9, 9, 11, 11, 11, 11, 12, 12)):
+            ws.column_dimensions[col].width = width
+        with OutputCommit(output_path.parent) as commit:
+            wb.save(commit.temp_path)
+            return commit.commit(output_path.name)
+
+
+def diff_revisions(old_path, new_path, fx_rates):
+    """İki dosyayı mevcut ayrıştırıcıyla okuyup RevisionDiff döndür."""
+    old_path, new_path = Path(old_path), Path(new_path)
+    plans = _get_layout_plans()
+    old_orders = _extract_orders(old_path, plans)
+    new_orders = _extract_orders(new_path, plans)
+    return RevisionDiff(old_orders, new_orders, fx_rates, _input_label(old_path), _input_label(new_path))
+
+
+# ── Çıktı Önbelleği ──────────────────────────────────────────
+#
+# Aynı dosya listesi ve aynı seçeneklerle tekrar basılan "Birleştir" yeniden okuma ve
+# çizim yapmaz: çıktılar girdi içerik özetleri, dosya sırası ve seçeneklerden türetilen
+# anahtarla uygulama klasöründe saklanır; isabet önceki çalışma kitabını kopyalar.
+
+OUTPUT_CACHE_DIR = _get_script_dir() / '.order_merger_cache'
+OUTPUT_CACHE_MAX_MB = 500
+OUTPUT_CACHE_MAX_ENTRIES = 50
+_digest_memo = {}
+
+
+def _app_file():
+    return Path(sys.executable if getattr(sys, 'frozen', False) else __file__)
+
+
+def _input_digest(path):
+    """Girdi içeriğinin SHA-1 özeti; (yol, damga) değişmedikçe süreç içinde tekrar okunmaz."""
+    stamp = _input_stamp(path)
+    memo_key = (str(path), *(stamp or ()))
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        h = hashlib.sha1()
+        source = _input_source(path)
+        with (contextlib.nullcontext(source) if hasattr(source, 'read') else open(source, 'rb')) as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        digest = h.hexdigest()
+        if len(_digest_memo) > 10000:
+            _digest_memo.clear()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+def _output_cache_key(job):
+    """İşin çıktısını belirleyen her şeyin özeti; girdi okunamazsa None (önbellek atlanır)."""
+    try:
+        payload = json.dumps({
+            'version': OutputCache.VERSION,
+            'app': _input_stamp(_app_file()),
+            'layouts': _input_stamp(LAYOUTS_FILE),
+            'inputs': [[_input_label(f), _input_digest(f)] for f in job['files']],
+            'discount_pct': job['discount_pct'],
+            'fx_rates': sorted(job['fx_rates'].items()),
+            'reporting_currency': job['reporting_currency'],
+            'show_header_info': job['show_header_info'],
+            'highlight': job['highlight'],
+            'compresslevel': job['compresslevel'],
+        }, sort_keys=True)
+    except (OSError, KeyError, zipfile.BadZipFile):
+        return None
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+_BANNER_STAMP = re.compile(r'Generated: \d{2}\.\d{2}\.\d{4} \d{2}:\d{2}')
+
+
+def _copy_with_fresh_banner(cached_path, target_path, compresslevel=None):
+    """Önbellekteki çalışma kitabını kopyala; banner'daki 'Generated:' zamanı şimdiye çekilir.
+
+    Banner metni sharedStrings.xml'dedir; diğer parçalar aynen aktarılır.
+    """
+    stamp = f"Generated: {datetime.now().strftime('%d.%m.%Y %H:%M')}"
+    shared = StreamingSheetWriter.SHARED_STRINGS_PATH
+    with zipfile.ZipFile(cached_path) as src, \
+            zipfile.ZipFile(target_path, 'w', zipfile.ZIP_DEFLATED,
+                            compresslevel=ZIP_COMPRESSLEVEL if compresslevel is None else compresslevel) as dst:
+        for info in src.infolist():
+            data = src.read(info)
+            if info.filename == shared:
+                data = _BANNER_STAMP.sub(stamp, data.decode('utf-8'), count=1).encode('utf-8')
+            dst.writestr(info, data)
+
+
+class OutputCache:
+    """Boyutu ve kayıt sayısı sınırlı, en eski kullanılanı atan (LRU) çıktı önbelleği.
+
+    index.json: anahtar -> {'size', 'last_used', 'meta'}; çalışma kitabı '<anahtar>.xlsx'.
+    """
+
+    VERSION = 2
+    INDEX_NAME = 'index.json'
+    _lock = threading.Lock()
+
+    def __init__(self, cache_dir=None, max_mb=OUTPUT_CACHE_MAX_MB, max_entries=OUTPUT_CACHE_MAX_ENTRIES):
+        self.cache_dir = Path(cache_dir or OUTPUT_CACHE_DIR)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_entries = max_entries
+
+    def _load(self):
+        try:
+            with open(self.cache_dir / self.INDEX_NAME, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.VERSION:
+                return data.get('entries', {})
+        except Exception:
+            pass
+        return {}
+
+    def _save(self, entries):
+        path = self.cache_dir / self.INDEX_NAME
+        tmp = path.with_name(path.name + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'version': self.VERSION, 'entries': entries}, f)
+        os.replace(tmp, path)
+
+    def _file(self, key):
+        return self.cache_dir / f'{key}.xlsx'
+
+    def lookup(self, key):
+        """İsabette (çalışma kitabı yolu, meta), yoksa None."""
+        with self._lock:
+            entries = self._load()
+            entry = entries.get(key)
+            if entry is None or not self._file(key).is_file():
+                return None
+            entry['last_used'] = time.time()
+            try:
+                self._save(entries)
+            except OSError:
+                pass
+            return self._file(key), entry['meta']
+
+    def store(self, key, output_path, meta):
+        """Üretilen çalışma kitabının kopyasını sakla ve sınırları aşan eski kayıtları sil."""
+        with self._lock:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            target = self._file(key)
+            tmp = target.with_name(target.name + '.tmp')
+            shutil.copyfile(output_path, tmp)
+            os.replace(tmp, target)
+            entries = self._load()
+            entries[key] = {'size': target.stat().st_size, 'last_used': time.time(), 'meta': meta}
+            by_age = sorted(entries, key=lambda k: entries[k]['last_used'])
+            total = sum(e['size'] for e in entries.values())
+            while by_age and (len(entries) > self.max_entries or total > self.max_bytes):
+                old = by_age.pop(0)
+                total -= entries.pop(old)['size']
+                try:
+                    self._file(old).unlink()
+                except OSError:
+                    pass
+            self._save(entries)
+
+
+# ── Birleştirme İşi ve Servis Modu ───────────────────────────
+#
+# Tek birleştirme işi JSON uyumlu bir sözlükle tanımlanır; aynı iş GUI'de yerelde,
+# CLI'da veya yerel HTTP servisinde çalışır. Servis süreci pandas/openpyxl'i bir kez
+# yükler, süreç havuzunu sıcak tutar, okunan siparişleri iş istasyonları arasında
+# paylaşır ve birden fazla işi eşzamanlı yürütür.
+# Servis anahtarı (ORDER_MERGER_SERVICE_TOKEN veya ayarlarda 'service_token') tanımlıysa
+# her istek 'Authorization: Bearer <anahtar>' ister; çıktı kökleri ('service_output_roots')
+# tanımlıysa output_dir bunların altında olmalıdır. Yerel makine (loopback) dışındaki bir
+# adrese bağlanırken ikisi de zorunludur.
+
+SERVICE_DEFAULT_HOST = '127.0.0.1'
+SERVICE_DEFAULT_PORT = 8765
+SERVICE_MAX_JOBS = 4
+SERVICE_CACHE_SIZE = 2000
+SERVICE_KEEP_JOBS = 200
+SERVICE_TIMEOUT = 5
+SERVICE_POLL_SECONDS = 0.2
+SERVICE_TOKEN_ENV = 'ORDER_MERGER_SERVICE_TOKEN'
+
+
+def _read_settings():
+    """Ayar dosyasının tamamı (yoksa veya bozuksa boş sözlük)."""
+    try:
+        if SETTINGS_FILE.exists():
+            with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+    except Exception:
+        pass
+    return {}
 
-def _get_script_dir():
-    if getattr(sys, 'frozen', False):
-        return Path(sys.executable).parent
-    return Path(__file__).parent
 
+def _service_token():
+    """Paylaşılan servis anahtarı: ortam değişkeni, yoksa ayar dosyası; tanımsızsa ''."""
+    return os.environ.get(SERVICE_TOKEN_ENV) or str(_read_settings().get('service_token') or '')
 
-SETTINGS_FILE = _get_script_dir() / '.order_merger_settings.json'
 
+def _service_output_roots():
+    roots = _read_settings().get('service_output_roots') or []
+    return [str(r) for r in roots] if isinstance(roots, list) else [str(roots)]
 
-COST_CURRENCY_MAP = {
-    'TL': 'TRY', 'TRY': 'TRY', '₺': 'TRY',
-    'USD': 'USD', '$': 'USD',
-    'EUR': 'EUR', '€': 'EUR',
-}
 
+def _is_loopback(host):
+    """Adres yalnızca bu makineden erişilebilir mi? ('0.0.0.0' / '' tüm arayüzlerdir: hayır)"""
+    if not host:
+        return False
+    try:
+        return ipaddress.ip_address(socket.gethostbyname(host)).is_loopback
+    except (OSError, ValueError):
+        return False
+
+
+def _normalize_job(data):
+    """İstek gövdesini doğrulanmış iş tanımına çevir (hatada ValueError)."""
+    if not isinstance(data, dict):
+        raise ValueError("İş tanımı bir JSON nesnesi olmalı")
+    files = data.get('files')
+    if not files or not isinstance(files, list):
+        raise ValueError("'files' boş olmayan bir liste olmalı")
+    files = [str(f) for f in _expand_inputs(Path(f).resolve() for f in files)]
+    missing = [f for f in files if not _input_exists(f)]
+    if missing:
+        raise ValueError(f"Dosya bulunamadı: {missing[0]}")
+    fx_rates = {'TRY': 1.0}
+    for cur, rate in (data.get('fx_rates') or {}).items():
+        fx_rates[str(cur).upper()] = float(rate)
+    if 'EUR' not in fx_rates or 'USD' not in fx_rates:
+        raise ValueError("'fx_rates' EUR ve USD kurlarını içermeli")
+    reporting_currency = str(data.get('reporting_currency') or REPORTING_CURRENCY).upper()
+    if reporting_currency not in fx_rates:
+        raise ValueError(f"Rapor para birimi için kur yok: {reporting_currency}")
+    memory_budget_mb = float(data.get('memory_budget_mb') or MEMORY_BUDGET_MB)
+    if memory_budget_mb <= 0:
+        raise ValueError("'memory_budget_mb' pozitif olmalı")
+    stage_inputs = data.get('stage_inputs')
+    if stage_inputs is not None and stage_inputs not in STAGE_MODES:
+        raise ValueError(f"'stage_inputs' şunlardan biri olmalı: {', '.join(STAGE_MODES)}")
+    compresslevel = data.get('compresslevel')
+    if compresslevel is not None:
+        compresslevel = min(max(int(compresslevel), 0), 9)
+    return {
+        'files': files,
+        'output_dir': str(Path(data.get('output_dir') or _input_dir(files[0])).resolve()),
+        'discount_pct': float(data.get('discount_pct') or 0.0),
+        'fx_rates': fx_rates,
+        'reporting_currency': reporting_currency,
+        'show_header_info': bool(data.get('show_header_info', True)),
+        'highlight': bool(data.get('highlight', True)),
+        'incremental': bool(data.get('incremental', False)),
+        'compresslevel': compresslevel,
+        'memory_budget_mb': memory_budget_mb,
+        'record_history': bool(data.get('record_history', True)),
+        'output_cache': bool(data.get('output_cache', True)),
+        'stage_inputs': stage_inputs,
+    }
+
+
+def _run_merge_job(job, progress=None, notify=None, pool=None, parse_cache=None, cancel=None):
+    """Normalize edilmiş işi çalıştır; çıktıyı atomik yaz, manifest ve geçmişi güncelle.
+
+    İptalde (MergeCancelled) geçici çıktı silinir; manifest ve geçmiş yazılmaz.
+    Aynı girdi ve seçeneklerle daha önce üretilmiş çıktı önbellekteyse (output_cache)
+    birleştirme yapılmaz, o çalışma kitabı kopyalanır; bu durumda geçmişe yazılmaz.
+
+    Geçmiş yazılamazsa birleştirme başarılı sayılır; hata history_error'da döner.
+
+    Dönüş JSON uyumludur: output, redirected_from, total_items, vessel_names,
+    order_count, missing_rates, reused, history_error, cached, stats.
+    """
+    output_dir = Path(job['output_dir'])
+    # Ağdaki girdiler paralel olarak yerele kopyalanmaya başlar; özet ve okuma kopyayı bekler
+    _input_stager().stage(job['files'], job.get('stage_inputs'))
+    cache = OutputCache() if job.get('output_cache') else None
+    cache_key = _output_cache_key(job) if cache is not None else None
+    hit = cache.lookup(cache_key) if cache_key else None
+    if hit is not None:
+        started = time.perf_counter()
+        cached_path, meta = hit
+        try:
+            with OutputCommit(output_dir) as output:
+                locked = output.locked_outputs()
+                if locked and notify:
+                    notify(f"🔒 Açık dosya: {locked[0].name} — kapatılmazsa çıktı ek adla kaydedilecek")
+                _copy_with_fresh_banner(cached_path, output.temp_path, job['compresslevel'])
+                output_path = output.commit(_output_filename(meta['vessel_names']))
+                redirected = output.redirected_from
+        except FileNotFoundError:
+            hit = None   # kayıt bu arada atıldı: normal birleştirmeye düş
+        else:
+            if progress:
+                progress(1.0)
+            return {
+                'output': str(output_path),
+                'redirected_from': str(redirected) if redirected else None,
+                **meta,
+                'reused': 0,
+                'spilled': 0,
+                'cached': True,
+                'stats': f"⚡ Önbellekten kopyalandı ({time.perf_counter() - started:.2f} sn)",
+            }
 
-def _parse_cost(value):
-    """COST string'ini (tutar, para_birimi) olarak çevir: '21500.00 TL' -> (21500.0, 'TRY')"""
-    if value is None or (isinstance(value, float) and pd.isna(value)):
-        return 0.0, ''
-    s = str(value).strip()
-    if not s:
-        return 0.0, ''
+    manifest = MergeManifest(output_dir) if job['incremental'] else None
+    result = None
+    try:
+        with OutputCommit(output_dir) as output:
+            locked = output.locked_outputs()
+            if locked and notify:
+                notify(f"🔒 Açık dosya: {locked[0].name} — kapatılmazsa çıktı ek adla kaydedilecek")
+            result = _merge_pipeline(
+                [Path(f) for f in job['files']], output.temp_path, job['discount_pct'], job['fx_rates'],
+                show_header_info=job['show_header_info'], highlight=job['highlight'], manifest=manifest,
+                compresslevel=job['compresslevel'], progress=progress,
+                reporting_currency=job['reporting_currency'], memory_budget_mb=job['memory_budget_mb'],
+                cancel=cancel,
+                pool=pool, parse_cache=parse_cache,
+            )
+            output_path = output.commit(_output_filename(result['vessel_names']))
+            redirected = output.redirected_from
+    except BaseException:
+        # Çıktı kaydedilemediyse diske taşan sipariş listesi de temizlensin
+        if result is not None:
+            result['orders'].close()
+        if manifest is not None:
+            manifest.close()
+        raise
+    if manifest is not None:
+        manifest.save()
+    meta = {'total_items': result['total_items'], 'vessel_names': result['vessel_names'],
+            'order_count': len(result['orders']), 'missing_rates': result['missing_rates']}
+    if result['missing_rates'] and notify:
+        notify(f"⚠️ Kur bulunamadı: {', '.join(result['missing_rates'])} — 1.0 ile çevrildi, toplamları kontrol edin")
+    if cache_key:
+        try:
+            cache.store(cache_key, output_path, meta)
+        except Exception:
+            pass
+    history_error = None
+    try:
+        if job['record_history'] and result['orders']:
+            OrderHistoryStore().record_merge(result['orders'], job['fx_rates'], job['discount_pct'], output_path)
+    except Exception as e:
+        # Çıktı yazıldı, birleştirme başarılı sayılır; geçmişin eksik kaldığını GUI/CLI gösterir
+        history_error = f"{type(e).__name__}: {e}"
+    finally:
+        result['orders'].close()
+    return {
+        'output': str(output_path),
+        'redirected_from': str(redirected) if redirected else None,
+        **meta,
+        'reused': manifest.reused if manifest is not None else 0,
+        'spilled': result['orders'].spilled,
+        'history_error': history_error,
+        'cached': False,
+        'stats': result['stats'].summary(),
+    }
+
+
+class SharedParseCache:
+    """Servisteki işler arasında paylaşılan, (yol, mtime, boyut) anahtarlı LRU sipariş önbelleği."""
+
+    def __init__(self, max_entries=SERVICE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(file_path):
+        stamp = _input_stamp(file_path)
+        return (str(Path(file_path).resolve()), *stamp) if stamp else None
+
+    def contains(self, file_path):
+        key = self._key(file_path)
+        with self._lock:
+            if key in self._entries:
+                return True
+            self.misses += 1
+            return False
 
-    # Para birimini tespit et
-    currency = ''
-    text_part = re.sub(r'[\d.,\-\s]', '', s).strip()
-    if text_part:
-        currency = COST_CURRENCY_MAP.get(text_part.upper(), text_part.upper())
+    def lookup(self, file_path):
+        key = self._key(file_path)
+        with self._lock:
+            file_orders = self._entries.get(key) if key else None
+            if file_orders is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return file_orders
 
-    # Sayısal karakterleri, nokta ve virgülü al
-    num_str = re.sub(r'[^\d.,\-]', '', s)
-    if not num_str:
-        return 0.0, currency
-    # Türk formatı: 21.500,00 -> 21500.00
-    if ',' in num_str and '.' in num_str:
-        if num_str.rindex(',') > num_str.rindex('.'):
-            num_str = num_str.replace('.', '').replace(',', '.')
+    def store(self, file_path, file_orders):
+        key = self._key(file_path)
+        if not key or not file_orders:
+            return
+        with self._lock:
+            self._entries[key] = file_orders
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+def _warm_worker():
+    """Havuz sürecini önceden başlat (import'lar ilk işten önce yüklensin)."""
+    return os.getpid()
+
+
+class MergeService:
+    """Sıcak süreç havuzu, paylaşılan okuma önbelleği ve eşzamanlı iş kuyruğu."""
+
+    def __init__(self, workers=None, max_jobs=SERVICE_MAX_JOBS, cache_size=SERVICE_CACHE_SIZE, output_roots=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.output_roots = [Path(r).resolve() for r in output_roots or []]
+        try:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers) if self.workers > 1 else None
+        except (OSError, NotImplementedError):
+            self._pool = None
+        if self._pool is not None:
+            for f in [self._pool.submit(_warm_worker) for _ in range(self.workers)]:
+                f.result()
+        self._runner = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix='merge-job')
+        self.cache = SharedParseCache(cache_size)
+        self._jobs = OrderedDict()
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def submit(self, data):
+        """İşi kuyruğa al ve durum kaydını döndür.
+
+        Geçersiz istekte ValueError, izin verilen köklerin dışındaki output_dir'de
+        PermissionError yükselir.
+        """
+        job = _normalize_job(data)
+        output_dir = Path(job['output_dir'])
+        if self.output_roots and not any(output_dir.is_relative_to(root) for root in self.output_roots):
+            raise PermissionError(f"Çıktı klasörüne izin yok: {output_dir}")
+        job_id = uuid.uuid4().hex[:12]
+        record = {
+            'id': job_id, 'state': 'queued', 'progress': 0.0, 'message': '',
+            'files': len(job['files']), 'result': None, 'error': None,
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'started': None, 'finished': None,
+        }
+        with self._lock:
+            self._jobs[job_id] = record
+            self._tokens[job_id] = CancelToken()
+            while len(self._jobs) > SERVICE_KEEP_JOBS:
+                oldest = next(iter(self._jobs))
+                if self._jobs[oldest]['state'] in ('queued', 'running'):
+                    break
+                self._jobs.popitem(last=False)
+                self._tokens.pop(oldest, None)
+        self._runner.submit(self._run, job_id, job)
+        return self.status(job_id)
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def cancel(self, job_id):
+        """Kuyruktaki veya çalışan işi iptal et; iş yoksa None."""
+        with self._lock:
+            token = self._tokens.get(job_id)
+        if token is None:
+            return None
+        token.cancel()
+        return self.status(job_id)
+
+    def _run(self, job_id, job):
+        with self._lock:
+            token = self._tokens[job_id]
+        if token.cancelled:
+            self._update(job_id, state='cancelled', finished=datetime.now().isoformat(timespec='seconds'))
+            return
+        self._update(job_id, state='running', started=datetime.now().isoformat(timespec='seconds'))
+        try:
+            with _profile_run(f'job_{job_id}') as profiler:
+                result = _run_merge_job(
+                    job,
+                    progress=lambda p: self._update(job_id, progress=p),
+                    notify=lambda msg: self._update(job_id, message=msg),
+                    pool=self._pool, parse_cache=self.cache, cancel=token,
+                )
+            if profiler is not None:
+                result['profile'] = profiler.summary()
+            self._update(job_id, state='done', progress=1.0, result=result,
+                         finished=datetime.now().isoformat(timespec='seconds'))
+        except MergeCancelled:
+            self._update(job_id, state='cancelled', finished=datetime.now().isoformat(timespec='seconds'))
+        except Exception as e:
+            self._update(job_id, state='failed', error=str(e),
+                         finished=datetime.now().isoformat(timespec='seconds'))
+
+    def status(self, job_id):
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return dict(record) if record else None
+
+    def jobs(self):
+        with self._lock:
+            return [dict(r) for r in self._jobs.values()]
+
+    def health(self):
+        with self._lock:
+            active = sum(1 for r in self._jobs.values() if r['state'] in ('queued', 'running'))
+        return {'ok': True, 'workers': self.workers, 'active_jobs': active, 'cache': self.cache.stats()}
+
+    def shutdown(self):
+        self._runner.shutdown(wait=True)
+        if self._pool is not None:
+            self._pool.shutdown()
+
+
+class _ServiceHandler(BaseHTTPRequestHandler):
+    """Yerel JSON API: GET /health, GET /jobs, GET /jobs/<id>, POST /jobs, DELETE /jobs/<id>."""
+
+    service = None
+    token = ''
+
+    def _authorized(self):
+        """Anahtar tanımlıysa Authorization başlığını doğrula; değilse 401 gönder."""
+        if not self.token:
+            return True
+        given = self.headers.get('Authorization', '')
+        if hmac.compare_digest(given.encode('utf-8'), f'Bearer {self.token}'.encode('utf-8')):
+            return True
+        self._send_json(401, {'error': 'Yetkisiz: geçerli servis anahtarı gerekli'})
+        return False
+
+    def _send_json(self, code, payload):
+        body = json.dumps(payload, default=str).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if not self._authorized():
+            return
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        if parts == ['health']:
+            self._send_json(200, self.service.health())
+        elif parts == ['jobs']:
+            self._send_json(200, self.service.jobs())
+        elif len(parts) == 2 and parts[0] == 'jobs':
+            record = self.service.status(parts[1])
+            if record is None:
+                self._send_json(404, {'error': 'İş bulunamadı'})
+            else:
+                self._send_json(200, record)
         else:
-            num_str = num_str.replace(',', '')
-    elif ',' in num_str:
-        parts = num_str.split(',')
-        if len(parts[-1]) == 3 and len(parts) > 1:
-            num_str = num_str.replace(',', '')
+            self._send_json(404, {'error': 'Bilinmeyen adres'})
+
+    def do_POST(self):
+        if not self._authorized():
+            return
+        if self.path.split('?')[0].rstrip('/') != '/jobs':
+            self._send_json(404, {'error': 'Bilinmeyen adres'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            data = json.loads(self.rfile.read(length).decode('utf-8') or 'null')
+            self._send_json(202, self.service.submit(data))
+        except PermissionError as e:
+            self._send_json(403, {'error': str(e)})
+        except (ValueError, TypeError) as e:
+            self._send_json(400, {'error': str(e)})
+
+    def do_DELETE(self):
+        if not self._authorized():
+            return
+        parts = [p for p in self.path.split('?')[0].split('/') if p]
+        record = self.service.cancel(parts[1]) if len(parts) == 2 and parts[0] == 'jobs' else None
+        if record is None:
+            self._send_json(404, {'error': 'İş bulunamadı'})
         else:
-            num_str = num_str.replace(',', '.')
+            self._send_json(200, record)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve(host=SERVICE_DEFAULT_HOST, port=SERVICE_DEFAULT_PORT, workers=None, max_jobs=SERVICE_MAX_JOBS,
+           token=None, output_roots=None):
+    """Servisi başlat ve Ctrl+C'ye kadar çalıştır.
+
+    Anahtar ve çıktı kökleri verilmezse ortam değişkeni / ayar dosyasından okunur; yerel
+    olmayan adreste ikisi de yoksa servis başlamaz.
+    """
+    token = token or _service_token()
+    output_roots = output_roots or _service_output_roots()
+    if not _is_loopback(host):
+        if not token:
+            print(f"❌ {host} ağa açık: servis anahtarı gerekli ({SERVICE_TOKEN_ENV} veya ayarlarda "
+                  f"'service_token')", file=sys.stderr)
+            return 2
+        if not output_roots:
+            print(f"❌ {host} ağa açık: izin verilen çıktı kökleri gerekli (--output-root veya ayarlarda "
+                  f"'service_output_roots')", file=sys.stderr)
+            return 2
+    service = MergeService(workers=workers, max_jobs=max_jobs, output_roots=output_roots)
+    handler = type('ServiceHandler', (_ServiceHandler,), {'service': service, 'token': token})
+    server = ThreadingHTTPServer((host, port), handler)
+    print(f"🟢 Birleştirme servisi çalışıyor: http://{host}:{server.server_address[1]} "
+          f"({service.workers} işçi, en fazla {max_jobs} eşzamanlı iş"
+          f"{', anahtarlı' if token else ''}{', çıktı kökleri: ' + ', '.join(output_roots) if output_roots else ''})")
     try:
-        return float(num_str), currency
-    except ValueError:
-        return 0.0, currency
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown()
+    return 0
+
+
+class MergeServiceClient:
+    """Birleştirme servisine HTTP istemcisi (GUI ve CLI ortak kullanır)."""
+
+    def __init__(self, url=None, timeout=SERVICE_TIMEOUT, token=None):
+        self.url = (url or f'http://{SERVICE_DEFAULT_HOST}:{SERVICE_DEFAULT_PORT}').rstrip('/')
+        self.timeout = timeout
+        self.token = _service_token() if token is None else token
+
+    def _request(self, method, path, payload=None):
+        body = json.dumps(payload).encode('utf-8') if payload is not None else None
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+        req = urllib.request.Request(self.url + path, data=body, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return json.loads(resp.read().decode('utf-8'))
+        except urllib.error.HTTPError as e:
+            try:
+                message = json.loads(e.read().decode('utf-8')).get('error')
+            except Exception:
+                message = None
+            raise RuntimeError(message or f"Servis hatası: HTTP {e.code}") from None
+
+    def available(self):
+        try:
+            return bool(self._request('GET', '/health').get('ok'))
+        except Exception:
+            return False
+
+    def submit(self, job):
+        return self._request('POST', '/jobs', job)
+
+    def status(self, job_id):
+        return self._request('GET', f'/jobs/{job_id}')
+
+    def cancel(self, job_id):
+        return self._request('DELETE', f'/jobs/{job_id}')
+
+    def run(self, job, on_progress=None, on_message=None, poll=SERVICE_POLL_SECONDS, cancel=None):
+        """İşi gönder, bitene kadar izle ve sonucunu döndür (başarısızsa RuntimeError).
+
+        cancel tetiklenirse (veya Ctrl+C) servisteki iş de iptal edilir.
+        """
+        record = self.submit(job)
+        message = ''
+        try:
+            while record['state'] in ('queued', 'running'):
+                if cancel is not None and cancel.cancelled:
+                    raise MergeCancelled("İşlem iptal edildi")
+                time.sleep(poll)
+                record = self.status(record['id'])
+                if on_progress:
+                    on_progress(record['progress'])
+                if on_message and record.get('message') and record['message'] != message:
+                    message = record['message']
+                    on_message(message)
+        except BaseException:
+            try:
+                self.cancel(record['id'])
+            except Exception:
+                pass
+            raise
+        if record['state'] == 'cancelled':
+            raise MergeCancelled("İş serviste iptal edildi")
+        if record['state'] != 'done':
+            raise RuntimeError(record.get('error') or "Servis işi başarısız")
+        return record['result']
+
+
+# ── Canlı Toplam Önizlemesi ──────────────────────────────────
+
+def _orders_aggregate(file_orders):
+    """Dosyanın siparişlerinden kurdan bağımsız kovalar.
+
+    sale: satış P.B. -> satış toplamı; cost: (satış P.B., maliyet P.B.) -> maliyetin kendi
+    P.B.'indeki toplamı; orders: satış P.B. -> sipariş sayısı.
+    """
+    agg = {'sale': {}, 'cost': {}, 'orders': {}, 'items': 0}
+    for order_data in file_orders:
+        sale_currency = order_data['header_info'].get('currency', '').upper()
+        agg['orders'][sale_currency] = agg['orders'].get(sale_currency, 0) + 1
+        sale = agg['sale'].get(sale_currency, 0.0)
+        for data_row in order_data['data_rows']:
+            cells = list(data_row) + [None] * (DATA_ROW_WIDTH - len(data_row))
+            qty = _to_float(cells[3])
+            sale += qty * _to_float(cells[5])
+            unit_cost, cost_currency = _parse_cost(cells[9])
+            if unit_cost > 0:
+                key = (sale_currency, cost_currency)
+                agg['cost'][key] = agg['cost'].get(key, 0.0) + qty * unit_cost
+        agg['sale'][sale_currency] = sale
+        agg['items'] += len(order_data['data_rows'])
+    return agg
+
+
+class TotalsPreview:
+    """Birleştirme yapmadan satış / alış / indirim / kâr önizlemesi.
+
+    Dosya ekleme ve çıkarma yalnızca o dosyanın kovalarını toplama ekler/çıkarır;
+    sıra toplamı etkilemez; kur, indirim ve rapor para birimi değişince toplam
+    birkaç para birimi kovasından yeniden hesaplanır. Tarama thread'inden
+    güncellenip arayüzden okunduğu için kilitlidir.
+    """
+
+    def __init__(self):
+        self._files = {}
+        self._sale = {}
+        self._cost = {}
+        self._orders = {}
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def add(self, key, file_orders):
+        agg = _orders_aggregate(file_orders)
+        with self._lock:
+            if key in self._files:
+                self._apply(self._files.pop(key), -1)
+            self._files[key] = agg
+            self._apply(agg, 1)
+
+    def remove(self, key):
+        with self._lock:
+            agg = self._files.pop(key, None)
+            if agg is not None:
+                self._apply(agg, -1)
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._sale.clear()
+            self._cost.clear()
+            self._orders.clear()
+            self.items = 0
+
+    def _apply(self, agg, sign):
+        for cur, count in agg['orders'].items():
+            self._orders[cur] = self._orders.get(cur, 0) + sign * count
+        for cur, amount in agg['sale'].items():
+            self._sale[cur] = self._sale.get(cur, 0.0) + sign * amount
+        for key, amount in agg['cost'].items():
+            self._cost[key] = self._cost.get(key, 0.0) + sign * amount
+        self.items += sign * agg['items']
+        # Siparişi kalmayan para birimi kovaları atılır (çıkarma sonrası kayan nokta artığı kalmasın)
+        for cur in [c for c, n in self._orders.items() if n <= 0]:
+            del self._orders[cur]
+            self._sale.pop(cur, None)
+            for key in [k for k in self._cost if k[0] == cur]:
+                del self._cost[key]
+
+    def totals(self, fx_rates, discount_pct, reporting_currency=REPORTING_CURRENCY):
+        """Çıktının Grand Summary'siyle aynı kurallarla toplamlar (satır yuvarlaması hariç)."""
+        with self._lock:
+            known = {c for c in self._orders if c}
+            mixed = len(known) > 1
+            currency = reporting_currency if mixed else (next(iter(known)) if known else '')
+
+            def to_report(amount, cur):
+                return amount * _fx_factor(cur or reporting_currency, reporting_currency, fx_rates) if mixed else amount
+
+            sale = sum(to_report(v, cur) for cur, v in self._sale.items())
+            cost = sum(to_report(v * _fx_factor(cost_cur, sale_cur, fx_rates), sale_cur)
+                       for (sale_cur, cost_cur), v in self._cost.items())
+            orders = sum(self._orders.values())
+            # items da kilit altında okunur: tarama thread'i araya girerse sipariş ve item sayıları tutarsız kalır
+            items = self.items
+        discount = sale * discount_pct / 100
+        return {'currency': currency, 'orders': orders, 'items': items, 'sale': sale, 'cost': cost,
+                'discount': discount, 'profit': sale - discount - cost}
+
+
+# ── Sipariş Önizlemesi ───────────────────────────────────────
+
+PREVIEW_PAGE_ROWS = 100
+# (başlık, data_rows sütunu, genişlik)
+PREVIEW_COLUMNS = [
+    ('NO', 0, 45), ('DESCRIPTION', 1, 280), ('CODE', 2, 100), ('QTTY', 3, 55),
+    ('UNIT', 4, 55), ('U.PRICE', 5, 90), ('COST', 9, 110),
+]
+
+
+def _preview_page_rows(file_orders, page, page_size=PREVIEW_PAGE_ROWS):
+    """Sayfadaki (sipariş indeksi, veri satırı) çiftleri; yalnızca sayfanın dilimi gezilir."""
+    skip = page * page_size
+    rows = []
+    for idx, order_data in enumerate(file_orders):
+        data_rows = order_data['data_rows']
+        if skip >= len(data_rows):
+            skip -= len(data_rows)
+            continue
+        rows.extend((idx, r) for r in data_rows[skip:skip + page_size - len(rows)])
+        skip = 0
+        if len(rows) >= page_size:
+            break
+    return rows
+
+
+def _preview_cell(value):
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.strftime('%d.%m.%Y')
+    if isinstance(value, float):
+        return f'{value:,.2f}' if not value.is_integer() else f'{int(value)}'
+    return str(value)
+
+
+# ── Arayüz Güncelleme Veriyolu ──────────────────────────────
+#
+# Worker thread'leri Tk'ye doğrudan root.after atmaz; güncellemeler kuyruğa yazılır ve
+# ana döngü bunları sabit kare aralığında toplu uygular. Aynı anahtarlı güncellemelerde
+# son değer kazanır (durum satırı, ilerleme, dosya listesi); bekleyen iş yokken zamanlayıcı
+# kurulmaz. Nabız animasyonu da ayrı 30 ms döngüsü yerine aynı karede ilerler.
+
+UI_FRAME_MS = 50
+PULSE_SPEED = 0.02 / 0.030
+
+
+class UIUpdateBus:
+    """Thread'lerden gelen arayüz güncellemelerini birleştirip kare başına bir kez uygular."""
+
+    def __init__(self, root, frame_ms=UI_FRAME_MS):
+        self.root = root
+        self.frame_ms = max(10, int(frame_ms))
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._seq = itertools.count()
+        self._scheduled = False
+        self._tickers = {}
+        self._last_frame = time.perf_counter()
+
+    def post(self, key, fn, *args):
+        """Anahtarlı güncelleme: karede bekleyen aynı anahtarlı güncellemenin yerine geçer."""
+        with self._lock:
+            self._pending.pop(key, None)
+            self._pending[key] = (fn, args)
+            self._schedule()
+
+    def call(self, fn, *args):
+        """Sıralı tek seferlik iş (mesaj kutusu, kilit açma...); birleştirilmez."""
+        with self._lock:
+            self._pending[('call', next(self._seq))] = (fn, args)
+            self._schedule()
+
+    def animate(self, key, fn):
+        """Her karede fn(geçen_sn) çağır; stop_animation'a kadar sürer. Ana thread'den çağrılır."""
+        self._tickers[key] = fn
+        with self._lock:
+            self._schedule()
+
+    def stop_animation(self, key):
+        self._tickers.pop(key, None)
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self.root.after(self.frame_ms, self._drain)
+
+    def _drain(self):
+        now = time.perf_counter()
+        elapsed, self._last_frame = now - self._last_frame, now
+        with self._lock:
+            pending, self._pending = self._pending, OrderedDict()
+            self._scheduled = False
+        for fn in list(self._tickers.values()):
+            self._run(fn, (min(elapsed, 0.25),))
+        for fn, args in pending.values():
+            self._run(fn, args)
+        with self._lock:
+            if self._tickers or self._pending:
+                self._schedule()
+
+    def _run(self, fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            self.root.report_callback_exception(*sys.exc_info())
 
 
 class Tooltip:
@@ -136,29 +4561,33 @@ class OrderSummaryMerger:
         self.root = root
         self.uploaded_files = []
         self.file_item_counts = {}
+        self.file_order_counts = {}
+        self.totals_preview = TotalsPreview()
+        self.file_orders = {}
+        # Tarama thread'i sonuç yayınlarken liste silme/temizleme ile yarışmasın
+        self._files_lock = threading.Lock()
+        self._preview_file = None
+        self._preview_page = 0
         self.output_path = None
         self.custom_output_dir = None
         self.is_processing = False
         self._pulsing = False
         self._all_buttons = []
+        self._cancel_token = None
+        self._scan_token = None
 
         self._last_browse_dir = self._load_setting('last_browse_dir', '')
-
-        # Openpyxl stil objeleri
-        self._thin_border = Border(
-            left=Side(style='thin'), right=Side(style='thin'),
-            top=Side(style='thin'), bottom=Side(style='thin')
-        )
-        self._no_border = Border()
-        self._header_fill = PatternFill(start_color='3498DB', end_color='3498DB', fill_type='solid')
-        self._header_font = Font(bold=True, size=11, color='FFFFFF')
-        self._center_align = Alignment(horizontal='center', vertical='center')
-        self._data_align = Alignment(vertical='center', wrap_text=True)
-        self._bold_font = Font(bold=True, size=11)
-        self._right_align = Alignment(horizontal='right', vertical='center')
+        self.ui = UIUpdateBus(root, self._load_setting('ui_frame_ms', UI_FRAME_MS))
 
         self.setup_ui()
         self._setup_dnd()
+        self._warn_layout_profiles()
+
+    def _warn_layout_profiles(self):
+        """Düzen dosyasında atlanan profiller varsa kullanıcıya bir kez göster."""
+        _get_layout_plans()
+        if _layout_warnings:
+            self.root.after(0, lambda: messagebox.showwarning("Düzen Profilleri", "\n".join(_layout_warnings)))
 
     # ── Ayarlar ──────────────────────────────────────────────
 
@@ -200,9 +4629,8 @@ class OrderSummaryMerger:
     def _on_drop(self, event):
         files = self.root.tk.splitlist(event.data)
         added = False
-        for file_path in files:
-            path = Path(file_path)
-            if path.suffix.lower() == '.xlsx' and path not in self.uploaded_files:
+        for path in _expand_inputs(files):
+            if _is_supported_file(path) and path not in self.uploaded_files:
                 self.uploaded_files.append(path)
                 added = True
         if added:
@@ -307,9 +4735,75 @@ class OrderSummaryMerger:
         Tooltip(btn_up, "Seçili dosyayı yukarı taşı")
         Tooltip(btn_down, "Seçili dosyayı aşağı taşı")
 
+        # ── PREVIEW CARD ──
+        preview_card = self._create_card(content_frame, "🔍 Önizleme")
+        preview_card.grid(row=2, column=0, sticky="ew", pady=(0, 20))
+
+        self.preview_info_label = ctk.CTkLabel(
+            preview_card,
+            text="Önizlemek için listeden bir dosya seçin",
+            font=("Segoe UI", 11),
+            text_color="#7F8C8D",
+            justify="left",
+            anchor="w"
+        )
+        self.preview_info_label.pack(fill="x", padx=15, pady=(10, 5))
+
+        preview_frame = ctk.CTkFrame(preview_card, fg_color="#FFFFFF", corner_radius=8)
+        preview_frame.pack(fill="both", expand=True, padx=15)
+
+        style.configure('Preview.Treeview', rowheight=24, font=("Segoe UI", 10))
+        style.configure('Preview.Treeview.Heading', font=("Segoe UI", 10, "bold"), background="#ECF0F1", foreground="#2C3E50")
+        # Sadece geçerli sayfanın satırları Treeview'e eklenir (PREVIEW_PAGE_ROWS)
+        self.preview_tree = ttk.Treeview(
+            preview_frame, columns=[name for name, _, _ in PREVIEW_COLUMNS], show="headings",
+            height=10, selectmode="none", style='Preview.Treeview'
+        )
+        for name, _, width in PREVIEW_COLUMNS:
+            self.preview_tree.heading(name, text=name)
+            self.preview_tree.column(name, anchor="w" if name == 'DESCRIPTION' else "center", width=width)
+        self.preview_tree.tag_configure('even', background='#F8FBFF')
+        self.preview_tree.tag_configure('odd', background='#FFFFFF')
+        preview_scroll = ttk.Scrollbar(preview_frame, command=self.preview_tree.yview)
+        self.preview_tree.configure(yscrollcommand=preview_scroll.set)
+        self.preview_tree.pack(side="left", fill="both", expand=True)
+        preview_scroll.pack(side="right", fill="y")
+
+        preview_nav = ctk.CTkFrame(preview_card, fg_color="#FFFFFF")
+        preview_nav.pack(fill="x", padx=15, pady=(8, 15))
+        self.preview_prev_btn = ctk.CTkButton(
+            preview_nav, text="◀", command=lambda: self._show_preview_page(-1),
+            fg_color="#8E44AD", hover_color="#7D3C98", text_color="white",
+            font=("Segoe UI", 11, "bold"), width=40, corner_radius=8, state="disabled"
+        )
+        self.preview_prev_btn.pack(side="left")
+        self.preview_page_label = ctk.CTkLabel(preview_nav, text="", font=("Segoe UI", 11), text_color="#7F8C8D")
+        self.preview_page_label.pack(side="left", padx=10)
+        self.preview_next_btn = ctk.CTkButton(
+            preview_nav, text="▶", command=lambda: self._show_preview_page(1),
+            fg_color="#8E44AD", hover_color="#7D3C98", text_color="white",
+            font=("Segoe UI", 11, "bold"), width=40, corner_radius=8, state="disabled"
+        )
+        self.preview_next_btn.pack(side="left")
+
+        self.tree.bind('<<TreeviewSelect>>', self._on_tree_select)
+
+        # ── LIVE TOTALS CARD ──
+        totals_card = self._create_card(content_frame, "📈 Canlı Özet")
+        totals_card.grid(row=3, column=0, sticky="ew", pady=(0, 20))
+
+        self.totals_label = ctk.CTkLabel(
+            totals_card,
+            text="Dosya eklendikçe satış, alış ve kâr burada görünür",
+            font=("Segoe UI", 12),
+            text_color="#7F8C8D",
+            justify="left"
+        )
+        self.totals_label.pack(anchor="w", padx=15, pady=(10, 15))
+
         # ── DISCOUNT CARD ──
         discount_card = self._create_card(content_frame, "💰 Firma İndirim Oranı")
-        discount_card.grid(row=2, column=0, sticky="ew", pady=(0, 20))
+        discount_card.grid(row=4, column=0, sticky="ew", pady=(0, 20))
 
         discount_inner = ctk.CTkFrame(discount_card, fg_color="#FFFFFF")
         discount_inner.pack(fill="x", padx=15, pady=(10, 15))
@@ -349,7 +4843,7 @@ class OrderSummaryMerger:
 
         # ── EXCHANGE RATE CARD ──
         fx_card = self._create_card(content_frame, "💱 Döviz Kurları (Alış = Satış Kuru)")
-        fx_card.grid(row=3, column=0, sticky="ew", pady=(0, 20))
+        fx_card.grid(row=5, column=0, sticky="ew", pady=(0, 20))
 
         fx_inner = ctk.CTkFrame(fx_card, fg_color="#FFFFFF")
         fx_inner.pack(fill="x", padx=15, pady=(10, 15))
@@ -404,7 +4898,7 @@ class OrderSummaryMerger:
 
         # ── OUTPUT PATH CARD ──
         output_card = self._create_card(content_frame, "📁 Çıktı Konumu")
-        output_card.grid(row=4, column=0, sticky="ew", pady=(0, 20))
+        output_card.grid(row=6, column=0, sticky="ew", pady=(0, 20))
 
         output_inner = ctk.CTkFrame(output_card, fg_color="#FFFFFF")
         output_inner.pack(fill="x", padx=15, pady=(10, 15))
@@ -428,7 +4922,7 @@ class OrderSummaryMerger:
 
         # ── STATUS CARD ──
         status_card = self._create_card(content_frame, "⚙️ Durum")
-        status_card.grid(row=5, column=0, sticky="ew", pady=(0, 20))
+        status_card.grid(row=7, column=0, sticky="ew", pady=(0, 20))
 
         self.status_label = ctk.CTkLabel(status_card, text="✅ Hazır", font=("Segoe UI", 12), text_color="#27AE60")
         self.status_label.pack(anchor="w", padx=15, pady=(10, 5))
@@ -439,7 +4933,7 @@ class OrderSummaryMerger:
 
         # ── OPTIONS ──
         options_frame = ctk.CTkFrame(content_frame, fg_color="transparent")
-        options_frame.grid(row=6, column=0, sticky="ew", pady=(0, 10))
+        options_frame.grid(row=8, column=0, sticky="ew", pady=(0, 10))
 
         self.auto_open_var = ctk.BooleanVar(value=self._load_setting('auto_open', False))
         ctk.CTkCheckBox(
@@ -461,11 +4955,56 @@ class OrderSummaryMerger:
             command=lambda: self._save_setting('show_header_info', self.show_header_info_var.get())
         ).pack(anchor="w", pady=(5, 0))
 
+        self.highlight_var = ctk.BooleanVar(value=self._load_setting('highlight', True))
+        ctk.CTkCheckBox(
+            options_frame,
+            text="Zarar, eksik maliyet ve yüksek marj satırlarını vurgula",
+            variable=self.highlight_var,
+            font=("Segoe UI", 12),
+            text_color="#2C3E50",
+            command=lambda: self._save_setting('highlight', self.highlight_var.get())
+        ).pack(anchor="w", pady=(5, 0))
+
+        self.incremental_var = ctk.BooleanVar(value=self._load_setting('incremental_merge', False))
+        ctk.CTkCheckBox(
+            options_frame,
+            text="Değişmeyen dosyaları yeniden okuma (artımlı birleştirme)",
+            variable=self.incremental_var,
+            font=("Segoe UI", 12),
+            text_color="#2C3E50",
+            command=lambda: self._save_setting('incremental_merge', self.incremental_var.get())
+        ).pack(anchor="w", pady=(5, 0))
+
+        compress_frame = ctk.CTkFrame(options_frame, fg_color="transparent")
+        compress_frame.pack(anchor="w", pady=(5, 0))
+        ctk.CTkLabel(compress_frame, text="Çıktı sıkıştırma:", font=("Segoe UI", 12), text_color="#2C3E50").pack(side="left", padx=(0, 8))
+        self.compress_var = ctk.StringVar(value=self._load_setting('zip_compression', 'Normal (6)'))
+        ctk.CTkOptionMenu(
+            compress_frame,
+            values=list(ZIP_COMPRESSION_CHOICES),
+            variable=self.compress_var,
+            font=("Segoe UI", 11),
+            width=140,
+            command=lambda v: self._save_setting('zip_compression', v)
+        ).pack(side="left")
+
+        ctk.CTkLabel(compress_frame, text="Rapor para birimi:", font=("Segoe UI", 12), text_color="#2C3E50").pack(side="left", padx=(16, 8))
+        self.reporting_currency_var = ctk.StringVar(value=self._load_setting('reporting_currency', REPORTING_CURRENCY))
+        ctk.CTkOptionMenu(
+            compress_frame,
+            values=REPORTING_CURRENCIES,
+            variable=self.reporting_currency_var,
+            font=("Segoe UI", 11),
+            width=80,
+            command=lambda v: self._save_setting('reporting_currency', v)
+        ).pack(side="left")
+
         # ── ACTION BUTTONS ──
         action_frame = ctk.CTkFrame(content_frame, fg_color="transparent")
-        action_frame.grid(row=7, column=0, sticky="ew", pady=(10, 0))
+        action_frame.grid(row=9, column=0, sticky="ew", pady=(10, 0))
         action_frame.grid_columnconfigure(0, weight=1)
         action_frame.grid_columnconfigure(1, weight=1)
+        action_frame.grid_columnconfigure(2, weight=0)
 
         self.merge_btn = ctk.CTkButton(
             action_frame,
@@ -495,9 +5034,29 @@ class OrderSummaryMerger:
         )
         self.open_btn.grid(row=0, column=1, sticky="ew")
 
+        self.cancel_btn = ctk.CTkButton(
+            action_frame,
+            text="⛔ İptal",
+            command=self.cancel_operation,
+            fg_color="#C0392B",
+            hover_color="#922B21",
+            text_color="white",
+            font=("Segoe UI", 14, "bold"),
+            width=110,
+            height=50,
+            corner_radius=10,
+            state="disabled"
+        )
+        self.cancel_btn.grid(row=0, column=2, sticky="ew", padx=(10, 0))
+
+        # İndirim, kur veya rapor para birimi değişince özet birleştirmeden güncellenir
+        for var in (self.discount_var, self.eur_tl_var, self.usd_tl_var, self.reporting_currency_var):
+            var.trace_add('write', lambda *_: self._refresh_totals())
+
         Tooltip(self.drop_area, "Sipariş özeti Excel dosyalarını seçmek için tıkla")
         Tooltip(self.merge_btn, "Seçili dosyaları tek bir Excel'de birleştir")
         Tooltip(self.open_btn, "Oluşturulan birleştirilmiş dosyayı aç")
+        Tooltip(self.cancel_btn, "Süren birleştirmeyi veya taramayı durdur")
 
         self._all_buttons = [
             self.drop_area, btn_add, btn_del, btn_clear,
@@ -518,14 +5077,14 @@ class OrderSummaryMerger:
         files = filedialog.askopenfilenames(
             title="Sipariş Özeti Dosyalarını Seçin",
             initialdir=initial_dir,
-            filetypes=[("Excel files", "*.xlsx"), ("All files", "*.*")]
+            filetypes=[("Excel files", ' '.join('*' + ext for ext in SUPPORTED_SUFFIXES + ARCHIVE_SUFFIXES)),
+                       ("All files", "*.*")]
         )
         if not files:
             return
         added = False
-        for file_path in files:
-            path = Path(file_path)
-            if path.suffix.lower() == '.xlsx' and path not in self.uploaded_files:
+        for path in _expand_inputs(files):
+            if _is_supported_file(path) and path not in self.uploaded_files:
                 self.uploaded_files.append(path)
                 added = True
         self._last_browse_dir = str(Path(files[0]).parent)
@@ -534,29 +5093,58 @@ class OrderSummaryMerger:
             self._scan_and_update()
 
     def _scan_and_update(self):
+        # Süren tarama yenisiyle değiştirilir; yeni tarama eksik dosyaların hepsini kapsar
+        if self._scan_token is not None:
+            self._scan_token.cancel()
+        self._scan_token = CancelToken()
+        _input_stager().stage(self.uploaded_files)
         self.update_file_list()
-        threading.Thread(target=self._scan_worker, daemon=True).start()
+        self._refresh_cancel_button()
+        threading.Thread(target=self._run_profiled, args=('scan', self._scan_worker, self._scan_token), daemon=True).start()
 
-    def _scan_worker(self):
-        for f in list(self.uploaded_files):
-            if f not in self.file_item_counts:
-                data = self._extract_order_data(f)
-                self.file_item_counts[f] = len(data['data_rows']) if data else -1
-        self.root.after(0, self.update_file_list)
+    def _scan_worker(self, token):
+        try:
+            with self._files_lock:
+                files = list(self.uploaded_files)
+            for f in files:
+                token.check()
+                if f not in self.file_item_counts:
+                    file_orders = self._extract_orders(f, token)
+                    with self._files_lock:
+                        # Tarama sırasında listeden çıkarılan dosya özet ve sayaçlara geri girmesin
+                        token.check()
+                        if f not in self.uploaded_files:
+                            continue
+                        self.file_item_counts[f] = sum(len(o['data_rows']) for o in file_orders) if file_orders else -1
+                        self.file_order_counts[f] = len(file_orders)
+                        self.totals_preview.add(f, file_orders)
+                        self.file_orders[f] = file_orders
+                    self.ui.post('file_list', self.update_file_list)
+        except MergeCancelled:
+            pass
+        finally:
+            if self._scan_token is token:
+                self._scan_token = None
+            self.ui.post('file_list', self.update_file_list)
+            self.ui.post('cancel_button', self._refresh_cancel_button)
 
     def update_file_list(self):
         self.tree.delete(*self.tree.get_children())
         for i, f in enumerate(self.uploaded_files):
             count = self.file_item_counts.get(f)
             if count is None:
-                status = "⏳ Taranıyor..."
+                status = "⏳ Taranıyor..." if self._scan_token is not None else "⏸ Taranmadı"
             elif count < 0:
                 status = "⚠️ Okunamadı"
+            elif self.file_order_counts.get(f, 1) > 1:
+                status = f"📊 {count} item ({self.file_order_counts[f]} sayfa)"
             else:
                 status = f"📊 {count} item"
             tag = 'even' if i % 2 == 0 else 'odd'
-            self.tree.insert("", "end", values=(f.name, status), tags=(tag,))
+            self.tree.insert("", "end", values=(_input_label(f), status), tags=(tag,))
 
+        self._refresh_totals()
+        self._render_preview()
         file_count = len(self.uploaded_files)
         if file_count > 0:
             total = sum(c for c in self.file_item_counts.values() if c and c > 0)
@@ -569,20 +5157,119 @@ class OrderSummaryMerger:
             self.status_label.configure(text="⏳ Dosya seçin", text_color="#7F8C8D")
             self.merge_btn.configure(state="disabled")
 
+    def _on_tree_select(self, _event=None):
+        selected = self.tree.selection()
+        if len(selected) != 1:
+            return
+        idx = self.tree.index(selected[0])
+        if 0 <= idx < len(self.uploaded_files):
+            f = self.uploaded_files[idx]
+            if f != self._preview_file:
+                self._preview_file, self._preview_page = f, 0
+                self._render_preview()
+
+    def _show_preview_page(self, delta):
+        self._preview_page += delta
+        self._render_preview()
+
+    def _render_preview(self):
+        """Seçili dosyanın taramada okunmuş siparişlerinden yalnızca geçerli sayfayı çiz."""
+        self.preview_tree.delete(*self.preview_tree.get_children())
+        f = self._preview_file
+        file_orders = self.file_orders.get(f)
+        if f is None or f not in self.uploaded_files or not file_orders:
+            if f is None or f not in self.uploaded_files:
+                self._preview_file = None
+                text = "Önizlemek için listeden bir dosya seçin"
+            elif self.file_item_counts.get(f) is None:
+                text = f"⏳ {_input_label(f)} taranıyor..."
+            else:
+                text = f"⚠️ {_input_label(f)} okunamadı"
+            self.preview_info_label.configure(text=text, text_color="#7F8C8D")
+            self.preview_page_label.configure(text="")
+            self.preview_prev_btn.configure(state="disabled")
+            self.preview_next_btn.configure(state="disabled")
+            return
+
+        total = sum(len(o['data_rows']) for o in file_orders)
+        page_count = max(1, -(-total // PREVIEW_PAGE_ROWS))
+        self._preview_page = min(max(self._preview_page, 0), page_count - 1)
+        rows = _preview_page_rows(file_orders, self._preview_page)
+
+        order_data = file_orders[rows[0][0]] if rows else file_orders[0]
+        info = order_data['header_info']
+        parts = [order_data['file_name']]
+        for label, key in (('Gemi', 'vessel'), ('Tarih', 'date'), ('RFQ', 'rfq_ref'), ('QTN', 'qtn_ref'), ('P.B.', 'currency')):
+            if info.get(key):
+                parts.append(f"{label}: {info[key]}")
+        if order_data.get('layout') and order_data['layout'] != DEFAULT_LAYOUT['name']:
+            parts.append(f"Düzen: {order_data['layout']}")
+        self.preview_info_label.configure(text="  |  ".join(parts), text_color="#2C3E50")
+
+        for i, (_, data_row) in enumerate(rows):
+            values = [_preview_cell(data_row[col] if col < len(data_row) else None) for _, col, _ in PREVIEW_COLUMNS]
+            self.preview_tree.insert("", "end", values=values, tags=('even' if i % 2 == 0 else 'odd',))
+        first = self._preview_page * PREVIEW_PAGE_ROWS
+        self.preview_page_label.configure(
+            text=f"Sayfa {self._preview_page + 1}/{page_count}  ·  {first + 1 if rows else 0}–{first + len(rows)} / {total} item"
+        )
+        self.preview_prev_btn.configure(state="normal" if self._preview_page > 0 else "disabled")
+        self.preview_next_btn.configure(state="normal" if self._preview_page < page_count - 1 else "disabled")
+
+    def _refresh_totals(self):
+        """Canlı özet kartını önizleme kovalarından yeniden yaz (çalışma kitabı üretmeden)."""
+        t = self.totals_preview.totals(
+            self._get_fx_rates(save=False), self._get_discount_pct(save=False), self.reporting_currency_var.get()
+        )
+        if not t['orders']:
+            self.totals_label.configure(text="Dosya eklendikçe satış, alış ve kâr burada görünür", text_color="#7F8C8D")
+            return
+        symbol = _currency_symbol(t['currency'])
+
+        def money(value):
+            return f"{symbol}{value:,.2f}"
+
+        lines = [
+            f"🧾 {t['orders']} sipariş · {t['items']} item",
+            f"Satış: {money(t['sale'])}     Alış: {money(t['cost'])}",
+        ]
+        if t['discount']:
+            lines.append(f"İndirim: {money(t['discount'])}     Final satış: {money(t['sale'] - t['discount'])}")
+        net_sale = t['sale'] - t['discount']
+        margin = f" (%{100 * t['profit'] / net_sale:.1f})" if net_sale else ""
+        lines.append(f"Kâr / Zarar: {money(t['profit'])}{margin}")
+        self.totals_label.configure(text="\n".join(lines), text_color="#27AE60" if t['profit'] >= 0 else "#C0392B")
+
     def remove_selected(self):
         selected = self.tree.selection()
         if not selected:
             return
         indices = sorted([self.tree.index(item) for item in selected], reverse=True)
-        for idx in indices:
-            if 0 <= idx < len(self.uploaded_files):
-                removed = self.uploaded_files.pop(idx)
-                self.file_item_counts.pop(removed, None)
-        self.update_file_list()
+        with self._files_lock:
+            for idx in indices:
+                if 0 <= idx < len(self.uploaded_files):
+                    removed = self.uploaded_files.pop(idx)
+                    self.file_item_counts.pop(removed, None)
+                    self.file_order_counts.pop(removed, None)
+                    self.totals_preview.remove(removed)
+                    self.file_orders.pop(removed, None)
+        if self._scan_token is not None:
+            # Süren tarama kalan dosyalarla yeniden başlasın (silinen dosyayı okumaya devam etmesin)
+            self._scan_and_update()
+        else:
+            self.update_file_list()
 
     def clear_all(self):
-        self.uploaded_files.clear()
-        self.file_item_counts.clear()
+        if self._scan_token is not None:
+            self._scan_token.cancel()
+            self._scan_token = None
+        with self._files_lock:
+            self.uploaded_files.clear()
+            self.file_item_counts.clear()
+            self.file_order_counts.clear()
+            self.totals_preview.clear()
+            self.file_orders.clear()
+        self._refresh_cancel_button()
         self.update_file_list()
         self.open_btn.configure(state="disabled")
 
@@ -620,16 +5307,20 @@ class OrderSummaryMerger:
 
     # ── Birleştirme ──────────────────────────────────────────
 
-    def _get_discount_pct(self):
+    def _get_discount_pct(self, save=True):
         try:
             val = float(self.discount_var.get().replace(',', '.').strip())
-            self._save_setting('discount_pct', val)
+            if save:
+                self._save_setting('discount_pct', val)
             return val
         except (ValueError, TypeError):
             return 0.0
 
-    def _get_fx_rates(self):
-        """Döviz kurlarını al ve kaydet. TL cinsinden kurları döndürür."""
+    def _get_compresslevel(self):
+        return ZIP_COMPRESSION_CHOICES.get(self.compress_var.get(), ZIP_COMPRESSLEVEL)
+
+    def _get_fx_rates(self, save=True):
+        """Döviz kurlarını al (save ise kaydet). TL cinsinden kurları döndürür."""
         rates = {}
         for key, var, default in [
             ('eur_tl_rate', self.eur_tl_var, 38.50),
@@ -639,7 +5330,8 @@ class OrderSummaryMerger:
                 val = float(var.get().replace(',', '.').strip())
             except (ValueError, TypeError):
                 val = default
-            self._save_setting(key, val)
+            if save:
+                self._save_setting(key, val)
             rates[key] = val
         return {
             'TRY': 1.0,
@@ -684,7 +5376,7 @@ class OrderSummaryMerger:
                     )
                     self.fx_fetch_btn.configure(state="normal", text="🔄 Güncel Kurları Çek")
 
-                self.root.after(0, _update)
+                self.ui.call(_update)
             else:
                 raise ValueError("Kur verisi alınamadı")
 
@@ -698,24 +5390,45 @@ class OrderSummaryMerger:
                 )
                 self.fx_fetch_btn.configure(state="normal", text="🔄 Güncel Kurları Çek")
 
-            self.root.after(0, _error)
+            self.ui.call(_error)
 
     def _convert_cost(self, amount, cost_currency, sale_currency, fx_rates):
         """Cost'u satış para birimine çevir. Tüm kurlar TL cinsindendir."""
-        if not cost_currency or cost_currency == sale_currency:
-            return amount
-        cost_in_tl = amount * fx_rates.get(cost_currency, 1.0)
-        sale_rate = fx_rates.get(sale_currency, 1.0)
-        if sale_rate == 0:
-            return amount
-        return cost_in_tl / sale_rate
+        return _convert_cost(amount, cost_currency, sale_currency, fx_rates)
 
     def merge_files(self):
         if self.is_processing:
             return
         self.is_processing = True
+        self._cancel_token = CancelToken()
         self._lock_ui()
-        threading.Thread(target=self._merge_worker, daemon=True).start()
+        self._refresh_cancel_button()
+        threading.Thread(target=self._run_profiled, args=('merge', self._merge_worker, self._cancel_token), daemon=True).start()
+
+    def cancel_operation(self):
+        """Süren birleştirme ve taramaya iptal sinyali gönder (kontrol noktalarında durur)."""
+        cancelled = False
+        for token in (self._cancel_token, self._scan_token):
+            if token is not None and not token.cancelled:
+                token.cancel()
+                cancelled = True
+        if cancelled:
+            self.cancel_btn.configure(state="disabled")
+            self.status_label.configure(text="⛔ İptal ediliyor...", text_color="#C0392B")
+
+    def _refresh_cancel_button(self):
+        busy = self._cancel_token is not None or self._scan_token is not None
+        self.cancel_btn.configure(state="normal" if busy else "disabled")
+
+    def _run_profiled(self, name, worker, *args):
+        """Worker'ı çalıştır; profil modu açıksa en yoğun fonksiyonları durum satırına ekle."""
+        with _profile_run(name) as profiler:
+            worker(*args)
+        if profiler is not None and profiler.summary():
+            summary = profiler.summary()
+            self.ui.call(lambda: self.status_label.configure(
+                text=f"{self.status_label.cget('text')}\n{summary}"
+            ))
 
     def _check_write_permission(self, dir_path):
         try:
@@ -727,24 +5440,18 @@ class OrderSummaryMerger:
             return False
 
     def _is_file_locked(self, file_path):
-        if not file_path.exists():
-            return False
-        try:
-            with open(file_path, 'r+b'):
-                return False
-        except (IOError, PermissionError):
-            return True
+        return _is_file_locked(file_path)
 
-    def _merge_worker(self):
+    def _merge_worker(self, token):
         try:
             self._update_progress(0)
             self._update_status("⏳ Hazırlanıyor...", "#F39C12")
 
-            output_dir = self.custom_output_dir or self.uploaded_files[0].parent
+            output_dir = self.custom_output_dir or _input_dir(self.uploaded_files[0])
             if not self._check_write_permission(output_dir):
                 self._update_status("❌ Hata!", "#E74C3C")
                 err_dir = str(output_dir)
-                self.root.after(0, lambda: messagebox.showerror(
+                self.ui.call(lambda: messagebox.showerror(
                     "Hata",
                     f"Çıktı klasörüne yazılamıyor!\n{err_dir}"
                 ))
@@ -754,51 +5461,87 @@ class OrderSummaryMerger:
 
             self._update_progress(0.3)
             self._update_status("📊 Dosyalar birleştiriliyor... (%30)", "#F39C12")
-            self.root.after(0, self._start_pulse)
+            self.ui.call(self._start_pulse)
 
             discount_pct = self._get_discount_pct()
-            fx_rates = self._get_fx_rates()
-            total_items, vessel_names = self._create_merged_file(discount_pct, fx_rates)
-
-            # Dosya adı: GemiIsmi_tarih.xlsx
-            date_str = datetime.now().strftime('%d-%m-%Y')
-            if vessel_names:
-                vessel_str = '_'.join(vessel_names)
-                vessel_str = re.sub(r'[<>:"/\\|?*]', '', vessel_str).strip()
-                filename = f'{vessel_str}_{date_str}.xlsx'
-            else:
-                filename = f'MERGED_ORDER_SUMMARY_{date_str}.xlsx'
-            self.output_path = output_dir / filename
-            self._pending_wb.save(self.output_path)
-            del self._pending_wb
-
-            self.root.after(0, lambda: self._stop_pulse(0.9))
+            job = _normalize_job({
+                'files': [str(f) for f in self.uploaded_files],
+                'output_dir': str(output_dir),
+                'discount_pct': discount_pct,
+                'fx_rates': self._get_fx_rates(),
+                'reporting_currency': self.reporting_currency_var.get(),
+                'show_header_info': self.show_header_info_var.get(),
+                'highlight': self.highlight_var.get(),
+                'incremental': self.incremental_var.get(),
+                'output_cache': self._load_setting('output_cache', True),
+                'compresslevel': self._get_compresslevel(),
+                'memory_budget_mb': self._load_setting('memory_budget_mb', MEMORY_BUDGET_MB),
+            })
+            result = self._run_job(job, token)
+            self.output_path = Path(result['output'])
+            redirected = Path(result['redirected_from']) if result['redirected_from'] else None
+            total_items = result['total_items']
+
+            self.ui.call(self._stop_pulse, 0.9)
             self._update_progress(1.0)
 
-            file_count = len(self.uploaded_files)
+            # Çok sayfalı dosyalar birden fazla sipariş verir: dosya değil sipariş sayılır
+            order_count = result['order_count']
             disc_text = f", İndirim: %{discount_pct}" if discount_pct > 0 else ""
-            self._update_status(f"✅ Tamamlandı! ({file_count} sipariş, {total_items} item{disc_text})", "#27AE60")
+            reuse_text = f", {result['reused']} dosya önbellekten" if result['reused'] else ""
+            reuse_text += f", {result['spilled']} sipariş diske taşındı" if result.get('spilled') else ""
+            if result.get('missing_rates'):
+                reuse_text += f"\n⚠️ Kur bulunamadı: {', '.join(result['missing_rates'])} (1.0 ile çevrildi)"
+            if result.get('history_error'):
+                reuse_text += f"\n⚠️ Geçmiş kaydedilemedi: {result['history_error']}"
+            self._update_status(
+                f"✅ Tamamlandı! ({order_count} sipariş, {total_items} item{disc_text}{reuse_text})\n📈 {result['stats']}",
+                "#27AE60"
+            )
 
             if self.auto_open_var.get():
-                self.root.after(0, self.open_file)
+                self.ui.call(self.open_file)
             else:
                 out_name = self.output_path.name
                 out_parent = str(self.output_path.parent)
-                self.root.after(0, lambda: messagebox.showinfo(
+                lock_note = f"\n\n🔒 {redirected.name} açık olduğu için ek adla kaydedildi." if redirected else ""
+                self.ui.call(lambda: messagebox.showinfo(
                     "✅ Başarılı",
-                    f"Sipariş Özeti oluşturuldu!\n\n📁 {out_name}\n📍 {out_parent}\n\n📊 {file_count} sipariş\n🔢 {total_items} item{disc_text}"
+                    f"Sipariş Özeti oluşturuldu!\n\n📁 {out_name}\n📍 {out_parent}\n\n📊 {order_count} sipariş\n🔢 {total_items} item{disc_text}{lock_note}"
                 ))
 
-            self.root.after(300, self._show_verification_warning)
+            self.ui.call(self.root.after, 300, self._show_verification_warning)
 
+        except MergeCancelled:
+            self.ui.call(self._stop_pulse, 0)
+            self._update_progress(0)
+            self._update_status("⛔ Birleştirme iptal edildi, yarım çıktı silindi.", "#C0392B")
         except Exception as e:
-            self.root.after(0, lambda: self._stop_pulse(0))
+            self.ui.call(self._stop_pulse, 0)
             self._update_status("❌ Hata!", "#E74C3C")
             error_msg = str(e)
-            self.root.after(0, lambda: messagebox.showerror("Hata", f"Birleştirme hatası:\n{error_msg}"))
+            self.ui.call(lambda: messagebox.showerror("Hata", f"Birleştirme hatası:\n{error_msg}"))
         finally:
             self.is_processing = False
-            self.root.after(0, self._unlock_ui)
+            self._cancel_token = None
+            self.ui.call(self._unlock_ui)
+            self.ui.post('cancel_button', self._refresh_cancel_button)
+
+    def _run_job(self, job, cancel=None):
+        """İşi ayarlardaki servis adresine gönder; servis yoksa yerelde çalıştır."""
+        def on_progress(p):
+            self._update_status(f"📊 Dosyalar birleştiriliyor... (%{int(30 + 60 * p)})", "#F39C12")
+
+        def on_message(msg):
+            self._update_status(msg, "#F39C12")
+
+        service_url = self._load_setting('service_url', '')
+        if service_url:
+            client = MergeServiceClient(service_url)
+            if client.available():
+                return client.run(job, on_progress=on_progress, on_message=on_message, cancel=cancel)
+            on_message("⚠️ Servise ulaşılamadı, yerelde birleştiriliyor...")
+        return _run_merge_job(job, progress=on_progress, notify=on_message, cancel=cancel)
 
     def _show_verification_warning(self):
         dlg = ctk.CTkToplevel(self.root)
@@ -849,28 +5592,28 @@ class OrderSummaryMerger:
         countdown(3)
 
     def _update_status(self, text, color):
-        self.root.after(0, lambda: self.status_label.configure(text=text, text_color=color))
+        self.ui.post('status', lambda: self.status_label.configure(text=text, text_color=color))
 
     def _update_progress(self, value):
-        self.root.after(0, lambda: self.progress.set(value))
+        self.ui.post('progress', self.progress.set, value)
 
     def _start_pulse(self):
         self._pulsing = True
         self._pulse_val = 0.0
-        self._pulse_dir = 0.02
-        self._do_pulse()
+        self._pulse_dir = 1.0
+        self.ui.animate('pulse', self._do_pulse)
 
-    def _do_pulse(self):
-        if not self._pulsing:
-            return
-        self._pulse_val += self._pulse_dir
+    def _do_pulse(self, elapsed):
+        # Hız kare aralığından bağımsız: saniyede ~0.67 (eski 30 ms'de 0.02 adım)
+        self._pulse_val += self._pulse_dir * PULSE_SPEED * elapsed
         if self._pulse_val >= 1.0 or self._pulse_val <= 0.0:
+            self._pulse_val = min(max(self._pulse_val, 0.0), 1.0)
             self._pulse_dir *= -1
         self.progress.set(self._pulse_val)
-        self.root.after(30, self._do_pulse)
 
     def _stop_pulse(self, final_value=1.0):
         self._pulsing = False
+        self.ui.stop_animation('pulse')
         self.progress.set(final_value)
 
     def _lock_ui(self):
@@ -887,493 +5630,354 @@ class OrderSummaryMerger:
 
     # ── Excel İşlemleri ──────────────────────────────────────
 
-    def _create_merged_file(self, discount_pct, fx_rates):
-        wb = Workbook()
-        ws = wb.active
-        ws.title = "Merged Order Summary"
-
-        headers = ['NO', 'DESCRIPTION', 'CODE', 'QTTY', 'UNIT', 'U.PRICE', 'T.PRICE', 'REMARKS', 'STOCK LOC.', 'U.COST', 'T.COST']
-        total_cols = 11
-
-        # Önce tüm dosyaları oku (gemi isimlerini toplamak için)
-        all_orders = []
-        vessel_names = []
-        for file_path in self.uploaded_files:
-            order_data = self._extract_order_data(file_path)
-            if not order_data:
-                continue
-            all_orders.append(order_data)
-            v = order_data['header_info'].get('vessel', '')
-            if v and v not in vessel_names:
-                vessel_names.append(v)
-
-        # ── EXCEL HEADER BANNER ──
-        current_row = 1
-
-        # Row 1: Ana başlık banner (koyu lacivert)
-        banner_fill = PatternFill(start_color='1B2631', end_color='1B2631', fill_type='solid')
-        banner_font = Font(bold=True, size=18, color='FFFFFF')
-        ws.merge_cells(start_row=1, start_column=1, end_row=1, end_column=total_cols)
-        title_cell = ws.cell(1, 1)
-        title_cell.value = 'MERGED ORDER SUMMARY'
-        title_cell.font = banner_font
-        title_cell.fill = banner_fill
-        title_cell.alignment = Alignment(horizontal='center', vertical='center')
-        for c in range(2, total_cols + 1):
-            ws.cell(1, c).fill = banner_fill
-        ws.row_dimensions[1].height = 40
-
-        # Row 2: Gemi ismi satırı (koyu gri-mavi)
-        vessel_fill = PatternFill(start_color='2C3E50', end_color='2C3E50', fill_type='solid')
-        vessel_font = Font(bold=True, size=13, color='F39C12')
-        ws.merge_cells(start_row=2, start_column=1, end_row=2, end_column=total_cols)
-        vessel_cell = ws.cell(2, 1)
-        vessel_text = ' / '.join(vessel_names) if vessel_names else 'N/A'
-        vessel_cell.value = f'VESSEL: {vessel_text}'
-        vessel_cell.font = vessel_font
-        vessel_cell.fill = vessel_fill
-        vessel_cell.alignment = Alignment(horizontal='center', vertical='center')
-        for c in range(2, total_cols + 1):
-            ws.cell(2, c).fill = vessel_fill
-        ws.row_dimensions[2].height = 30
-
-        # Row 3: Alt bilgi satırı (mavi accent)
-        accent_fill = PatternFill(start_color='2980B9', end_color='2980B9', fill_type='solid')
-        accent_font = Font(bold=True, size=10, color='FFFFFF')
-        ws.merge_cells(start_row=3, start_column=1, end_row=3, end_column=total_cols)
-        info_cell = ws.cell(3, 1)
-        now_str = datetime.now().strftime('%d.%m.%Y %H:%M')
-        file_count = len(all_orders)
-        disc_info = f'  |  Discount: %{discount_pct}' if discount_pct > 0 else ''
-        info_cell.value = f'Generated: {now_str}  |  Files: {file_count}{disc_info}'
-        info_cell.font = accent_font
-        info_cell.fill = accent_fill
-        info_cell.alignment = Alignment(horizontal='center', vertical='center')
-        for c in range(2, total_cols + 1):
-            ws.cell(3, c).fill = accent_fill
-        ws.row_dimensions[3].height = 24
-
-        # Row 4: İnce ayırıcı çizgi (altın sarısı)
-        gold_fill = PatternFill(start_color='F39C12', end_color='F39C12', fill_type='solid')
-        for c in range(1, total_cols + 1):
-            ws.cell(4, c).fill = gold_fill
-        ws.row_dimensions[4].height = 4
-
-        current_row = 6
-        total_items = 0
-
-        all_sale_total_rows = []
-        all_cost_total_rows = []
-        last_currency_symbol = ''
-
-        for order_data in all_orders:
-
-            info = order_data['header_info']
-            sale_currency = info.get('currency', '').upper()
-            currency_symbol = CURRENCY_SYMBOLS.get(sale_currency, sale_currency) if sale_currency else ''
-            if currency_symbol:
-                last_currency_symbol = currency_symbol
-
-            # Sipariş bilgi satırı
-            info_text = f"Order: {order_data['file_name']}"
-            header_cells = order_data.get('header_cells', [])
-            show_cells = self.show_header_info_var.get()
-            has_cells = show_cells and any(l or v for l, v in header_cells)
-
-            if has_cells:
-                info_label_font = Font(bold=True, size=9)
-                info_value_font = Font(size=9)
-                ws.cell(current_row, 2).value = info_text
-                ws.cell(current_row, 2).font = Font(italic=True, size=9, color='808080')
-                for i, (label, value) in enumerate(header_cells):
-                    r = current_row + i
-                    if label or value:
-                        cell_h = ws.cell(r, 8)
-                        clean_label = label.rstrip(' :')
-                        cell_h.value = f"{clean_label} : " if clean_label else ''
-                        cell_h.font = info_label_font
-                        cell_h.alignment = self._right_align
-                        cell_h.border = self._thin_border
-                        cell_i = ws.cell(r, 9)
-                        cell_i.value = value
-                        cell_i.font = info_value_font
-                        cell_i.border = self._thin_border
-                current_row += len(header_cells)
-            else:
-                ws.cell(current_row, 2).value = info_text
-                ws.cell(current_row, 2).font = Font(italic=True, size=9, color='808080')
-                current_row += 1
-
-            # Header satırı
-            for col_idx, header in enumerate(headers, start=1):
-                ws.cell(current_row, col_idx).value = header
-            self._apply_header_style(ws, current_row)
-            current_row += 1
-
-            # Data satırları
-            item_count = 0
-            data_start_row = current_row
-            price_format = f'"{currency_symbol}"#,##0.00' if currency_symbol else '#,##0.00'
-
-            for data_row in order_data['data_rows']:
-                item_count += 1
-                # Orijinal veri sütunları: 0=NO, 1=DESC, 2=CODE, 3=QTTY, 4=UNIT, 5=U.PRICE, 6=T.PRICE, 7=REMARKS, 8=STOCK LOC, 9=COST
-                qtty = data_row[3] if len(data_row) > 3 and pd.notna(data_row[3]) else 0
-                try:
-                    qtty_num = float(qtty)
-                except (ValueError, TypeError):
-                    qtty_num = 0
-
-                # Cost parse + kur dönüşümü
-                raw_cost = data_row[9] if len(data_row) > 9 else None
-                unit_cost_raw, cost_currency = _parse_cost(raw_cost)
-                unit_cost_converted = self._convert_cost(unit_cost_raw, cost_currency, sale_currency, fx_rates) if unit_cost_raw > 0 else 0.0
-
-                for col_idx in range(1, total_cols + 1):
-                    cell = ws.cell(current_row, col_idx)
-
-                    if col_idx == 1:
-                        cell.value = item_count
-                    elif col_idx == 7:
-                        # T.PRICE = QTTY * U.PRICE
-                        cell.value = f"=D{current_row}*F{current_row}"
-                        cell.number_format = price_format
-                    elif col_idx == 10:
-                        # U.COST (satış para birimine çevrilmiş birim maliyet)
-                        cell.value = round(unit_cost_converted, 2) if unit_cost_converted > 0 else None
-                        cell.number_format = price_format
-                    elif col_idx == 11:
-                        # T.COST = QTTY * U.COST
-                        cell.value = f"=D{current_row}*J{current_row}"
-                        cell.number_format = price_format
-                    elif col_idx == 6:
-                        value = data_row[col_idx - 1] if col_idx - 1 < len(data_row) else None
-                        cell.value = value
-                        if value is not None:
-                            cell.number_format = price_format
-                    else:
-                        # Sütun 1-9 arası (COST hariç) orijinal veriyi yaz
-                        if col_idx <= 9:
-                            value = data_row[col_idx - 1] if col_idx - 1 < len(data_row) else None
-                            cell.value = value
-
-                self._apply_data_row_style(ws, current_row)
-                current_row += 1
-
-            total_items += item_count
-            current_row += 1
-
-            # TOTAL satırı (satış)
-            self._apply_total_style(ws, current_row, 'TOTAL:', col_label=6, col_value=7)
-            ws.cell(current_row, 7).value = f"=SUM(G{data_start_row}:G{data_start_row + item_count - 1})"
-            ws.cell(current_row, 7).number_format = price_format
-            all_sale_total_rows.append(current_row)
-
-            # COST TOTAL (alış - satış para biriminde)
-            self._apply_total_style(ws, current_row, 'COST TOTAL:', col_label=10, col_value=11)
-            ws.cell(current_row, 11).value = f"=SUM(K{data_start_row}:K{data_start_row + item_count - 1})"
-            ws.cell(current_row, 11).number_format = price_format
-            all_cost_total_rows.append(current_row)
-            current_row += 3
-
-        # ── GRAND SUMMARY ──
-        if all_sale_total_rows:
-            summary_format = f'"{last_currency_symbol}"#,##0.00' if last_currency_symbol else '#,##0.00'
-
-            # Ayırıcı çizgi
-            separator_fill = PatternFill(start_color='2C3E50', end_color='2C3E50', fill_type='solid')
-            for col in range(1, total_cols + 1):
-                cell = ws.cell(current_row, col)
-                cell.fill = separator_fill
-                cell.border = self._thin_border
-            current_row += 1
-
-            # Başlık
-            banner_fill = PatternFill(start_color='1A5276', end_color='1A5276', fill_type='solid')
-            banner_font = Font(bold=True, size=13, color='FFFFFF')
-            ws.merge_cells(start_row=current_row, start_column=1, end_row=current_row, end_column=total_cols)
-            title_cell = ws.cell(current_row, 1)
-            disc_label = f"  |  İNDİRİM: %{discount_pct}" if discount_pct > 0 else ""
-            title_cell.value = f'GRAND SUMMARY  —  {len(all_sale_total_rows)} ORDERS{disc_label}'
-            title_cell.font = banner_font
-            title_cell.fill = banner_fill
-            title_cell.alignment = Alignment(horizontal='center', vertical='center')
-            title_cell.border = self._thin_border
-            for col in range(2, total_cols + 1):
-                ws.cell(current_row, col).fill = banner_fill
-                ws.cell(current_row, col).border = self._thin_border
-            current_row += 2
-
-            summary_label_font = Font(bold=True, size=12, color='2C3E50')
-            summary_value_font = Font(bold=True, size=12, color='1A5276')
-            summary_border = Border(
-                left=Side(style='medium'), right=Side(style='medium'),
-                top=Side(style='medium'), bottom=Side(style='medium')
-            )
-            label_fill = PatternFill(start_color='EBF5FB', end_color='EBF5FB', fill_type='solid')
-            value_fill = PatternFill(start_color='D4E6F1', end_color='D4E6F1', fill_type='solid')
-
-            def _write_summary_row(label, formula, fmt, is_grand=False):
-                nonlocal current_row
-                if is_grand:
-                    fill_l = PatternFill(start_color='1A5276', end_color='1A5276', fill_type='solid')
-                    fill_v = fill_l
-                    font_l = Font(bold=True, size=14, color='FFFFFF')
-                    font_v = font_l
-                else:
-                    fill_l = label_fill
-                    fill_v = value_fill
-                    font_l = summary_label_font
-                    font_v = summary_value_font
-
-                ws.merge_cells(start_row=current_row, start_column=4, end_row=current_row, end_column=6)
-                lbl = ws.cell(current_row, 4)
-                lbl.value = label
-                lbl.font = font_l
-                lbl.alignment = Alignment(horizontal='right', vertical='center')
-                lbl.fill = fill_l
-                lbl.border = summary_border
-                for c in range(5, 7):
-                    ws.cell(current_row, c).fill = fill_l
-                    ws.cell(current_row, c).border = summary_border
-
-                ws.merge_cells(start_row=current_row, start_column=7, end_row=current_row, end_column=8)
-                val = ws.cell(current_row, 7)
-                val.value = formula
-                val.font = font_v
-                val.number_format = fmt
-                val.alignment = Alignment(horizontal='center', vertical='center')
-                val.fill = fill_v
-                val.border = summary_border
-                ws.cell(current_row, 8).fill = fill_v
-                ws.cell(current_row, 8).border = summary_border
-                current_row += 1
-
-            # TOPLAM SATIŞ
-            sale_refs = '+'.join([f'G{r}' for r in all_sale_total_rows])
-            _write_summary_row('TOPLAM SATIŞ :', f'={sale_refs}', summary_format)
-            sale_total_row = current_row - 1
-
-            # TOPLAM ALIŞ (satış para biriminde)
-            cost_refs = '+'.join([f'K{r}' for r in all_cost_total_rows])
-            _write_summary_row('TOPLAM ALIŞ :', f'={cost_refs}', summary_format)
-            cost_total_row = current_row - 1
-
-            # İNDİRİM (eğer varsa)
-            if discount_pct > 0:
-                _write_summary_row(
-                    f'İNDİRİM ({discount_pct}%) :',
-                    f'=G{sale_total_row}*{discount_pct/100}',
-                    summary_format
-                )
-                disc_row = current_row - 1
-
-                # FİNAL SATIŞ TUTARI
-                _write_summary_row(
-                    'FİNAL SATIŞ TUTARI :',
-                    f'=G{sale_total_row}-G{disc_row}',
-                    summary_format,
-                    is_grand=True
-                )
-                final_sale_row = current_row - 1
-            else:
-                final_sale_row = sale_total_row
-
-            # KÂR / ZARAR
-            current_row += 1
-            profit_fill = PatternFill(start_color='27AE60', end_color='27AE60', fill_type='solid')
-            profit_font = Font(bold=True, size=14, color='FFFFFF')
-            ws.merge_cells(start_row=current_row, start_column=4, end_row=current_row, end_column=6)
-            lbl = ws.cell(current_row, 4)
-            lbl.value = 'KÂR / ZARAR :'
-            lbl.font = profit_font
-            lbl.alignment = Alignment(horizontal='right', vertical='center')
-            lbl.fill = profit_fill
-            lbl.border = summary_border
-            for c in range(5, 7):
-                ws.cell(current_row, c).fill = profit_fill
-                ws.cell(current_row, c).border = summary_border
-
-            ws.merge_cells(start_row=current_row, start_column=7, end_row=current_row, end_column=8)
-            val = ws.cell(current_row, 7)
-            val.value = f'=G{final_sale_row}-G{cost_total_row}'
-            val.font = profit_font
-            val.number_format = summary_format
-            val.alignment = Alignment(horizontal='center', vertical='center')
-            val.fill = profit_fill
-            val.border = summary_border
-            ws.cell(current_row, 8).fill = profit_fill
-            ws.cell(current_row, 8).border = summary_border
-            current_row += 2
-
-        # Sütun genişlikleri
-        ws.column_dimensions['A'].width = 6
-        ws.column_dimensions['B'].width = 55
-        ws.column_dimensions['C'].width = 15
-        ws.column_dimensions['D'].width = 8
-        ws.column_dimensions['E'].width = 8
-        ws.column_dimensions['F'].width = 12
-        ws.column_dimensions['G'].width = 14
-        ws.column_dimensions['H'].width = 30
-        ws.column_dimensions['I'].width = 18
-        ws.column_dimensions['J'].width = 12
-        ws.column_dimensions['K'].width = 14
-
-        last_row = current_row - 1
-        ws.print_area = f'A1:K{last_row}'
-        ws.sheet_view.showGridLines = False
-
-        self._pending_wb = wb
-        return total_items, vessel_names
-
-    def _extract_order_data(self, file_path):
-        try:
-            df = pd.read_excel(file_path, header=None)
-
-            header_info = {}
-            if len(df.columns) < 2:
-                return None
-
-            # Gemi ismi: 15B hücresi (0-indexed: row 14, col 1)
-            vessel_name = ''
-            if len(df) > 14 and len(df.columns) > 1 and pd.notna(df.iloc[14, 1]):
-                vessel_name = str(df.iloc[14, 1]).strip()
-            header_info['vessel'] = vessel_name
-
-            # Header bilgileri: satır 18-20 (0-indexed: 17-19), col 7-8 (0-indexed: 7-8)
-            header_cells = []
-            for row_idx in range(min(25, len(df))):
-                for col_idx in range(min(10, len(df.columns))):
-                    cell_val = str(df.iloc[row_idx, col_idx]).strip() if pd.notna(df.iloc[row_idx, col_idx]) else ''
-
-                    if 'RFQ REF' in cell_val.upper():
-                        # Değer yanındaki sütunda
-                        next_col = col_idx + 1
-                        if next_col < len(df.columns) and pd.notna(df.iloc[row_idx, next_col]):
-                            header_info['rfq_ref'] = str(df.iloc[row_idx, next_col]).strip()
-                    elif 'QTN REF' in cell_val.upper():
-                        next_col = col_idx + 1
-                        if next_col < len(df.columns) and pd.notna(df.iloc[row_idx, next_col]):
-                            header_info['qtn_ref'] = str(df.iloc[row_idx, next_col]).strip()
-                    elif 'DATE' in cell_val.upper() and ':' in cell_val:
-                        next_col = col_idx + 1
-                        if next_col < len(df.columns) and pd.notna(df.iloc[row_idx, next_col]):
-                            header_info['date'] = str(df.iloc[row_idx, next_col]).strip()
-
-            # header_cells: DATE, RFQ REF, QTN REF bilgilerini topla
-            for row_idx in range(min(25, len(df))):
-                for col_idx in range(min(10, len(df.columns))):
-                    cell_val = str(df.iloc[row_idx, col_idx]).strip() if pd.notna(df.iloc[row_idx, col_idx]) else ''
-                    if cell_val.upper().startswith('DATE') and ':' in cell_val:
-                        next_col = col_idx + 1
-                        val = str(df.iloc[row_idx, next_col]).strip() if next_col < len(df.columns) and pd.notna(df.iloc[row_idx, next_col]) else ''
-                        header_cells.append(('DATE', val))
-                        # RFQ ve QTN genelde hemen altında
-                        for offset in range(1, 3):
-                            r = row_idx + offset
-                            if r < len(df):
-                                lbl = str(df.iloc[r, col_idx]).strip() if pd.notna(df.iloc[r, col_idx]) else ''
-                                v = str(df.iloc[r, next_col]).strip() if next_col < len(df.columns) and pd.notna(df.iloc[r, next_col]) else ''
-                                clean_lbl = lbl.rstrip(' :').strip()
-                                header_cells.append((clean_lbl, v))
-                        break
-                if header_cells:
-                    break
-
-            # Currency: TOTAL satırından algıla
-            currency = ''
-            for idx in range(len(df)):
-                for col_idx in range(len(df.columns)):
-                    cell_val = str(df.iloc[idx, col_idx]).strip() if pd.notna(df.iloc[idx, col_idx]) else ''
-                    if 'TOTAL' in cell_val.upper() and ':' in cell_val:
-                        # Yanındaki sütunda para birimi olabilir
-                        for c in range(col_idx + 1, min(col_idx + 3, len(df.columns))):
-                            if pd.notna(df.iloc[idx, c]):
-                                total_str = str(df.iloc[idx, c])
-                                for sym, code in [('€', 'EUR'), ('$', 'USD'), ('£', 'GBP'), ('₺', 'TRY')]:
-                                    if sym in total_str:
-                                        currency = code
-                                        break
-                                if currency:
-                                    break
-                if currency:
-                    break
+    def _extract_orders(self, file_path, cancel=None):
+        return _safe_extract_orders(file_path, cancel)
 
-            header_info['currency'] = currency
+    # ── Dosya Açma ───────────────────────────────────────────
 
-            # Data satırlarını bul
-            start_row = None
-            for idx in range(len(df)):
-                cell_val = df.iloc[idx, 0]
-                if pd.notna(cell_val) and str(cell_val).strip().upper() == 'NO':
-                    start_row = idx
-                    break
+    def open_file(self):
+        if self.output_path and self.output_path.exists():
+            try:
+                os.startfile(str(self.output_path))
+            except Exception:
+                pass
 
-            if start_row is None:
-                return None
 
-            data_rows = []
-            for idx in range(start_row + 1, len(df)):
-                row = df.iloc[idx]
-                first_col_val = row.iloc[0]
-
-                if pd.isna(first_col_val) or str(first_col_val).strip() == '':
-                    # TOTAL tespiti: sadece F sütununda (index 5) "TOTAL" aranır
-                    # Böylece REMARKS veya başka sütunlarda "TOTAL" geçmesi sorun yaratmaz
-                    if len(row) > 5 and pd.notna(row.iloc[5]):
-                        f_val = str(row.iloc[5]).strip().upper()
-                        if 'TOTAL' in f_val:
-                            break
-                    continue
+def _print_table(rows, columns):
+    if not rows:
+        print('Kayıt bulunamadı.')
+        return
+    def _fmt(v):
+        if v is None:
+            return ''
+        if isinstance(v, float):
+            return f'{v:,.4f}' if 0 < abs(v) < 1 else f'{v:,.2f}'
+        return str(v)
 
-                val_str = str(first_col_val).strip()
-                if val_str and val_str[0].isdigit():
-                    data_rows.append(row.values.tolist())
-                else:
-                    continue
+    cells = [[_fmt(r[c]) for c in columns] for r in rows]
+    widths = [max(len(c), *(len(row[i]) for row in cells)) for i, c in enumerate(columns)]
+    print('  '.join(c.upper().ljust(w) for c, w in zip(columns, widths)))
+    for row in cells:
+        print('  '.join(v.ljust(w) for v, w in zip(row, widths)))
 
-            return {
-                'file_name': Path(file_path).name,
-                'header_info': header_info,
-                'header_cells': header_cells,
-                'data_rows': data_rows,
-            }
-        except Exception:
-            return None
 
-    # ── Stiller ──────────────────────────────────────────────
+def _cli_merge(args):
+    try:
+        job = _normalize_job({
+            'files': args.files,
+            'output_dir': args.out_dir,
+            'discount_pct': args.discount,
+            'fx_rates': {'EUR': args.eur, 'USD': args.usd},
+            'reporting_currency': args.report_currency,
+            'show_header_info': not args.no_header_info,
+            'highlight': not args.no_highlight,
+            'output_cache': not args.no_cache,
+            'incremental': args.incremental,
+            'compresslevel': args.compress,
+            'memory_budget_mb': args.memory_budget,
+            'stage_inputs': args.stage,
+        })
+    except ValueError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 2
+
+    def on_progress(p):
+        print(f"\r📊 %{int(p * 100)}", end='', flush=True)
+
+    def on_message(msg):
+        print(f"\n{msg}")
 
-    def _apply_header_style(self, ws, row_num):
-        for col in range(1, 12):
-            cell = ws.cell(row_num, col)
-            cell.fill = self._header_fill
-            cell.font = self._header_font
-            cell.alignment = self._center_align
-            cell.border = self._thin_border
+    try:
+        if args.service is not None:
+            result = MergeServiceClient(args.service or None).run(job, on_progress, on_message)
+        else:
+            with _profile_run('merge') as profiler:
+                result = _run_merge_job(job, progress=on_progress, notify=on_message)
+            if profiler is not None:
+                result['profile'] = profiler.summary()
+    except (KeyboardInterrupt, MergeCancelled):
+        print("\n⛔ İptal edildi, yarım çıktı silindi.", file=sys.stderr)
+        return 130
+    except Exception as e:
+        print(f"\n❌ Birleştirme hatası: {e}", file=sys.stderr)
+        return 1
+    print(f"\n✅ {result['output']} ({result['order_count']} sipariş, {result['total_items']} item)")
+    if result['redirected_from']:
+        print(f"🔒 {Path(result['redirected_from']).name} açık olduğu için ek adla kaydedildi.")
+    print(f"📈 {result['stats']}")
+    if result.get('missing_rates'):
+        print(f"⚠️ Kur bulunamadı: {', '.join(result['missing_rates'])} — 1.0 ile çevrildi, toplamları kontrol edin")
+    if result.get('history_error'):
+        print(f"⚠️ Geçmiş kaydedilemedi: {result['history_error']}", file=sys.stderr)
+    if result.get('profile'):
+        print(result['profile'])
+    return 0
+
+
+def _cli_validate(args):
+    fx_rates = {'TRY': 1.0, 'EUR': args.eur, 'USD': args.usd}
+    with tempfile.TemporaryDirectory(prefix='order_merger_validate_') as work_dir:
+        files = _expand_inputs(args.files)
+        if args.synthetic:
+            t = time.perf_counter()
+            files += _make_synthetic_corpus(work_dir, args.synthetic, args.items, args.seed)
+            print(f"🧪 {args.synthetic} sentetik sipariş üretildi ({time.perf_counter() - t:.1f} sn)")
+        if not files:
+            print("❌ Dosya veya --synthetic gerekli", file=sys.stderr)
+            return 2
+        output = Path(args.output) if args.output else None
+        if output is None:
+            output = Path(work_dir) / 'merged.xlsx'
+            result = _merge_pipeline(files, output, args.discount, fx_rates,
+                                     reporting_currency=args.report_currency)
+            result['orders'].close()
+            print(f"📊 Birleştirildi: {result['stats'].summary()}")
+        t = time.perf_counter()
+        report = validate_merge(output, files, fx_rates, args.discount, args.report_currency)
+        print(f"{report.summary()} ({time.perf_counter() - t:.1f} sn)")
+        if report.failures:
+            _print_table(
+                [dict(zip(['scope', 'check', 'expected', 'actual'], c[:4])) for c in report.failures[:50]],
+                ['scope', 'check', 'expected', 'actual']
+            )
+    return 0 if report.ok else 1
 
-    def _apply_data_row_style(self, ws, row_num):
-        for col in range(1, 12):
-            cell = ws.cell(row_num, col)
-            cell.border = self._thin_border
-            cell.alignment = self._data_align
 
-    def _apply_total_style(self, ws, row_num, label, col_label=6, col_value=7):
-        ws.cell(row_num, col_label).value = label
-        ws.cell(row_num, col_label).font = self._bold_font
-        ws.cell(row_num, col_label).alignment = self._right_align
-        ws.cell(row_num, col_value).font = self._bold_font
+def _cli_diff(args):
+    fx_rates = {'TRY': 1.0, 'EUR': args.eur, 'USD': args.usd}
+    try:
+        diff = diff_revisions(args.old, args.new, fx_rates)
+    except Exception as e:
+        print(f"❌ Dosya okunamadı: {e}", file=sys.stderr)
+        return 2
+    old_rfq, new_rfq = diff.old_header.get('rfq_ref', ''), diff.new_header.get('rfq_ref', '')
+    if old_rfq and new_rfq and old_rfq != new_rfq:
+        print(f"⚠️ RFQ REF farklı: {old_rfq} / {new_rfq}")
+    if args.json:
+        text = json.dumps(diff.to_dict(), ensure_ascii=False, indent=2, default=str)
+        if args.json == '-':
+            print(text)
+            return 0
+        Path(args.json).write_text(text, encoding='utf-8')
+        print(f"💾 {args.json}")
+    if args.output:
+        print(f"💾 {diff.write_sheet(args.output)}")
+    print(diff.summary())
+    if not args.json and not args.output:
+        _print_table(diff.entries[:args.limit],
+                     ['status', 'code', 'description', 'changes', 'qty_old', 'qty_new',
+                      'price_old', 'price_new', 'cost_old', 'cost_new', 'sale_delta'])
+        if len(diff.entries) > args.limit:
+            print(f"... {len(diff.entries) - args.limit} satır daha (--json / --output ile tamamı)")
+    return 0
+
+
+def _cli_bench_readers(args):
+    """Aynı dosya setini her kurulu okuyucu arka ucuyla ayrıştırıp süre ve sonuçları karşılaştır."""
+    with tempfile.TemporaryDirectory(prefix='order_merger_bench_') as work_dir:
+        files = _expand_inputs(args.files)
+        if args.synthetic:
+            files += _make_synthetic_corpus(work_dir, args.synthetic, args.items, args.seed)
+        if not files:
+            print("❌ Dosya veya --synthetic gerekli", file=sys.stderr)
+            return 2
+        plans = _get_layout_plans()
+        reference = {}
+        rows = []
+        for backend in READER_BACKENDS.values():
+            if not backend.available():
+                rows.append({'backend': backend.name, 'files': 0, 'errors': 0, 'mismatch': 0,
+                             'seconds': None, 'files_s': None, 'mb_s': None, 'note': 'kurulu değil'})
+                continue
+            usable = [f for f in files if f.suffix.lower() in backend.suffixes]
+            errors = mismatch = 0
+            best = None
+            for _ in range(max(1, args.repeat)):
+                t = time.perf_counter()
+                results = {}
+                for f in usable:
+                    try:
+                        results[f] = _extract_orders(f, plans, backends=[backend])
+                    except Exception as e:
+                        results[f] = e
+                elapsed = time.perf_counter() - t
+                best = elapsed if best is None else min(best, elapsed)
+            for f in usable:
+                if isinstance(results[f], Exception):
+                    errors += 1
+                elif reference.setdefault(f, results[f]) != results[f]:
+                    mismatch += 1
+            size_mb = sum(_input_size(f) for f in usable) / (1024 * 1024)
+            rows.append({'backend': backend.name, 'files': len(usable), 'errors': errors, 'mismatch': mismatch,
+                         'seconds': best, 'files_s': len(usable) / best if best else None,
+                         'mb_s': size_mb / best if best else None, 'note': ''})
+        _print_table(rows, ['backend', 'files', 'errors', 'mismatch', 'seconds', 'files_s', 'mb_s', 'note'])
+    return 1 if any(r['mismatch'] for r in rows) else 0
+
+
+def _cli_bench_staging(args):
+    """Yavaş paylaşım taklidinde doğrudan okuma ile paralel yerel hazırlığı karşılaştır."""
+    global _STAGER, _source_opener
+    with tempfile.TemporaryDirectory(prefix='order_merger_stage_bench_') as work_dir:
+        files = _expand_inputs(args.files)
+        if args.synthetic:
+            files += _make_synthetic_corpus(work_dir, args.synthetic, args.items, args.seed)
+        if not files:
+            print("❌ Dosya veya --synthetic gerekli", file=sys.stderr)
+            return 2
+        latency, rate = args.latency_ms / 1000, args.mbps * 1024 * 1024
 
-    # ── Dosya Açma ───────────────────────────────────────────
+        def throttled(path):
+            return _ThrottledFile(path, latency, rate)
 
-    def open_file(self):
-        if self.output_path and self.output_path.exists():
-            try:
-                os.startfile(str(self.output_path))
-            except Exception:
-                pass
+        plans = _get_layout_plans()
+        saved = _STAGER, _source_opener
+        rows, reference = [], None
+        try:
+            for name in ('direct', 'staged'):
+                _source_opener = throttled
+                _STAGER = None
+                if name == 'staged':
+                    _STAGER = InputStager(args.budget, args.workers, Path(work_dir) / 'stage', opener=throttled,
+                                          mode='always')
+                t = time.perf_counter()
+                if _STAGER is not None:
+                    _STAGER.stage(files)
+                results = [_extract_orders(f, plans) for f in files]
+                elapsed = time.perf_counter() - t
+                mismatch = 0 if reference is None else sum(a != b for a, b in zip(reference, results))
+                reference = reference or results
+                rows.append({'mode': name, 'files': len(files), 'seconds': elapsed, 'files_s': len(files) / elapsed,
+                             'staged_mb': _STAGER.staged_bytes / (1024 * 1024) if _STAGER else None,
+                             'mismatch': mismatch})
+        finally:
+            if _STAGER is not None:
+                _STAGER.wait()
+            _STAGER, _source_opener = saved
+        print(f"🐢 Taklit: {args.latency_ms:g} ms gecikme, {args.mbps:g} MB/s")
+        _print_table(rows, ['mode', 'files', 'seconds', 'files_s', 'staged_mb', 'mismatch'])
+    return 1 if any(r['mismatch'] for r in rows) else 0
+
+
+def _run_cli(argv):
+    parser = argparse.ArgumentParser(prog='SiparisOzetiBirlestirme', description='Sipariş Özeti Birleştirme Aracı')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    hist = sub.add_parser('history', help='Birleştirme geçmişini sorgula')
+    hist.add_argument('--db', help='Veritabanı dosyası (varsayılan: uygulama klasörü)')
+    hist_sub = hist.add_subparsers(dest='query', required=True)
+    price = hist_sub.add_parser('price', help='Bir CODE için fiyat geçmişi')
+    price.add_argument('code')
+    price.add_argument('--since', help='Başlangıç tarihi (YYYY-AA-GG)')
+    price.add_argument('--until', help='Bitiş tarihi (YYYY-AA-GG, hariç)')
+    margins = hist_sub.add_parser('margins', help='Gemi veya kod bazında kâr/zarar')
+    margins.add_argument('--by', choices=['vessel', 'code'], default='vessel')
+    margins.add_argument('value', nargs='?')
+    margins.add_argument('--since', help='Başlangıç tarihi (YYYY-AA-GG)')
+    margins.add_argument('--until', help='Bitiş tarihi (YYYY-AA-GG, hariç)')
+
+    serve = sub.add_parser('serve', help='Yerel birleştirme servisini başlat')
+    serve.add_argument('--host', default=SERVICE_DEFAULT_HOST)
+    serve.add_argument('--port', type=int, default=SERVICE_DEFAULT_PORT)
+    serve.add_argument('--workers', type=int, help='Süreç havuzu boyutu (varsayılan: CPU sayısı)')
+    serve.add_argument('--jobs', type=int, default=SERVICE_MAX_JOBS, help='Eşzamanlı iş sayısı')
+    serve.add_argument('--output-root', action='append', dest='output_roots', metavar='DIR',
+                       help='İzin verilen çıktı kökü (tekrarlanabilir); ağa açık adreste zorunlu')
+
+    merge = sub.add_parser('merge', help='Dosyaları birleştir (yerelde veya servis üzerinden)')
+    merge.add_argument('files', nargs='+')
+    merge.add_argument('--out-dir', help='Çıktı klasörü (varsayılan: ilk dosyanın klasörü)')
+    merge.add_argument('--discount', type=float, default=0.0, help='İndirim yüzdesi')
+    merge.add_argument('--eur', type=float, default=38.50, help='1 EUR kaç TL')
+    merge.add_argument('--usd', type=float, default=36.20, help='1 USD kaç TL')
+    merge.add_argument('--report-currency', choices=REPORTING_CURRENCIES, default=REPORTING_CURRENCY,
+                       help='Karışık para birimli birleştirmelerde toplamların para birimi')
+    merge.add_argument('--no-header-info', action='store_true', help='Sipariş başlık bilgilerini gizle')
+    merge.add_argument('--no-cache', action='store_true', help='Çıktı önbelleğini kullanma (her zaman yeniden birleştir)')
+    merge.add_argument('--no-highlight', action='store_true', help='Zarar / eksik maliyet / yüksek marj vurgusunu kapat')
+    merge.add_argument('--incremental', action='store_true', help='Manifest ile artımlı birleştir')
+    merge.add_argument('--memory-budget', type=float, default=MEMORY_BUDGET_MB, metavar='MB',
+                       help='Bellekte tutulacak ayrıştırılmış sipariş bütçesi; aşılırsa diske taşar')
+    merge.add_argument('--stage', choices=STAGE_MODES,
+                       help='Girdileri önce yerele kopyala (auto: yalnızca ağ yolları; varsayılan: ayarlar)')
+    merge.add_argument('--compress', type=int, choices=range(0, 10), metavar='0-9', help='Zip sıkıştırma seviyesi')
+    merge.add_argument('--service', nargs='?', const='', metavar='URL',
+                       help='İşi birleştirme servisine gönder (adres verilmezse yerel varsayılan)')
+
+    validate = sub.add_parser('validate', help='Birleştirilmiş toplamları girdilerden bağımsız doğrula')
+    validate.add_argument('files', nargs='*', help='Girdi dosyaları')
+    validate.add_argument('--output', help='Doğrulanacak birleştirilmiş dosya (verilmezse geçici birleştirme yapılır)')
+    validate.add_argument('--synthetic', type=int, metavar='N', help='N adet sentetik sipariş üretip onlarla doğrula')
+    validate.add_argument('--items', type=int, default=40, help='Sentetik siparişte ortalama item sayısı')
+    validate.add_argument('--seed', type=int, default=0)
+    validate.add_argument('--discount', type=float, default=0.0)
+    validate.add_argument('--eur', type=float, default=38.50)
+    validate.add_argument('--usd', type=float, default=36.20)
+    validate.add_argument('--report-currency', choices=REPORTING_CURRENCIES, default=REPORTING_CURRENCY)
+
+    bench = sub.add_parser('bench-readers', help='Okuyucu arka uçlarını aynı dosyalarda kıyasla')
+    bench.add_argument('files', nargs='*', help='Girdi dosyaları (xlsx/xls/xlsb/ods)')
+    bench.add_argument('--synthetic', type=int, metavar='N', help='N adet sentetik sipariş ekle')
+    bench.add_argument('--items', type=int, default=40, help='Sentetik siparişte ortalama item sayısı')
+    bench.add_argument('--seed', type=int, default=0)
+    bench.add_argument('--repeat', type=int, default=3, help='Tekrar sayısı (en iyi süre alınır)')
+
+    diff = sub.add_parser('diff', help='Bir sipariş özetinin iki revizyonunu karşılaştır')
+    diff.add_argument('old', help='Eski sürüm')
+    diff.add_argument('new', help='Yeni (revize) sürüm')
+    diff.add_argument('--json', metavar='PATH', help="Farkları JSON olarak yaz ('-' standart çıktı)")
+    diff.add_argument('--output', metavar='XLSX', help='Farkları Excel sayfası olarak yaz')
+    diff.add_argument('--limit', type=int, default=50, help='Ekranda gösterilecek satır sayısı')
+    diff.add_argument('--eur', type=float, default=38.50)
+    diff.add_argument('--usd', type=float, default=36.20)
+
+    stage = sub.add_parser('bench-staging', help='Yavaş ağ paylaşımı taklidinde yerel hazırlığı kıyasla')
+    stage.add_argument('files', nargs='*', help='Girdi dosyaları')
+    stage.add_argument('--synthetic', type=int, metavar='N', help='N adet sentetik sipariş ekle')
+    stage.add_argument('--items', type=int, default=40, help='Sentetik siparişte ortalama item sayısı')
+    stage.add_argument('--seed', type=int, default=0)
+    stage.add_argument('--latency-ms', type=float, default=5.0, help='Okuma başına gecikme')
+    stage.add_argument('--mbps', type=float, default=20.0, help='Bant genişliği (MB/s)')
+    stage.add_argument('--workers', type=int, default=STAGE_WORKERS, help='Paralel kopya sayısı')
+    stage.add_argument('--budget', type=float, default=STAGE_BUDGET_MB, metavar='MB', help='Hazırlık bütçesi')
+
+    args = parser.parse_args(argv)
+    if args.command == 'bench-staging':
+        return _cli_bench_staging(args)
+    if args.command == 'diff':
+        return _cli_diff(args)
+    if args.command == 'bench-readers':
+        return _cli_bench_readers(args)
+    if args.command == 'validate':
+        return _cli_validate(args)
+    if args.command == 'serve':
+        return _serve(args.host, args.port, args.workers, args.jobs, output_roots=args.output_roots)
+    if args.command == 'merge':
+        return _cli_merge(args)
+    if args.command == 'history':
+        store = OrderHistoryStore(args.db)
+        if args.query == 'price':
+            _print_table(
+                store.price_history(args.code, args.since, args.until),
+                ['merged_at', 'vessel', 'rfq_ref', 'qtn_ref', 'currency', 'qty', 'unit_price', 'unit_cost', 'fx_rate']
+            )
+        else:
+            _print_table(
+                store.margins(args.by, args.value, args.since, args.until),
+                ['key', 'currency', 'lines', 'sale_total', 'cost_total', 'profit']
+            )
+    return 0
 
 
 def main():
+    multiprocessing.freeze_support()
+    argv = sys.argv[1:]
+    if '--profile' in argv:
+        # Global bayrak: GUI, CLI ve servis aynı ortam değişkenine bakar
+        argv.remove('--profile')
+        os.environ.setdefault(PROFILE_ENV, '1')
+    if argv:
+        sys.exit(_run_cli(argv))
     if HAS_DND:
         class DnDCTk(ctk.CTk, TkinterDnD.DnDWrapper):
             def __init__(self):
@@ -0,0 +1,27 @@
+import random
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import order_summary_merger as osm  # noqa: E402
+
+FX_RATES = {'TRY': 1.0, 'EUR': 38.5, 'USD': 36.2}
+
+
+def write_order(path, item_count, seed=0, currency='EUR'):
+    """Varsayılan düzende tek bir sentetik sipariş yaz."""
+    osm._write_synthetic_order(Path(path), random.Random(seed), vessel='VESSEL 1', currency=currency,
+                               cost_currency='USD', item_count=item_count)
+    return Path(path)
+
+
+@pytest.fixture
+def corpus(tmp_path):
+    """Üç farklı para birimli sipariş (5, 6, 7 item); yolları döndürür."""
+    inputs = tmp_path / 'in'
+    inputs.mkdir()
+    return [write_order(inputs / f'order_{k}.xlsx', 5 + k, seed=k, currency=cur)
+            for k, cur in enumerate(['EUR', 'USD', 'TRY'])]
@@ -0,0 +1,51 @@
+import os
+
+from conftest import FX_RATES, osm, write_order
+
+
+def _merge(files, out_file, manifest=None):
+    result = osm._merge_pipeline(files, out_file, 0.0, FX_RATES, manifest=manifest)
+    result['orders'].close()
+    if manifest is not None:
+        manifest.save()
+    return result
+
+
+def _cells(path):
+    # Satır 3 (banner bilgi satırı) oluşturma zamanını içerir
+    cells, _ = osm._read_output_cells(path)
+    return {ref: value for ref, value in cells.items() if ref.lstrip('ABCDEFGHIJKL') != '3'}
+
+
+def test_unchanged_inputs_are_not_reparsed_or_rerendered(corpus, tmp_path):
+    _merge(corpus, tmp_path / 'a.xlsx', osm.MergeManifest(tmp_path))
+    manifest = osm.MergeManifest(tmp_path)
+    _merge(corpus, tmp_path / 'b.xlsx', manifest)
+    assert (manifest.reparsed, manifest.reused, manifest.rendered) == (0, 3, 0)
+    assert _cells(tmp_path / 'a.xlsx') == _cells(tmp_path / 'b.xlsx')
+
+
+def test_line_count_change_rerenders_only_that_block(corpus, tmp_path):
+    _merge(corpus, tmp_path / 'a.xlsx', osm.MergeManifest(tmp_path))
+    # İlk dosyaya bir satır eklenir: sonraki blokların satırları kayar ama şablonları geçerli kalır
+    write_order(corpus[0], 6, seed=0, currency='EUR')
+    stat = corpus[0].stat()
+    os.utime(corpus[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    manifest = osm.MergeManifest(tmp_path)
+    result = _merge(corpus, tmp_path / 'inc.xlsx', manifest)
+    assert (manifest.reparsed, manifest.reused, manifest.rendered) == (1, 2, 1)
+    assert result['total_items'] == 6 + 6 + 7
+
+    _merge(corpus, tmp_path / 'full.xlsx')
+    assert _cells(tmp_path / 'inc.xlsx') == _cells(tmp_path / 'full.xlsx')
+    report = osm.validate_merge(tmp_path / 'inc.xlsx', corpus, FX_RATES)
+    assert not report.failures
+
+
+def test_option_change_invalidates_blocks(corpus, tmp_path):
+    _merge(corpus, tmp_path / 'a.xlsx', osm.MergeManifest(tmp_path))
+    manifest = osm.MergeManifest(tmp_path)
+    osm._merge_pipeline(corpus, tmp_path / 'b.xlsx', 0.0, dict(FX_RATES, USD=40.0), manifest=manifest)['orders'].close()
+    assert manifest.reparsed == 0
+    assert manifest.rendered == 3
@@ -0,0 +1,70 @@
+import pytest
+
+from conftest import FX_RATES, osm
+
+
+def _order(k, items=50):
+    return {
+        'file_name': f'order_{k}.xlsx',
+        'header_info': {'currency': 'EUR'},
+        'data_rows': [[i, f'ITEM {k}-{i}', f'C{i}', 2, 'PCS', 1.5, None, None, None, '1 EUR'] for i in range(items)],
+    }
+
+
+def test_spill_round_trip_keeps_order():
+    orders = [_order(k) for k in range(20)]
+    spill = osm.SpillingOrderList(budget_mb=0.01)
+    try:
+        for order_data in orders:
+            spill.append(order_data)
+        assert spill.spilled > 0
+        assert len(spill) == len(orders)
+        # Tekrar tekrar gezilebilir
+        assert list(spill) == orders
+        assert list(spill) == orders
+    finally:
+        spill.close()
+    assert spill._file is None
+
+
+def test_spill_is_closed_when_pipeline_fails(corpus, tmp_path, monkeypatch):
+    created = []
+
+    class RecordingList(osm.SpillingOrderList):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    def parse(path):
+        if path == corpus[-1]:
+            raise RuntimeError('okuma hatası')
+        return osm._safe_extract_orders(path)
+
+    monkeypatch.setattr(osm, 'SpillingOrderList', RecordingList)
+    with pytest.raises(RuntimeError):
+        osm._merge_pipeline(corpus, tmp_path / 'out.xlsx', 0.0, FX_RATES, parse=parse, memory_budget_mb=1e-6)
+    assert len(created) == 1
+    assert created[0].spilled > 0
+    assert created[0]._file is None
+
+
+def test_spill_is_closed_when_pipeline_is_cancelled(corpus, tmp_path, monkeypatch):
+    created = []
+
+    class RecordingList(osm.SpillingOrderList):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            created.append(self)
+
+    cancel = osm.CancelToken()
+
+    def parse(path):
+        if path == corpus[-1]:
+            cancel.cancel()
+        return osm._safe_extract_orders(path)
+
+    monkeypatch.setattr(osm, 'SpillingOrderList', RecordingList)
+    with pytest.raises(osm.MergeCancelled):
+        osm._merge_pipeline(corpus, tmp_path / 'out.xlsx', 0.0, FX_RATES, parse=parse, memory_budget_mb=1e-6,
+                            cancel=cancel)
+    assert created and created[0]._file is None
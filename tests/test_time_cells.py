@@ -0,0 +1,44 @@
+from datetime import datetime, time, timedelta
+
+import pytest
+from openpyxl import load_workbook
+
+from conftest import FX_RATES, osm, write_order
+
+# Varsayılan düzende ilk kalem satırı (1-indexli) ve REMARKS sütunu
+FIRST_DATA_ROW = 23
+REMARKS_COL = 8
+VALUES = [
+    (time(8, 30), 'hh:mm'),
+    (timedelta(hours=30, minutes=15), '[h]:mm:ss'),
+    (datetime(2026, 3, 14, 9, 45), 'dd.mm.yyyy hh:mm'),
+]
+
+
+@pytest.fixture
+def timed_order(tmp_path):
+    path = write_order(tmp_path / 'timed.xlsx', len(VALUES))
+    wb = load_workbook(path)
+    ws = wb.active
+    for i, (value, fmt) in enumerate(VALUES):
+        cell = ws.cell(FIRST_DATA_ROW + i, REMARKS_COL)
+        cell.value = value
+        cell.number_format = fmt
+    wb.save(path)
+    return path
+
+
+@pytest.mark.parametrize('backend', [b for b in osm.READER_BACKENDS.values() if b.available()],
+                         ids=lambda b: b.name)
+def test_time_cells_keep_their_type(timed_order, backend):
+    orders = osm._extract_orders(timed_order, osm._get_layout_plans(), backends=[backend])
+    remarks = [row[7] for row in orders[0]['data_rows']]
+    assert remarks == [value for value, _ in VALUES]
+
+
+def test_time_cells_round_trip_through_output(timed_order, tmp_path):
+    out_file = tmp_path / 'out.xlsx'
+    osm._merge_pipeline([timed_order], out_file, 0.0, FX_RATES)['orders'].close()
+    cells, _ = osm._read_output_cells(out_file)
+    written = [v for v in cells.values() if isinstance(v, (time, timedelta, datetime))]
+    assert written == [value for value, _ in VALUES]